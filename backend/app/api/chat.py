@@ -4,53 +4,75 @@ Chat API Routes with OpenAI Integration
 Handles chat/question answering functionality using OpenAI GPT
 """
 
-from fastapi import APIRouter, HTTPException
-from pydantic import BaseModel
-from typing import List, Optional
-import os
-from openai import OpenAI
+from fastapi import APIRouter, HTTPException, Request
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import StreamingResponse
+from pydantic import BaseModel, Field
+from typing import List, Literal, Optional, Tuple
+import json
+import time
+import asyncio
 
+from app.core.config import settings
+from app.services.answer_cache import AnswerCache
+from app.services.cancellation import ClientDisconnected, cancellation_stats, run_unless_disconnected
 from app.services.document_service import document_service
+from app.services.embedding_service import normalize_query
+from app.services.openai_client import get_async_client
+from app.services.prompt_budget import fit_prompt
+from app.services.session_store import session_store
+from app.services.single_flight import AsyncSingleFlight
+from app.services.streaming import SSE_HEADERS, sse_event, stream_completion
 
 router = APIRouter()
 
-# Initialize OpenAI client
-client = OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
+def _embed_question(question: str):
+    """Question vector for the answer cache (None without embeddings)"""
+    embeddings = document_service.embeddings
+    return embeddings.embed_query(question) if embeddings is not None else None
 
-class ChatRequest(BaseModel):
+# Answers to questions asked before (cleared whenever the documents change)
+answer_cache = AnswerCache(
+    max_size=settings.ANSWER_CACHE_SIZE,
+    ttl_seconds=settings.ANSWER_CACHE_TTL_SECONDS,
+    similarity_threshold=settings.ANSWER_CACHE_SIMILARITY,
+    embed=_embed_question
+)
+
+# Identical chat requests in flight at the same time (see single_flight.py)
+chat_flight = AsyncSingleFlight()
+
+class SearchOptions(BaseModel):
+    """How to search the manuals (shared by single and batch requests)"""
+    # Retrieval mode (defaults to RETRIEVAL_MODE in settings)
+    retrieval_mode: Optional[Literal["vector", "lexical", "hybrid"]] = None
+    # Only search these documents / pages (all optional)
+    document_ids: Optional[List[str]] = None
+    filenames: Optional[List[str]] = None
+    page_from: Optional[int] = None
+    page_to: Optional[int] = None
+    # Skip near-duplicate chunks (defaults to RETRIEVAL_DIVERSIFY in settings)
+    diversify: Optional[bool] = None
+
+class ChatRequest(SearchOptions):
     """Request model for chat"""
     message: str
+    # Continue this conversation (the server remembers earlier turns - see session_store.py)
+    session_id: Optional[str] = Field(None, max_length=128)
+
+class BatchChatRequest(SearchOptions):
+    """Request model for many questions at once"""
+    questions: List[str]
+    # GPT calls in flight at once (capped by BATCH_CONCURRENCY in settings)
+    concurrency: Optional[int] = None
 
 class ChatResponse(BaseModel):
     """Response model for chat"""
     response: str
     sources: Optional[List[str]] = []
+    session_id: Optional[str] = None
 
-@router.post("/chat", response_model=ChatResponse)
-def chat(request: ChatRequest):
-    """
-    Chat endpoint - Ask questions about uploaded documents using OpenAI
-    
-    This searches your documents and uses GPT to generate intelligent answers
-    """
-    
-    if not request.message or not request.message.strip():
-        raise HTTPException(status_code=400, detail="Message cannot be empty")
-    
-    try:
-        # Search for relevant document chunks
-        relevant_docs = document_service.search_documents(request.message, top_k=3)
-        
-        # Build context from documents
-        if relevant_docs:
-            context = "\n\n".join([f"Document Section {i+1}:\n{doc}" for i, doc in enumerate(relevant_docs)])
-            sources = [f"Manual section {i+1}" for i in range(len(relevant_docs))]
-        else:
-            context = "No relevant information found in uploaded manuals."
-            sources = []
-        
-        # Create the prompt for OpenAI - OPTIMIZED FOR SHORT ANSWERS
-        system_prompt = """You are an expert automotive assistant specializing in vehicle manuals.
+SYSTEM_PROMPT = """You are an expert automotive assistant specializing in vehicle manuals.
 
 IMPORTANT RESPONSE RULES:
 1. Keep answers SHORT and CONCISE (2-4 sentences max)
@@ -64,28 +86,159 @@ Format your answers like this:
 - For procedures: Use numbered steps (keep each step to one line)
 - For specifications: Give the exact number/value first, then brief context if needed"""
 
-        user_prompt = f"""Question: {request.message}
+USER_PROMPT = """Question: {question}
 
 Manual Information:
 {context}
 
 Give a SHORT, CONCISE answer. Maximum 3-4 sentences or use bullet points/numbered steps."""
 
-        # Call OpenAI API
-        response = client.chat.completions.create(
-            model="gpt-4o-mini",
-            messages=[
-                {"role": "system", "content": system_prompt},
-                {"role": "user", "content": user_prompt}
-            ],
-            temperature=0.5,  # Lower temperature for more focused answers
-            max_tokens=200    # Limit token count for shorter responses
+# Model settings for manual answers - OPTIMIZED FOR SHORT ANSWERS
+COMPLETION_PARAMS = {
+    "model": "gpt-4o-mini",
+    "temperature": 0.5,  # Lower temperature for more focused answers
+    "max_tokens": 200    # Limit token count for shorter responses
+}
+
+def _cache_variant(request: SearchOptions, search_filter) -> str:
+    """Answer cache key part for the search options (same question, different scope = different answer)"""
+    variant = request.retrieval_mode or settings.RETRIEVAL_MODE
+    if _diversify(request):
+        variant += "|mmr"
+    if search_filter is not None:
+        variant += "|" + search_filter.cache_key()
+    return variant
+
+def _search_scope(request: SearchOptions):
+    """The request's search filter and the current corpus version (database lookups - run on a worker thread)"""
+    search_filter = document_service.build_filter(
+        doc_ids=request.document_ids,
+        filenames=request.filenames,
+        page_from=request.page_from,
+        page_to=request.page_to
+    )
+    return search_filter, document_service.corpus_version()
+
+def _diversify(request: SearchOptions) -> bool:
+    return settings.RETRIEVAL_DIVERSIFY if request.diversify is None else request.diversify
+
+def _build_messages(
+    question: str,
+    relevant_docs: List[str],
+    history: Optional[List[dict]] = None
+) -> Tuple[List[dict], List[str]]:
+    """The GPT messages for a question, its document chunks and the conversation so far, plus the sources to show"""
+    # Keep the best chunks (whole chunks only) and latest turns that fit the token budget
+    fit = fit_prompt(
+        COMPLETION_PARAMS["model"],
+        fixed=[SYSTEM_PROMPT, USER_PROMPT.format(question=question, context="")],
+        chunks=relevant_docs,
+        history=history,
+        max_tokens=COMPLETION_PARAMS["max_tokens"]
+    )
+    relevant_docs = fit["chunks"]
+    
+    # Build context from documents
+    if relevant_docs:
+        context = "\n\n".join([f"Document Section {i+1}:\n{doc}" for i, doc in enumerate(relevant_docs)])
+        sources = [f"Manual section {i+1}" for i in range(len(relevant_docs))]
+    else:
+        context = "No relevant information found in uploaded manuals."
+        sources = []
+    
+    user_prompt = USER_PROMPT.format(question=question, context=context)
+    
+    messages = [
+        {"role": "system", "content": SYSTEM_PROMPT},
+        *fit["history"],
+        {"role": "user", "content": user_prompt}
+    ]
+    return messages, sources
+
+async def _remember(session_id: Optional[str], question: str, answer: str):
+    """Add a turn to the conversation (and summarize old turns in the background if it's getting long)"""
+    if not session_id:
+        return
+    await run_in_threadpool(session_store.append, session_id, question, answer)
+    session_store.schedule_compaction(session_id)
+
+async def _complete(messages: List[dict]) -> str:
+    """Call OpenAI (shared async client) and return the answer text"""
+    response = await get_async_client().chat.completions.create(messages=messages, **COMPLETION_PARAMS)
+    return response.choices[0].message.content
+
+@router.post("/chat", response_model=ChatResponse)
+async def chat(request: ChatRequest, http_request: Request):
+    """
+    Chat endpoint - Ask questions about uploaded documents using OpenAI
+    
+    This searches your documents and uses GPT to generate intelligent answers.
+    If the client disconnects first, the search / GPT call is cancelled.
+    """
+    
+    if not request.message or not request.message.strip():
+        raise HTTPException(status_code=400, detail="Message cannot be empty")
+    
+    search_filter, corpus_version = await run_in_threadpool(_search_scope, request)
+    
+    history = await run_in_threadpool(session_store.get_history, request.session_id) if request.session_id else []
+    
+    # Same question, same documents → same answer, no search or GPT call needed
+    # (not for follow-up questions - "and the rear ones?" depends on what came before)
+    variant = _cache_variant(request, search_filter)
+    if not history:
+        cached = await run_in_threadpool(answer_cache.get, request.message, corpus_version, variant)
+        if cached is not None:
+            await _remember(request.session_id, request.message, cached["response"])
+            return ChatResponse(response=cached["response"], sources=cached["sources"], session_id=request.session_id)
+    
+    started = time.perf_counter()
+    progress = {"stage": "retrieval"}
+    
+    async def generate() -> Tuple[str, List[str]]:
+        # Search for relevant document chunks (on a worker thread - it's CPU work)
+        relevant_docs = await run_in_threadpool(
+            document_service.search_documents,
+            request.message,
+            top_k=3,
+            mode=request.retrieval_mode,
+            search_filter=search_filter,
+            diversify=_diversify(request)
         )
         
-        # Extract the response
-        ai_response = response.choices[0].message.content
+        messages, sources = _build_messages(request.message, relevant_docs, history)
+        progress["stage"] = "generation"
+        ai_response = await _complete(messages)
         
-        return ChatResponse(response=ai_response, sources=sources)
+        if not history:
+            await run_in_threadpool(answer_cache.put, request.message, corpus_version, {
+                "response": ai_response,
+                "sources": sources,
+                "latency_seconds": time.perf_counter() - started
+            }, variant)
+        return ai_response, sources
+    
+    # Identical questions asked at the same moment (a burst before the first
+    # answer is cached) share one search and one GPT call
+    flight_key = (normalize_query(request.message), corpus_version, variant)
+    
+    async def answer() -> ChatResponse:
+        if history:
+            ai_response, sources = await generate()
+        else:
+            ai_response, sources = await chat_flight.do(flight_key, generate)
+        await _remember(request.session_id, request.message, ai_response)
+        return ChatResponse(response=ai_response, sources=sources, session_id=request.session_id)
+    
+    try:
+        return await run_unless_disconnected(http_request, answer())
+    
+    except ClientDisconnected:
+        # Nobody will read the answer - the status code is just for the logs.
+        # Nothing is saved if other requests are still waiting for the same answer.
+        shared = not history and chat_flight.in_flight(flight_key)
+        cancellation_stats.record(progress["stage"], tokens_saved=0 if shared else COMPLETION_PARAMS["max_tokens"])
+        raise HTTPException(status_code=499, detail="Client closed request")
         
     except Exception as e:
         # Log the error
@@ -95,12 +248,207 @@ Give a SHORT, CONCISE answer. Maximum 3-4 sentences or use bullet points/numbere
             detail=f"Failed to generate response: {str(e)}"
         )
 
+@router.post("/chat/stream")
+async def chat_stream(request: ChatRequest):
+    """
+    Streaming chat endpoint - the answer arrives word by word (Server-Sent Events)
+    
+    Events, in order (see streaming.py):
+    - sources: the manual sections used, sent as soon as the search is done
+    - delta: pieces of the answer as GPT writes them
+    - done: token usage and timings (retrieval, first token, total)
+    - error: instead of the rest, if something goes wrong
+    
+    Closing the connection cancels the search / GPT stream.
+    """
+    if not request.message or not request.message.strip():
+        raise HTTPException(status_code=400, detail="Message cannot be empty")
+    
+    search_filter, corpus_version = await run_in_threadpool(_search_scope, request)
+    variant = _cache_variant(request, search_filter)
+    
+    async def events():
+        started = time.perf_counter()
+        
+        def elapsed_ms() -> float:
+            return round((time.perf_counter() - started) * 1000, 1)
+        
+        try:
+            history = await run_in_threadpool(session_store.get_history, request.session_id) if request.session_id else []
+            cached = None
+            if not history:
+                cached = await run_in_threadpool(answer_cache.get, request.message, corpus_version, variant)
+            if cached is not None:
+                yield sse_event("sources", {"sources": cached["sources"], "cached": True})
+                yield sse_event("delta", {"content": cached["response"]})
+                await _remember(request.session_id, request.message, cached["response"])
+                yield sse_event("done", {
+                    "usage": None,
+                    "timings": {"total_ms": elapsed_ms()},
+                    "cached": True,
+                    "session_id": request.session_id
+                })
+                return
+            
+            try:
+                relevant_docs = await run_in_threadpool(
+                    document_service.search_documents,
+                    request.message,
+                    top_k=3,
+                    mode=request.retrieval_mode,
+                    search_filter=search_filter,
+                    diversify=_diversify(request)
+                )
+            except asyncio.CancelledError:
+                # Client left during the search (once GPT is streaming, stream_completion counts it)
+                cancellation_stats.record("retrieval", tokens_saved=COMPLETION_PARAMS["max_tokens"])
+                raise
+            messages, sources = _build_messages(request.message, relevant_docs, history)
+            retrieval_ms = elapsed_ms()
+            yield sse_event("sources", {"sources": sources, "cached": False})
+            
+            usage = {}
+            pieces = []
+            first_token_ms = None
+            async for piece in stream_completion(messages, usage=usage, **COMPLETION_PARAMS):
+                if first_token_ms is None:
+                    first_token_ms = elapsed_ms()
+                pieces.append(piece)
+                yield sse_event("delta", {"content": piece})
+            
+            timings = {"retrieval_ms": retrieval_ms, "first_token_ms": first_token_ms, "total_ms": elapsed_ms()}
+            if not history:
+                await run_in_threadpool(answer_cache.put, request.message, corpus_version, {
+                    "response": "".join(pieces),
+                    "sources": sources,
+                    "latency_seconds": timings["total_ms"] / 1000
+                }, variant)
+            await _remember(request.session_id, request.message, "".join(pieces))
+            yield sse_event("done", {"usage": usage, "timings": timings, "cached": False, "session_id": request.session_id})
+        
+        except Exception as e:
+            print(f"Error in chat stream: {str(e)}")
+            yield sse_event("error", {"detail": f"Failed to generate response: {str(e)}"})
+    
+    return StreamingResponse(events(), media_type="text/event-stream", headers=SSE_HEADERS)
+
+@router.post("/chat/batch")
+async def chat_batch(request: BatchChatRequest):
+    """
+    Answer many questions in one request
+    
+    All questions are searched together (one batched embedding call, one
+    FAISS search), then GPT is asked about them with up to `concurrency`
+    calls in flight. Answers stream back as NDJSON - one JSON object per
+    line, in the order they finish:
+    
+        {"index": 3, "question": "...", "response": "...", "sources": [...], "cached": false}
+        {"index": 0, "question": "...", "error": "..."}
+    
+    Closing the connection cancels the GPT calls not yet finished.
+    """
+    questions = request.questions
+    if not questions:
+        raise HTTPException(status_code=400, detail="No questions given")
+    if len(questions) > settings.BATCH_MAX_QUESTIONS:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Too many questions ({len(questions)}); the limit is {settings.BATCH_MAX_QUESTIONS}"
+        )
+    
+    search_filter, corpus_version = await run_in_threadpool(_search_scope, request)
+    variant = _cache_variant(request, search_filter)
+    concurrency = max(1, min(request.concurrency or settings.BATCH_CONCURRENCY, settings.BATCH_CONCURRENCY))
+    
+    def line(index: int, **fields) -> str:
+        return json.dumps({"index": index, "question": questions[index], **fields}) + "\n"
+    
+    async def answer(index: int, relevant_docs: List[str], limit: asyncio.Semaphore) -> str:
+        async with limit:
+            started = time.perf_counter()
+            messages, sources = _build_messages(questions[index], relevant_docs)
+            try:
+                ai_response = await _complete(messages)
+            except Exception as e:
+                return line(index, error=f"Failed to generate response: {str(e)}")
+            await run_in_threadpool(answer_cache.put, questions[index], corpus_version, {
+                "response": ai_response,
+                "sources": sources,
+                "latency_seconds": time.perf_counter() - started
+            }, variant)
+            return line(index, response=ai_response, sources=sources, cached=False)
+    
+    async def stream():
+        # Cached answers go out straight away
+        pending = []
+        for index, question in enumerate(questions):
+            if not question or not question.strip():
+                yield line(index, error="Message cannot be empty")
+                continue
+            cached = await run_in_threadpool(answer_cache.get, question, corpus_version, variant)
+            if cached is not None:
+                yield line(index, response=cached["response"], sources=cached["sources"], cached=True)
+            else:
+                pending.append(index)
+        if not pending:
+            return
+        
+        try:
+            results = await run_in_threadpool(
+                document_service.retrieve_many,
+                [questions[index] for index in pending],
+                top_k=3,
+                mode=request.retrieval_mode,
+                search_filter=search_filter,
+                diversify=_diversify(request)
+            )
+        except Exception as e:
+            for index in pending:
+                yield line(index, error=f"Failed to search documents: {str(e)}")
+            return
+        except asyncio.CancelledError:
+            # Client left during the search - no GPT calls made
+            cancellation_stats.record("retrieval", tokens_saved=len(pending) * COMPLETION_PARAMS["max_tokens"])
+            raise
+        
+        limit = asyncio.Semaphore(concurrency)
+        tasks = [
+            asyncio.ensure_future(answer(index, [record["text"] for record in records], limit))
+            for index, records in zip(pending, results)
+        ]
+        try:
+            for finished in asyncio.as_completed(tasks):
+                yield await finished
+        except (asyncio.CancelledError, GeneratorExit):
+            # Client went away - don't keep paying for answers nobody reads
+            unfinished = sum(1 for task in tasks if not task.done())
+            cancellation_stats.record("generation", tokens_saved=unfinished * COMPLETION_PARAMS["max_tokens"])
+            raise
+        finally:
+            for task in tasks:
+                task.cancel()
+    
+    return StreamingResponse(stream(), media_type="application/x-ndjson")
+
 @router.get("/chat/history")
-def get_chat_history():
+def get_chat_history(session_id: Optional[str] = None):
     """
-    Get chat history (if implemented)
+    Get chat history of a conversation
     
-    For beginners: This would return previous conversations
-    Currently returns empty list
+    For beginners: pass the session_id you chat with and you get its
+    recent turns back, plus a summary of the older ones (long
+    conversations are summarized to keep prompts small)
     """
-    return {"history": []}
\ No newline at end of file
+    if not session_id:
+        return {"history": []}
+    session = session_store.get_session(session_id)
+    if session is None:
+        raise HTTPException(status_code=404, detail=f"Session {session_id} not found")
+    return session
+
+@router.delete("/chat/history/{session_id}")
+def delete_chat_history(session_id: str):
+    """Forget a conversation"""
+    if not session_store.clear(session_id):
+        raise HTTPException(status_code=404, detail=f"Session {session_id} not found")
+    return {"success": True, "session_id": session_id}
\ No newline at end of file
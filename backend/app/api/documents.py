@@ -5,34 +5,52 @@ Handles file uploads and document management
 """
 
 from fastapi import APIRouter, UploadFile, File, HTTPException
-from typing import List
+from fastapi.concurrency import run_in_threadpool
+from typing import Dict, List, Optional
 import os
-import shutil
 from pydantic import BaseModel
 
+from app.services.content_cache import copy_and_hash
 from app.services.document_service import document_service
+from app.services.ingestion_service import ingestion_service, IngestionQueueFull
 
 router = APIRouter()
 
-class DocumentUploadResponse(BaseModel):
-    """Response model for document upload"""
+class IngestionJobResponse(BaseModel):
+    """Response model for an accepted upload (processing continues in the background)"""
+    job_id: str
     doc_id: str
     filename: str
-    pages: int = None
-    chunks: int = 0
-    total_chars: int
+    status: str
+    status_url: str
+
+class JobStatusResponse(BaseModel):
+    """Response model for ingestion job progress"""
+    job_id: str
+    doc_id: str
+    filename: str
+    status: str
+    stages: Dict[str, dict]
+    result: Optional[dict] = None
+    error: Optional[str] = None
+    created_at: float
+    started_at: Optional[float] = None
+    finished_at: Optional[float] = None
 
 class DocumentListResponse(BaseModel):
     """Response model for document list"""
     documents: List[str]
 
-@router.post("/documents/upload", response_model=DocumentUploadResponse)
+@router.post("/documents/upload", response_model=IngestionJobResponse, status_code=202)
 async def upload_document(file: UploadFile = File(...)):
     """
     Upload a document (PDF, DOCX, or TXT)
     
-    For beginners: This receives the file from the frontend,
-    saves it, and processes it for searching.
+    For beginners: This receives the file from the frontend and saves it.
+    The slow part (reading, chunking and embedding the text) happens in
+    the background, so you get a job ID back right away. Check on it with
+    GET /api/documents/jobs/{job_id}. Uploading a file we've already seen
+    finishes instantly.
     """
     
     # Check file extension
@@ -45,20 +63,33 @@ async def upload_document(file: UploadFile = File(...)):
             detail=f"Unsupported file type: {file_ext}. Please upload PDF, DOCX, or TXT files."
         )
     
+    # A path of this job's own, so same-name uploads never clash
+    job_id, upload_path = ingestion_service.new_upload_path(filename)
+    
     try:
-        # Save uploaded file temporarily
-        upload_path = os.path.join(document_service.upload_dir, filename)
+        # Save uploaded file (in a thread, so big files don't block other
+        # requests) and fingerprint it on the way so duplicates are free
+        content_hash = await run_in_threadpool(copy_and_hash, file.file, upload_path)
         
-        with open(upload_path, "wb") as buffer:
-            shutil.copyfileobj(file.file, buffer)
-        
-        # Process the document
-        result = document_service.process_document(upload_path, filename)
+        # Hand the slow processing to the background workers
+        job = await run_in_threadpool(
+            ingestion_service.submit, upload_path, filename, content_hash, job_id=job_id
+        )
         
-        return DocumentUploadResponse(**result)
+        return IngestionJobResponse(
+            job_id=job.id,
+            doc_id=job.doc_id,
+            filename=filename,
+            status=job.status,
+            status_url=f"/api/documents/jobs/{job.id}"
+        )
         
+    except IngestionQueueFull as e:
+        if os.path.exists(upload_path):
+            os.remove(upload_path)
+        raise HTTPException(status_code=503, detail=f"Server is busy: {str(e)}. Please retry shortly.")
     except Exception as e:
-        # Clean up file if processing failed
+        # Clean up file if saving failed
         if os.path.exists(upload_path):
             os.remove(upload_path)
         
@@ -67,6 +98,23 @@ async def upload_document(file: UploadFile = File(...)):
             detail=f"Failed to process document: {str(e)}"
         )
 
+@router.get("/documents/jobs/{job_id}", response_model=JobStatusResponse)
+async def get_job_status(job_id: str):
+    """
+    Check how an upload is coming along
+    
+    For beginners: Shows which stage the document is in (extracting,
+    chunking, embedding, indexing), how far along each stage is, and the
+    final result (chunks, characters) once it is completed.
+    """
+    # The job may run in another server worker - its status is read from disk then
+    job = await run_in_threadpool(ingestion_service.get_job_status, job_id)
+    
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    
+    return JobStatusResponse(**job)
+
 @router.get("/documents/list", response_model=DocumentListResponse)
 async def list_documents():
     """
@@ -75,7 +123,7 @@ async def list_documents():
     For beginners: Returns the names of all files that have been uploaded
     """
     try:
-        documents = document_service.get_all_documents()
+        documents = await run_in_threadpool(document_service.get_all_documents)
         return DocumentListResponse(documents=documents)
     except Exception as e:
         raise HTTPException(
@@ -88,17 +136,48 @@ async def delete_document(filename: str):
     """
     Delete a specific document
     
-    For beginners: Removes a file from the uploads folder
+    For beginners: Removes the file from the uploads folder AND from
+    search - its chunks stop showing up in answers right away. (The
+    search index frees the space in the background later.) Every
+    document uploaded under this filename is deleted.
     """
     try:
-        file_path = os.path.join(document_service.upload_dir, filename)
+        documents = await run_in_threadpool(document_service.metadata_store.find_by_filename, filename)
         
-        if not os.path.exists(file_path):
+        if not documents:
             raise HTTPException(status_code=404, detail="Document not found")
         
-        os.remove(file_path)
+        for document in documents:
+            await run_in_threadpool(document_service.delete_document, document["id"])
+        
+        return {
+            "message": f"Document {filename} deleted successfully",
+            "doc_ids": [document["id"] for document in documents]
+        }
         
-        return {"message": f"Document {filename} deleted successfully"}
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(
+            status_code=500,
+            detail=f"Failed to delete document: {str(e)}"
+        )
+
+@router.delete("/documents/id/{doc_id}")
+async def delete_document_by_id(doc_id: str):
+    """
+    Delete a document by its ID (as returned by the upload)
+    
+    For beginners: Useful when the same filename was uploaded with
+    different contents and you only want to remove one of them.
+    """
+    try:
+        deleted = await run_in_threadpool(document_service.delete_document, doc_id)
+        
+        if not deleted:
+            raise HTTPException(status_code=404, detail="Document not found")
+        
+        return {"message": f"Document {doc_id} deleted successfully", "doc_ids": [doc_id]}
         
     except HTTPException:
         raise
@@ -106,4 +185,4 @@ async def delete_document(filename: str):
         raise HTTPException(
             status_code=500,
             detail=f"Failed to delete document: {str(e)}"
-        )
\ No newline at end of file
+        )
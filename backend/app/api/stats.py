@@ -0,0 +1,35 @@
+"""
+Stats API Routes
+================
+Numbers for monitoring: how big the indexes are and how well the
+caches are doing (hits, misses, hit rate)
+"""
+
+from fastapi import APIRouter
+
+from app.api.chat import answer_cache, chat_flight
+from app.services.cancellation import cancellation_stats
+from app.services.document_service import document_service
+from app.services.session_store import session_store
+
+router = APIRouter()
+
+@router.get("/stats")
+def get_stats():
+    """
+    Index sizes and cache counters
+    
+    For beginners: a high query_cache hit_rate means many questions were
+    answered without calling the embeddings API again, and answer_cache
+    saved_seconds is roughly how long users didn't have to wait for GPT.
+    cancellations counts answers abandoned by their user (and the GPT
+    tokens not paid for because of it), sessions the conversations kept
+    on the server, and chat_single_flight shared how many requests got
+    the answer of an identical request that was already running
+    """
+    stats = document_service.get_stats()
+    stats["answer_cache"] = answer_cache.stats()
+    stats["cancellations"] = cancellation_stats.stats()
+    stats["sessions"] = session_store.stats()
+    stats["chat_single_flight"] = chat_flight.stats()
+    return stats
@@ -31,12 +31,86 @@ class Settings(BaseSettings):
     
     # OpenAI Model settings
     MODEL_NAME: str = "gpt-4"  # or "gpt-3.5-turbo" for cheaper option
-    EMBEDDING_MODEL: str = "text-embedding-ada-002"
+    EMBEDDING_MODEL: str = "text-embedding-ada-002"  # or "local-hash" for offline NumPy embeddings
+    LOCAL_EMBEDDING_DIM: int = 512  # Vector size of the local-hash embeddings
+    
+    # OpenAI connection settings (one shared async client for all chat calls)
+    OPENAI_MAX_CONNECTIONS: int = 200  # Chat completions in flight at once per worker
+    OPENAI_MAX_KEEPALIVE_CONNECTIONS: int = 50  # Idle connections kept open for reuse
+    OPENAI_KEEPALIVE_SECONDS: float = 30.0  # Close idle connections after this long
+    OPENAI_CONNECT_TIMEOUT_SECONDS: float = 5.0  # Give up connecting after this long
+    OPENAI_TIMEOUT_SECONDS: float = 60.0  # Give up on a completion after this long
+    OPENAI_MAX_RETRIES: int = 2  # Retries on connection errors / rate limits
+    
+    # Prompt size settings (see prompt_budget.py)
+    PROMPT_MAX_INPUT_TOKENS: int = 6000  # Most tokens sent to GPT per question (also capped by the model's window)
+    PROMPT_HISTORY_SHARE: float = 0.3  # Part of the budget kept for conversation history when it needs it
+    
+    # Conversation session settings (see session_store.py)
+    SESSION_MAX_BYTES: int = 64 * 1024 * 1024  # Memory for all sessions together (least recently used dropped first)
+    SESSION_IDLE_SECONDS: int = 3600  # Drop a session from memory after this long unused
+    SESSION_COMPACT_TOKENS: int = 2000  # Summarize older turns once a session is this long
+    SESSION_KEEP_TURNS: int = 6  # Latest messages kept word for word when summarizing
+    SESSION_SUMMARY_TOKENS: int = 300  # Length of the rolling summary
+    SESSION_STORE_PERSIST: bool = False  # Also save sessions in SQLite (survive restarts)
+    SESSION_PERSIST_TTL_SECONDS: int = 7 * 24 * 3600  # Delete saved sessions unused for this long
     
     # File upload settings
     MAX_FILE_SIZE: int = 10 * 1024 * 1024  # 10MB
     ALLOWED_EXTENSIONS: list = [".pdf", ".docx", ".txt", ".doc"]
     
+    # Background ingestion settings
+    INGEST_PROCESS_WORKERS: int = 2  # Processes for text extraction (CPU heavy)
+    INGEST_THREAD_WORKERS: int = 4  # Threads running jobs (mostly waiting on embeddings)
+    INGEST_MAX_PENDING_JOBS: int = 32  # Reject new uploads beyond this many queued/running jobs
+    INGEST_JOB_TTL_SECONDS: int = 3600  # How long finished jobs stay visible to the status endpoint
+    PDF_PAGES_PER_TASK: int = 16  # Pages each extraction worker handles at a time
+    PDF_PARALLEL_MIN_PAGES: int = 32  # Smaller PDFs are read serially (not worth the overhead)
+    
+    # Embedding pipeline settings
+    EMBEDDING_BATCH_TOKENS: int = 50000  # Max tokens per embeddings request
+    EMBEDDING_CONCURRENCY: int = 4  # Embeddings requests in flight at once
+    EMBEDDING_REQUESTS_PER_MINUTE: int = 3000  # Stay under your OpenAI rate limits
+    EMBEDDING_TOKENS_PER_MINUTE: int = 1000000
+    EMBEDDING_MAX_RETRIES: int = 5  # Retries (with backoff) for rate limits and network errors
+    QUERY_CACHE_SIZE: int = 2048  # Question embeddings kept in memory (0 disables)
+    QUERY_CACHE_TTL_SECONDS: int = 86400  # Re-embed a cached question after this long
+    QUERY_CACHE_PERSIST: bool = True  # Also keep question embeddings on disk across restarts
+    QUERY_CACHE_PERSIST_SIZE: int = 100000  # Most question embeddings kept on disk (oldest dropped first)
+    
+    # Retrieval settings
+    RETRIEVAL_MODE: str = "hybrid"  # "vector", "lexical" (BM25) or "hybrid" (both, rank-fused)
+    HYBRID_CANDIDATES: int = 20  # Chunks each leg of a hybrid search contributes to fusion
+    RRF_K: int = 60  # Reciprocal rank fusion constant (higher = flatter)
+    SEARCH_THREAD_WORKERS: int = 8  # Threads running vector searches in parallel with keyword search
+    RETRIEVAL_DIVERSIFY: bool = False  # Drop near-duplicate (overlapping) chunks with MMR by default
+    MMR_CANDIDATES: int = 20  # Chunks fetched for MMR to choose from
+    MMR_LAMBDA: float = 0.5  # MMR trade-off: 1 = relevance only, 0 = variety only
+    
+    # Batch chat settings (POST /api/chat/batch)
+    BATCH_MAX_QUESTIONS: int = 500  # Questions accepted in one batch request
+    BATCH_CONCURRENCY: int = 8  # GPT calls in flight at once per batch
+    
+    # Answer cache settings
+    ANSWER_CACHE_SIZE: int = 1024  # Chat answers remembered (0 disables)
+    ANSWER_CACHE_TTL_SECONDS: int = 3600  # Ask GPT again after this long
+    ANSWER_CACHE_SIMILARITY: float = 0.0  # Reuse answers for questions this similar (e.g. 0.95; 0 = exact only)
+    
+    # Vector store settings
+    VECTOR_STORE_MERGE_SEGMENTS: int = 8  # Merge index segments in the background past this many
+    VECTOR_INDEX_TYPE: str = "hnsw"  # Index to promote to: "flat" (exact, never promote), "ivf" or "hnsw"
+    VECTOR_INDEX_PROMOTE_AT: int = 20000  # Stay on the exact flat index below this many chunks
+    VECTOR_IVF_NPROBE: int = 16  # IVF clusters scanned per search (higher = better recall, slower)
+    VECTOR_HNSW_M: int = 32  # HNSW links per chunk
+    VECTOR_HNSW_EF_CONSTRUCTION: int = 200  # HNSW build quality
+    VECTOR_HNSW_EF_SEARCH: int = 64  # HNSW search depth (higher = better recall, slower)
+    VECTOR_QUANTIZATION: str = "none"  # Promoted index stores vectors as "none" (float32), "fp16", "int8" or "pq"
+    VECTOR_PQ_M: int = 64  # Bytes per vector with "pq"
+    VECTOR_RERANK_FACTOR: int = 4  # Quantized search: re-rank this many candidates per result with exact vectors
+    VECTOR_DELTA_MAX: int = 20000  # Save new vectors into the memory-mapped index file once this many are held in memory
+    VECTOR_STORE_COMPACT_RATIO: float = 0.2  # Compact the index once this share of chunks is deleted
+    LEXICAL_COMPACT_RATIO: float = 0.2  # Write a new keyword index snapshot once this share of chunks is deleted
+    
     class Config:
         env_file = ".env"
         case_sensitive = False
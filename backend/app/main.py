@@ -7,6 +7,7 @@ from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.staticfiles import StaticFiles
 import os
+import threading
 from dotenv import load_dotenv
 
 # Load environment variables from .env file
@@ -14,6 +15,9 @@ load_dotenv()
 
 # Import routes
 from app.routes import chat, documents
+from app.services.document_service import document_service
+from app.services.ingestion_service import ingestion_service
+from app.services.openai_client import close_clients
 
 # Create FastAPI app
 app = FastAPI(
@@ -74,6 +78,14 @@ async def startup_event():
     print("🚀 AutoQuery Backend is starting...")
     print("📝 API Documentation available at: http://localhost:8000/docs")
     
+    # Open the document indexes now (not on import, so extraction
+    # worker processes never open them), then clean up ingests a crash
+    # cut off - in the background, as that waits for the keyword index
+    document_service.get()
+    threading.Thread(
+        target=document_service.recover_interrupted_ingests, name="ingest-recovery", daemon=True
+    ).start()
+    
     # Check if OpenAI API key is set
     if not os.getenv("OPENAI_API_KEY"):
         print("⚠️  WARNING: OPENAI_API_KEY not found in environment variables!")
@@ -88,6 +100,8 @@ async def shutdown_event():
     This runs when the server shuts down
     """
     print("👋 AutoQuery Backend is shutting down...")
+    ingestion_service.shutdown()
+    await close_clients()
 
 if __name__ == "__main__":
     import uvicorn
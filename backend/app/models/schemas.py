@@ -24,6 +24,8 @@ class ChatRequest(BaseModel):
     message: str = Field(..., description="User's question/message")
     session_id: Optional[str] = Field(None, description="Session ID for conversation history")
     use_documents: bool = Field(True, description="Whether to search uploaded documents")
+    document_id: Optional[str] = Field(None, description="Only search this document")
+    conversation_history: Optional[List[ChatMessage]] = Field(None, description="Previous messages")
     
     class Config:
         json_schema_extra = {
@@ -3,20 +3,28 @@ Chat Routes - API endpoints for chat functionality
 These are the URLs the frontend calls to chat with the AI
 """
 
-from fastapi import APIRouter, HTTPException
+import asyncio
+import time
+from fastapi import APIRouter, HTTPException, Request
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import StreamingResponse
 from app.models.schemas import ChatRequest, ChatResponse, ErrorResponse
-from app.services.chat_service import chat_service
+from app.services.cancellation import ClientDisconnected, cancellation_stats, run_unless_disconnected
+from app.services.chat_service import ErrorReply, chat_service
 from app.services.document_service import document_service
+from app.services.session_store import session_store
+from app.services.streaming import SSE_HEADERS, sse_event
 
 # Create router for chat endpoints
 router = APIRouter()
 
 @router.post("/", response_model=ChatResponse)
-async def chat(request: ChatRequest):
+async def chat(request: ChatRequest, http_request: Request):
     """
     Main chat endpoint
     
     Send a message and get an AI response!
+    If the user leaves before it's ready, the search / AI call is cancelled.
     
     Args:
         request: ChatRequest containing user message and optional context
@@ -24,47 +32,70 @@ async def chat(request: ChatRequest):
     Returns:
         ChatResponse with AI's answer
     """
+    stage = "retrieval"
     try:
-        # Get document context if document_id is provided
+        # Get document context: the most relevant chunks, searched only
+        # inside the chosen document if document_id is provided
         context = None
-        if request.document_id:
-            # Fetch the document text
-            context = document_service.get_document_text(request.document_id)
+        sources = []
+        if request.use_documents:
+            search_filter = None
+            if request.document_id:
+                if await run_in_threadpool(document_service.get_document, request.document_id) is None:
+                    raise HTTPException(
+                        status_code=404,
+                        detail=f"Document with ID {request.document_id} not found"
+                    )
+                search_filter = await run_in_threadpool(document_service.build_filter, doc_ids=[request.document_id])
             
-            if not context:
-                raise HTTPException(
-                    status_code=404,
-                    detail=f"Document with ID {request.document_id} not found"
-                )
-            
-            print(f"📄 Using document context ({len(context)} characters)")
+            records = await run_unless_disconnected(http_request, run_in_threadpool(
+                document_service.retrieve, request.message, top_k=5, search_filter=search_filter
+            ))
+            if records:
+                # Best match first - the chat service keeps as many as fit the token budget
+                context = [record["text"] for record in records]
+                sources = list(dict.fromkeys(record["metadata"].get("source", "") for record in records))
+                print(f"📄 Found {len(records)} document sections")
         
         # Convert conversation history to the format OpenAI expects
+        # (or use the one the server remembers for this session)
         history = []
         if request.conversation_history:
             history = [
                 {"role": msg.role, "content": msg.content}
                 for msg in request.conversation_history
             ]
+        elif request.session_id:
+            history = await run_in_threadpool(session_store.get_history, request.session_id)
         
         # Get AI response
         print(f"💬 User: {request.message}")
         
-        response_text = await chat_service.get_chat_response(
+        stage = "generation"
+        response_text = await run_unless_disconnected(http_request, chat_service.get_chat_response(
             message=request.message,
             conversation_history=history,
             context=context
-        )
+        ))
         
         print(f"🤖 AI: {response_text[:100]}...")
         
+        # (an error message isn't an answer - don't make it part of the conversation)
+        if request.session_id and not isinstance(response_text, ErrorReply):
+            await run_in_threadpool(session_store.append, request.session_id, request.message, response_text)
+            session_store.schedule_compaction(request.session_id)
+        
         return ChatResponse(
-            response=response_text,
-            conversation_id=None  # You can implement conversation tracking here
+            message=response_text,
+            sources=sources,
+            session_id=request.session_id or ""  # Send it back to continue the conversation
         )
         
     except HTTPException:
         raise
+    except ClientDisconnected:
+        cancellation_stats.record(stage, tokens_saved=chat_service.max_tokens)
+        raise HTTPException(status_code=499, detail="Client closed request")
     except Exception as e:
         print(f"❌ Error in chat endpoint: {str(e)}")
         raise HTTPException(
@@ -75,17 +106,91 @@ async def chat(request: ChatRequest):
 @router.post("/stream")
 async def chat_stream(request: ChatRequest):
     """
-    Streaming chat endpoint (optional advanced feature)
+    Streaming chat endpoint (Server-Sent Events)
     
     Get AI responses word-by-word in real-time!
     This makes the UI feel more responsive.
     
-    Note: Implementation would require Server-Sent Events (SSE)
-    or WebSockets. For simplicity, we're using regular responses.
+    Events: "sources" as soon as the documents are searched, then
+    "delta" pieces of the answer, then "done" with usage and timings
+    (see app/services/streaming.py). Closing the connection cancels the
+    search / AI stream.
     """
-    # TODO: Implement streaming with SSE or WebSockets
-    # For now, just redirect to regular chat
-    return await chat(request)
+    if request.use_documents and request.document_id:
+        if await run_in_threadpool(document_service.get_document, request.document_id) is None:
+            raise HTTPException(
+                status_code=404,
+                detail=f"Document with ID {request.document_id} not found"
+            )
+    
+    async def events():
+        started = time.perf_counter()
+        try:
+            context = None
+            sources = []
+            if request.use_documents:
+                search_filter = None
+                if request.document_id:
+                    search_filter = await run_in_threadpool(
+                        document_service.build_filter, doc_ids=[request.document_id]
+                    )
+                try:
+                    records = await run_in_threadpool(
+                        document_service.retrieve, request.message, top_k=5, search_filter=search_filter
+                    )
+                except asyncio.CancelledError:
+                    # User left during the search (once the AI is streaming, stream_completion counts it)
+                    cancellation_stats.record("retrieval", tokens_saved=chat_service.max_tokens)
+                    raise
+                if records:
+                    context = [record["text"] for record in records]
+                    sources = list(dict.fromkeys(record["metadata"].get("source", "") for record in records))
+            retrieval_ms = round((time.perf_counter() - started) * 1000, 1)
+            yield sse_event("sources", {"sources": sources})
+            
+            history = []
+            if request.conversation_history:
+                history = [
+                    {"role": msg.role, "content": msg.content}
+                    for msg in request.conversation_history
+                ]
+            elif request.session_id:
+                history = await run_in_threadpool(session_store.get_history, request.session_id)
+            
+            usage = {}
+            pieces = []
+            failed = False
+            first_token_ms = None
+            async for piece in chat_service.get_streaming_response(
+                message=request.message,
+                conversation_history=history,
+                context=context,
+                usage=usage
+            ):
+                if first_token_ms is None:
+                    first_token_ms = round((time.perf_counter() - started) * 1000, 1)
+                pieces.append(piece)
+                failed = failed or isinstance(piece, ErrorReply)
+                yield sse_event("delta", {"content": piece})
+            
+            if request.session_id and not failed:
+                await run_in_threadpool(session_store.append, request.session_id, request.message, "".join(pieces))
+                session_store.schedule_compaction(request.session_id)
+            
+            yield sse_event("done", {
+                "usage": usage,
+                "session_id": request.session_id or "",
+                "timings": {
+                    "retrieval_ms": retrieval_ms,
+                    "first_token_ms": first_token_ms,
+                    "total_ms": round((time.perf_counter() - started) * 1000, 1)
+                }
+            })
+        except Exception as e:
+            print(f"❌ Error in chat stream: {str(e)}")
+            yield sse_event("error", {"detail": f"Error processing chat: {str(e)}"})
+    
+    return StreamingResponse(events(), media_type="text/event-stream", headers=SSE_HEADERS)
 
 @router.get("/test")
 async def test_chat():
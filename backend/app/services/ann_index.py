@@ -0,0 +1,463 @@
+"""
+ANN Index - Choosing and tuning the FAISS index type
+====================================================
+A *flat* index compares the question with every single chunk. That is
+exact, and fast enough for a few thousand chunks, but the cost grows with
+every manual we add. Approximate nearest neighbour (ANN) indexes only
+look at part of the data:
+
+- IVF: chunks are grouped into `nlist` clusters; a search only scans the
+  `nprobe` clusters closest to the question
+- HNSW: a graph linking each chunk to its neighbours; a search walks the
+  graph, keeping `efSearch` candidates as it goes
+
+Both can miss a few true neighbours. *Recall@k* measures how many: the
+share of the exact top-k that the ANN index also returns. The vector
+store reports it after every rebuild, for a range of nprobe / efSearch
+values, so you can pick the cheapest setting that is still accurate.
+
+Quantization shrinks the vectors the index keeps in memory:
+
+- fp16: half-precision floats (2x smaller, practically no loss)
+- int8: one byte per dimension (4x smaller)
+- pq: product quantization - each vector becomes `pq_m` one-byte codes
+  (a 1536-dim embedding in 64 bytes, ~96x smaller, noticeably lossy)
+
+Distances from a quantized index are approximate, so the vector store
+asks it for a few extra candidates and re-ranks them exactly with the
+full float32 vectors read back from disk.
+
+measure_quantization() reports what that costs and saves, against the
+same index type storing float32 vectors: memory per 100k chunks (graph
+links and IDs counted on both sides) and top-k recall.
+"""
+
+import math
+import time
+from typing import List, Optional
+
+# Try to import optional dependencies
+try:
+    import numpy as np
+    import faiss
+    FAISS_AVAILABLE = True
+except ImportError:
+    FAISS_AVAILABLE = False
+
+INDEX_TYPES = ("flat", "ivf", "hnsw")
+QUANTIZATIONS = ("none", "fp16", "int8", "pq")
+
+# Values tried when reporting recall against the flat index
+NPROBE_SWEEP = (1, 2, 4, 8, 16, 32, 64, 128, 256)
+EF_SEARCH_SWEEP = (16, 32, 64, 128, 256, 512)
+
+# Quantization should cut the index's memory at least this much against
+# float32 (the 4-8x target); the vector store warns when it doesn't
+MEMORY_TARGET_RATIO = 4.0
+
+# Largest number of vectors the float32 comparison index is built from
+# (bigger corpora are compared on a sample, so the check stays cheap)
+QUANTIZATION_BASELINE_MAX = 20000
+
+
+def choose_nlist(count: int) -> int:
+    """Number of IVF clusters for `count` vectors (the usual ~4·√n rule)"""
+    return int(min(max(4 * math.sqrt(max(count, 1)), 16), 65536))
+
+
+def choose_pq_m(dim: int, pq_m: int) -> int:
+    """Largest number of PQ sub-vectors <= pq_m that divides dim evenly"""
+    for m in range(min(pq_m, dim), 0, -1):
+        if dim % m == 0:
+            return m
+    return 1
+
+
+def _sample(vectors, count: int):
+    """Up to `count` rows of vectors (training doesn't need all of them)"""
+    if len(vectors) <= count:
+        return vectors
+    rows = np.random.default_rng(0).choice(len(vectors), count, replace=False)
+    return vectors[np.sort(rows)]
+
+
+def build_index(
+    kind: str,
+    dim: int,
+    vectors,
+    ids,
+    m: int = 32,
+    ef_construction: int = 200,
+    quantization: str = "none",
+    pq_m: int = 64
+):
+    """
+    Build a new index of the given type holding `vectors` under `ids`
+
+    Args:
+        kind: "flat", "ivf" or "hnsw"
+        dim: Vector size
+        vectors: float32 array (n, dim)
+        ids: int64 array (n,)
+        m: HNSW links per node
+        ef_construction: HNSW build-time search depth
+        quantization: How vectors are stored: "none", "fp16", "int8" or "pq"
+        pq_m: PQ sub-vectors per vector (bytes per vector with "pq")
+
+    Returns:
+        A faiss.IndexIDMap2 wrapping the chosen index
+    """
+    if quantization not in QUANTIZATIONS:
+        raise ValueError(f"Unknown quantization '{quantization}' (use one of {', '.join(QUANTIZATIONS)})")
+    scalar_type = {"fp16": faiss.ScalarQuantizer.QT_fp16, "int8": faiss.ScalarQuantizer.QT_8bit}.get(quantization)
+    pq_m = choose_pq_m(dim, pq_m)
+
+    if kind == "flat":
+        if quantization == "pq":
+            inner = faiss.IndexPQ(dim, pq_m, 8)
+        elif scalar_type is not None:
+            inner = faiss.IndexScalarQuantizer(dim, scalar_type)
+        else:
+            inner = faiss.IndexFlatL2(dim)
+    elif kind == "ivf":
+        nlist = choose_nlist(len(vectors))
+        if quantization == "pq":
+            inner = faiss.IndexIVFPQ(faiss.IndexFlatL2(dim), dim, nlist, pq_m, 8)
+        elif scalar_type is not None:
+            inner = faiss.IndexIVFScalarQuantizer(faiss.IndexFlatL2(dim), dim, nlist, scalar_type)
+        else:
+            inner = faiss.IndexIVFFlat(faiss.IndexFlatL2(dim), dim, nlist)
+        # k-means doesn't need every vector - a sample of ~64 per cluster is plenty
+        inner.train(_sample(vectors, 64 * nlist))
+    elif kind == "hnsw":
+        if quantization == "pq":
+            inner = faiss.IndexHNSWPQ(dim, pq_m, m)
+        elif scalar_type is not None:
+            inner = faiss.IndexHNSWSQ(dim, scalar_type, m)
+        else:
+            inner = faiss.IndexHNSWFlat(dim, m)
+        inner.hnsw.efConstruction = ef_construction
+    else:
+        raise ValueError(f"Unknown index type '{kind}' (use one of {', '.join(INDEX_TYPES)})")
+
+    if not inner.is_trained:
+        # Scalar quantizers learn each dimension's range, PQ its codebooks (256 codes each)
+        inner.train(_sample(vectors, 256 * 256))
+
+    index = faiss.IndexIDMap2(inner)
+    enable_reconstruct(index)
+    if len(vectors):
+        index.add_with_ids(vectors, ids)
+    return index
+
+
+def enable_reconstruct(index):
+    """
+    Make sure stored vectors can be read back by ID
+
+    Flat and HNSW indexes can always do this; IVF needs a map from vector
+    to cluster. IndexIDMap2 numbers the inner vectors 0, 1, 2... so a
+    plain array map works.
+    """
+    inner = faiss.downcast_index(index.index)
+    if isinstance(inner, faiss.IndexIVF) and inner.direct_map.type != faiss.DirectMap.Array:
+        inner.set_direct_map_type(faiss.DirectMap.Array)
+
+
+def search_with_selector(index, queries, k: int, selector, allowed_count: int):
+    """
+    Search only among the IDs a FAISS IDSelector accepts, inside FAISS
+
+    The ID selector is checked while the index is scanned, so we get
+    results from the allowed set instead of filtering a top-k list
+    afterwards. The fewer vectors are allowed, the further an approximate
+    index has to look to find k of them, so nprobe / efSearch are scaled
+    up by the same factor.
+    """
+    inner = faiss.downcast_index(index.index)
+    widen = max(1, math.ceil(index.ntotal / max(allowed_count, 1)))
+    if isinstance(inner, faiss.IndexIVF):
+        params = faiss.SearchParametersIVF(sel=selector, nprobe=min(inner.nprobe * widen, inner.nlist))
+    elif isinstance(inner, faiss.IndexHNSW):
+        params = faiss.SearchParametersHNSW(sel=selector, efSearch=min(max(inner.hnsw.efSearch, k) * widen, 4096))
+    elif isinstance(inner, faiss.IndexPQ):
+        # IndexPQ can't check a selector while scanning - over-fetch and filter
+        return _search_then_filter(index, queries, k, selector, widen)
+    else:
+        params = faiss.SearchParameters(sel=selector)
+    return index.search(queries, k, params=params)
+
+
+def _search_then_filter(index, queries, k: int, selector, widen: int):
+    """
+    Selector search for indexes without selector support
+
+    Every query row keeps its own allowed hits; rows with fewer than k
+    are padded with -1, like FAISS does.
+    """
+    found_distances, found_ids = index.search(queries, min(k * widen * 2, index.ntotal))
+    distances = np.full((len(queries), k), np.inf, dtype=np.float32)
+    ids = np.full((len(queries), k), -1, dtype=np.int64)
+    for row, (row_distances, row_ids) in enumerate(zip(found_distances, found_ids)):
+        keep = [
+            col for col, vector_id in enumerate(row_ids)
+            if vector_id != -1 and selector.is_member(int(vector_id))
+        ][:k]
+        distances[row, :len(keep)] = row_distances[keep]
+        ids[row, :len(keep)] = row_ids[keep]
+    return distances, ids
+
+
+def read_index_mapped(path: str):
+    """
+    Open a saved index memory-mapped instead of reading it into memory
+
+    Pages are read from disk only when a search touches them, and every
+    process mapping the same file shares them. The result is read-only:
+    adding to it crashes the process, so copy it with faiss.read_index
+    first. FAISS builds without mmap support fall back to a normal read.
+    """
+    flag = getattr(faiss, "IO_FLAG_MMAP_IFC", None) or getattr(faiss, "IO_FLAG_MMAP", None)
+    if flag is not None:
+        try:
+            return faiss.read_index(path, flag | getattr(faiss, "IO_FLAG_READ_ONLY", 0))
+        except RuntimeError:
+            pass
+    return faiss.read_index(path)
+
+
+def index_kind(index) -> str:
+    """Which of INDEX_TYPES an index built by build_index is"""
+    inner = faiss.downcast_index(index.index)
+    if isinstance(inner, faiss.IndexIVF):
+        return "ivf"
+    if isinstance(inner, faiss.IndexHNSW):
+        return "hnsw"
+    return "flat"
+
+
+def index_quantization(index) -> str:
+    """Which of QUANTIZATIONS an index built by build_index uses"""
+    inner = faiss.downcast_index(index.index)
+    if isinstance(inner, faiss.IndexHNSW):
+        inner = faiss.downcast_index(inner.storage)
+    if isinstance(inner, (faiss.IndexPQ, faiss.IndexIVFPQ)):
+        return "pq"
+    if isinstance(inner, (faiss.IndexScalarQuantizer, faiss.IndexIVFScalarQuantizer)):
+        return "fp16" if inner.sq.qtype == faiss.ScalarQuantizer.QT_fp16 else "int8"
+    return "none"
+
+
+def bytes_per_vector(index, dim: int, code_size: Optional[int] = None) -> float:
+    """
+    Approximate memory one vector takes in an index (codes + IDs + links)
+
+    Flat and quantized codes are exact; IVF adds its inverted-list ID,
+    HNSW its level-0 graph links (2·M neighbours of 4 bytes).
+
+    Args:
+        code_size: Bytes per stored vector to assume instead of the
+            index's own (dim·4 gives the same index with float32 vectors)
+    """
+    inner = faiss.downcast_index(index.index)
+    size = 8.0  # IndexIDMap2's own ID per vector
+    if isinstance(inner, faiss.IndexHNSW):
+        size += inner.hnsw.nb_neighbors(0) * 4
+        inner = faiss.downcast_index(inner.storage)
+    if isinstance(inner, faiss.IndexIVF):
+        size += 8
+    if code_size is None:
+        code_size = getattr(inner, "code_size", 0) or dim * 4
+    return size + code_size
+
+
+def set_search_params(index, nprobe: Optional[int] = None, ef_search: Optional[int] = None):
+    """Set the speed/accuracy knob of an IVF (nprobe) or HNSW (efSearch) index"""
+    inner = faiss.downcast_index(index.index)
+    if isinstance(inner, faiss.IndexIVF) and nprobe:
+        inner.nprobe = min(nprobe, inner.nlist)
+    elif isinstance(inner, faiss.IndexHNSW) and ef_search:
+        inner.hnsw.efSearch = ef_search
+
+
+def measure_recall(index, vectors, ids, k: int = 10, samples: int = 200) -> List[dict]:
+    """
+    Recall@k of an ANN index against exact search, for a range of settings
+
+    Queries are a random sample of the indexed vectors themselves. The
+    index's own setting is restored afterwards.
+
+    Args:
+        index: Index from build_index (ivf or hnsw)
+        vectors: The vectors it holds, float32 (n, dim)
+        ids: Their IDs, in the same order
+        k: How many neighbours to compare
+        samples: Number of sample queries
+
+    Returns:
+        [{"nprobe" or "ef_search": value, "recall": 0..1, "ms_per_query": ...}, ...]
+    """
+    kind = index_kind(index)
+    if kind == "flat" or len(vectors) == 0:
+        return []
+
+    rng = np.random.default_rng(0)
+    rows = rng.choice(len(vectors), min(samples, len(vectors)), replace=False)
+    queries = np.ascontiguousarray(vectors[rows])
+    k = min(k, len(vectors))
+
+    # Exact answers by brute force (no copy of the vectors needed)
+    _, truth = faiss.knn(queries, vectors, k)
+
+    inner = faiss.downcast_index(index.index)
+    # The flat index above uses row numbers; map the ANN results back to rows
+    id_to_row = {int(vector_id): row for row, vector_id in enumerate(ids)}
+
+    if kind == "ivf":
+        name, values, original = "nprobe", [v for v in NPROBE_SWEEP if v <= inner.nlist], inner.nprobe
+    else:
+        name, values, original = "ef_search", EF_SEARCH_SWEEP, inner.hnsw.efSearch
+
+    report = []
+    try:
+        for value in values:
+            set_search_params(index, **{name: value})
+            started = time.perf_counter()
+            _, found = index.search(queries, k)
+            elapsed = time.perf_counter() - started
+            hits = 0
+            for truth_row, found_row in zip(truth, found):
+                found_rows = {id_to_row.get(int(vector_id), -1) for vector_id in found_row}
+                hits += len(set(truth_row.tolist()) & found_rows)
+            report.append({
+                name: value,
+                "recall": round(hits / (len(queries) * k), 4),
+                "ms_per_query": round(elapsed * 1000 / len(queries), 4)
+            })
+    finally:
+        set_search_params(index, **{name: original})
+    return report
+
+
+def rerank(query, candidate_ids, candidate_vectors, k: int):
+    """
+    Exact L2 re-ranking of candidates found by a quantized index
+
+    Args:
+        query: float32 array (dim,) or (1, dim)
+        candidate_ids: int64 array (n,)
+        candidate_vectors: Their full float32 vectors (n, dim)
+        k: How many to keep
+
+    Returns:
+        (distances, ids) arrays of shape (1, <=k), closest first
+    """
+    distances = ((candidate_vectors - query.reshape(1, -1)) ** 2).sum(axis=1)
+    best = np.argpartition(distances, k - 1)[:k] if k < len(distances) else np.arange(len(distances))
+    best = best[np.argsort(distances[best])]
+    return distances[best].reshape(1, -1), candidate_ids[best].reshape(1, -1)
+
+
+def _topk_recall(index, queries, truth, id_to_row, vectors, k: int, rerank_factor: int):
+    """
+    Recall@k of an index against exact answers: (straight from the index, after re-ranking)
+
+    Re-ranking takes the index's top k·rerank_factor and orders them by
+    their exact float32 distance, as vector searches do.
+    """
+    _, found = index.search(queries, min(k * rerank_factor, len(vectors)))
+    raw_hits = 0
+    reranked_hits = 0
+    for query, truth_row, found_row in zip(queries, truth, found):
+        truth_set = set(truth_row.tolist())
+        found_rows = np.asarray([id_to_row[int(v)] for v in found_row if v != -1], dtype=np.int64)
+        raw_hits += len(truth_set & set(found_rows[:k].tolist()))
+        if len(found_rows):
+            _, best = rerank(query, found_rows, vectors[found_rows], k)
+            reranked_hits += len(truth_set & set(best[0].tolist()))
+    total = len(queries) * k
+    return raw_hits / total, reranked_hits / total
+
+
+def measure_quantization(
+    index,
+    vectors,
+    ids,
+    k: int = 3,
+    rerank_factor: int = 4,
+    samples: int = 200,
+    m: int = 32,
+    ef_construction: int = 200,
+    pq_m: int = 64
+) -> dict:
+    """
+    What quantization costs in recall and saves in memory
+
+    Both are compared with the same index type storing float32 vectors:
+
+    - memory: per vector, codes plus the IDs and graph links / list IDs
+      that both versions carry
+    - recall@k against exact search: the float32 index's, the quantized
+      index's straight away and after exact re-ranking of its top
+      k·rerank_factor (which is what searches actually do).
+      recall_delta = re-ranked quantized recall - float32 recall
+
+    For the recall comparison a float32 index of the same type is built
+    (m, ef_construction, pq_m as for the real one). Above
+    QUANTIZATION_BASELINE_MAX vectors both are built from a sample of
+    that size, so the comparison stays like for like and cheap.
+
+    Returns:
+        {"quantization", "bytes_per_vector", "mb_per_100k_chunks",
+         "float32_bytes_per_vector", "float32_mb_per_100k_chunks",
+         "memory_ratio", "recall_at_k", "reranked_recall_at_k",
+         "float32_recall_at_k", "recall_delta", "measured_on", "k"}
+    """
+    dim = vectors.shape[1] if len(vectors) else index.d
+    quantization = index_quantization(index)
+    per_vector = bytes_per_vector(index, dim)
+    float32_per_vector = bytes_per_vector(index, dim, code_size=dim * 4)
+    report = {
+        "quantization": quantization,
+        "bytes_per_vector": round(per_vector, 1),
+        "mb_per_100k_chunks": round(per_vector * 100_000 / 2**20, 1),
+        "float32_bytes_per_vector": round(float32_per_vector, 1),
+        "float32_mb_per_100k_chunks": round(float32_per_vector * 100_000 / 2**20, 1),
+        "memory_ratio": round(float32_per_vector / per_vector, 2),
+        "k": k
+    }
+    if len(vectors) == 0:
+        return report
+
+    kind = index_kind(index)
+    if len(vectors) > QUANTIZATION_BASELINE_MAX:
+        rows = np.sort(np.random.default_rng(2).choice(len(vectors), QUANTIZATION_BASELINE_MAX, replace=False))
+        vectors, ids = np.ascontiguousarray(vectors[rows]), np.asarray(ids)[rows]
+        index = build_index(kind, dim, vectors, ids, m=m, ef_construction=ef_construction,
+                            quantization=quantization, pq_m=pq_m)
+    if quantization == "none":
+        baseline = index
+    else:
+        baseline = build_index(kind, dim, vectors, ids, m=m, ef_construction=ef_construction, pq_m=pq_m)
+    # Same speed/accuracy knob on both sides
+    inner = faiss.downcast_index(index.index)
+    if isinstance(inner, faiss.IndexIVF):
+        set_search_params(baseline, nprobe=inner.nprobe)
+    elif isinstance(inner, faiss.IndexHNSW):
+        set_search_params(baseline, ef_search=inner.hnsw.efSearch)
+
+    rng = np.random.default_rng(1)
+    rows = rng.choice(len(vectors), min(samples, len(vectors)), replace=False)
+    queries = np.ascontiguousarray(vectors[rows])
+    k = min(k, len(vectors))
+    _, truth = faiss.knn(queries, vectors, k)
+    id_to_row = {int(vector_id): row for row, vector_id in enumerate(ids)}
+
+    raw, reranked = _topk_recall(index, queries, truth, id_to_row, vectors, k, rerank_factor)
+    float32_recall, _ = _topk_recall(baseline, queries, truth, id_to_row, vectors, k, 1)
+    report["recall_at_k"] = round(raw, 4)
+    report["reranked_recall_at_k"] = round(reranked, 4)
+    report["float32_recall_at_k"] = round(float32_recall, 4)
+    report["recall_delta"] = round(reranked - float32_recall, 4)
+    report["measured_on"] = len(vectors)
+    return report
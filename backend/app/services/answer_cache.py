@@ -0,0 +1,171 @@
+"""
+Answer Cache - Don't ask GPT the same question twice
+====================================================
+Lots of people ask the same things ("how do I reset the oil light").
+Answering means a search plus a GPT call, which is slow and costs money,
+so we remember answers:
+
+- Exact match: the question, lowercased with whitespace collapsed
+- Near match (optional): a question whose embedding is at least
+  ANSWER_CACHE_SIMILARITY similar to one we've answered ("how to reset
+  oil light?" ≈ "how do I reset the oil light")
+
+Every entry is tied to the *corpus version*. Uploading or removing a
+document changes the version, and all older answers stop matching, since
+they might be missing the new manual's information.
+"""
+
+import time
+import threading
+from typing import Callable, List, Optional
+import logging
+
+from app.services.embedding_service import normalize_query
+from app.services.ttl_cache import TTLCache
+
+# Try to import optional dependencies
+try:
+    import numpy as np
+    NUMPY_AVAILABLE = True
+except ImportError:
+    NUMPY_AVAILABLE = False
+
+logger = logging.getLogger(__name__)
+
+
+class AnswerCache:
+    """
+    Cached chat answers, matched exactly or by embedding similarity,
+    and invalidated when the corpus version changes
+    """
+
+    def __init__(
+        self,
+        max_size: int = 1024,
+        ttl_seconds: float = 3600,
+        similarity_threshold: float = 0.0,
+        embed: Optional[Callable[[str], Optional["np.ndarray"]]] = None
+    ):
+        """
+        Args:
+            max_size: Most answers kept
+            ttl_seconds: How long an answer stays valid
+            similarity_threshold: Cosine similarity needed for a near match
+                (0 turns near matching off)
+            embed: Turns a question into a vector (needed for near matches;
+                may return None when no embeddings are available)
+        """
+        self.exact = TTLCache(max_size, ttl_seconds)
+        self.similarity_threshold = similarity_threshold
+        self.embed = embed if NUMPY_AVAILABLE and similarity_threshold > 0 else None
+
+        # Near-match entries for the current corpus version: one unit-length
+        # vector per row, with the exact-cache key it points to
+        self._version: Optional[int] = None
+        self._vectors = None
+        self._keys: List[tuple] = []
+        self._lock = threading.Lock()
+
+        self.hits = 0
+        self.misses = 0
+        self.semantic_hits = 0
+        self.saved_seconds = 0.0
+
+    def _key(self, question: str, corpus_version: int, variant: str) -> tuple:
+        return (corpus_version, variant, normalize_query(question))
+
+    def _embed_unit(self, question: str) -> Optional["np.ndarray"]:
+        """The question's embedding scaled to length 1 (None if unavailable)"""
+        if self.embed is None:
+            return None
+        try:
+            vector = self.embed(question)
+        except Exception as e:
+            logger.warning(f"⚠️  Could not embed question for the answer cache: {e}")
+            return None
+        if vector is None:
+            return None
+        vector = np.asarray(vector, dtype=np.float32)
+        norm = float(np.linalg.norm(vector))
+        return vector / norm if norm > 0 else None
+
+    def _reset_if_stale(self, corpus_version: int):
+        """Forget near-match vectors from an older corpus version (call with the lock held)"""
+        if self._version != corpus_version:
+            self._version = corpus_version
+            self._vectors = None
+            self._keys = []
+
+    def get(self, question: str, corpus_version: int, variant: str = "") -> Optional[dict]:
+        """
+        Cached answer for a question, or None
+
+        Args:
+            question: The user's question
+            corpus_version: Current corpus version
+            variant: Anything else the answer depends on (e.g. retrieval mode)
+        """
+        key = self._key(question, corpus_version, variant)
+        answer = self.exact.get(key)
+
+        if answer is None and self.embed is not None:
+            vector = self._embed_unit(question)
+            with self._lock:
+                self._reset_if_stale(corpus_version)
+                if vector is not None and self._vectors is not None:
+                    # Only keys for this variant are candidates
+                    similarities = self._vectors @ vector
+                    for row in np.argsort(-similarities):
+                        if similarities[row] < self.similarity_threshold:
+                            break
+                        if self._keys[row][1] == variant:
+                            answer = self.exact.get(self._keys[row])
+                            if answer is not None:
+                                self.semantic_hits += 1
+                            break
+
+        with self._lock:
+            if answer is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+                self.saved_seconds += answer.get("latency_seconds", 0.0)
+        return answer
+
+    def put(self, question: str, corpus_version: int, answer: dict, variant: str = ""):
+        """
+        Remember an answer
+
+        Args:
+            answer: {"response": ..., "sources": [...], "latency_seconds": ...}
+        """
+        key = self._key(question, corpus_version, variant)
+        self.exact.put(key, dict(answer, cached_at=time.time()))
+
+        vector = self._embed_unit(question)
+        if vector is None:
+            return
+        with self._lock:
+            self._reset_if_stale(corpus_version)
+            if key in self._keys:
+                return
+            row = vector.reshape(1, -1)
+            self._vectors = row if self._vectors is None else np.vstack([self._vectors, row])
+            self._keys.append(key)
+            # Keep the near-match table no bigger than the exact cache
+            overflow = len(self._keys) - self.exact.max_size
+            if overflow > 0:
+                self._vectors = self._vectors[overflow:]
+                self._keys = self._keys[overflow:]
+
+    def stats(self) -> dict:
+        """Hit rate and how much answering time the cache saved"""
+        stats = self.exact.stats()
+        lookups = self.hits + self.misses
+        stats["hits"] = self.hits
+        stats["misses"] = self.misses
+        stats["hit_rate"] = round(self.hits / lookups, 4) if lookups else 0.0
+        stats["semantic_hits"] = self.semantic_hits
+        stats["similarity_threshold"] = self.similarity_threshold if self.embed is not None else None
+        stats["saved_seconds"] = round(self.saved_seconds, 3)
+        return stats
@@ -0,0 +1,102 @@
+"""
+Cancellation - Stop working on answers nobody is waiting for
+============================================================
+When someone closes the browser tab halfway through an answer, the
+server used to carry on regardless: the search finished, GPT kept
+writing (and we kept paying for) up to max_tokens of text, and the
+connection to OpenAI stayed busy until it was done.
+
+Now the work is cancelled as soon as the client goes away:
+- streamed answers (SSE / NDJSON): Starlette cancels the response
+  generator when it sees the disconnect, and stream_completion() closes
+  the OpenAI response so generation stops upstream too
+- plain JSON answers run next to a watcher (run_unless_disconnected)
+  that cancels them when the disconnect arrives
+
+A search already running on a worker thread can't be interrupted, but
+it only takes milliseconds - what matters is that GPT is never called.
+
+cancellation_stats counts the cancelled requests and roughly how many
+completion tokens were not generated thanks to it (see GET /api/stats).
+"""
+
+from typing import Awaitable, TypeVar
+import asyncio
+import logging
+import threading
+
+from fastapi import Request
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+
+class ClientDisconnected(Exception):
+    """The client closed the connection before the answer was ready"""
+
+
+class CancellationStats:
+    """Counters of requests abandoned by their client (thread-safe)"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._cancelled = {"retrieval": 0, "generation": 0}
+        self._tokens_saved = 0
+
+    def record(self, stage: str, tokens_saved: int = 0):
+        """
+        Count one cancelled request
+
+        Args:
+            stage: "retrieval" (GPT was never called) or "generation"
+            tokens_saved: Completion tokens not generated (an estimate:
+                max_tokens minus what was already written)
+        """
+        tokens_saved = max(0, int(tokens_saved))
+        with self._lock:
+            self._cancelled[stage] = self._cancelled.get(stage, 0) + 1
+            self._tokens_saved += tokens_saved
+        logger.info(f"🗑️ Client disconnected during {stage} - cancelled (~{tokens_saved} tokens saved)")
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "cancelled_requests": sum(self._cancelled.values()),
+                "by_stage": dict(self._cancelled),
+                "tokens_saved": self._tokens_saved
+            }
+
+
+async def _wait_for_disconnect(request: Request):
+    # The body has already been read, so the next ASGI message is the disconnect
+    while True:
+        message = await request.receive()
+        if message["type"] == "http.disconnect":
+            return
+
+
+async def run_unless_disconnected(request: Request, work: Awaitable[T]) -> T:
+    """
+    Await `work`, cancelling it if the client disconnects first
+
+    Raises:
+        ClientDisconnected: the client went away (the work was cancelled)
+    """
+    task = asyncio.ensure_future(work)
+    watcher = asyncio.ensure_future(_wait_for_disconnect(request))
+    try:
+        await asyncio.wait({task, watcher}, return_when=asyncio.FIRST_COMPLETED)
+    finally:
+        watcher.cancel()
+        if not task.done():
+            task.cancel()
+    if task.done():
+        return task.result()
+    # Let the cancellation go through (the work's clean-up runs) before reporting it
+    await asyncio.wait({task})
+    raise ClientDisconnected()
+
+
+# Create a singleton instance
+cancellation_stats = CancellationStats()
@@ -3,13 +3,19 @@ Chat Service - Handles AI interactions with OpenAI GPT
 This is where the magic happens! We talk to OpenAI here.
 """
 
-import os
-from openai import OpenAI
-from typing import List, Dict, Optional
+from typing import List, Dict, Optional, Union
 
-# Initialize OpenAI client
-# This reads your API key from the .env file
-client = OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
+from app.services.openai_client import get_async_client
+from app.services.prompt_budget import fit_prompt
+from app.services.streaming import stream_completion
+
+class ErrorReply(str):
+    """
+    The apology text sent instead of an answer when the AI call fails
+    
+    It's still a plain string for the user, but callers can tell it apart
+    (isinstance) - e.g. so it isn't saved in the conversation history.
+    """
 
 class ChatService:
     """
@@ -25,11 +31,42 @@ class ChatService:
         self.max_tokens = 2000  # Maximum length of response
         self.temperature = 0.7  # Creativity (0 = deterministic, 1 = creative)
     
+    def _build_messages(
+        self,
+        system_message: str,
+        message: str,
+        conversation_history: List[Dict[str, str]] = None,
+        context: Union[str, List[str], None] = None
+    ) -> List[Dict[str, str]]:
+        """
+        The messages for OpenAI, sized to the model's token budget
+        
+        Document chunks (most relevant first) and recent history are kept
+        whole for as long as they fit - see prompt_budget.py
+        """
+        chunks = [context] if isinstance(context, str) else list(context or [])
+        fit = fit_prompt(
+            self.model,
+            fixed=[system_message + "\n\nDocument Context:\n", message],
+            chunks=chunks,
+            history=conversation_history,
+            max_tokens=self.max_tokens
+        )
+        
+        # If there's document context, add it to the system message
+        if fit["chunks"]:
+            system_message += "\n\nDocument Context:\n" + "\n\n".join(fit["chunks"])
+        
+        messages = [{"role": "system", "content": system_message}]
+        messages.extend(fit["history"])
+        messages.append({"role": "user", "content": message})
+        return messages
+    
     async def get_chat_response(
         self, 
         message: str, 
         conversation_history: List[Dict[str, str]] = None,
-        context: str = None
+        context: Union[str, List[str], None] = None
     ) -> str:
         """
         Get a response from the AI
@@ -37,38 +74,26 @@ class ChatService:
         Args:
             message: The user's question/message
             conversation_history: Previous messages (for context)
-            context: Additional context (like document content)
+            context: Additional context (like document content) - one text,
+                or document chunks most relevant first
         
         Returns:
-            AI's response as a string
+            AI's response as a string (an ErrorReply if the call failed)
         """
         try:
-            # Build the messages array for OpenAI
-            messages = []
-            
             # System message - tells the AI how to behave
             system_message = """You are AutoQuery, a helpful AI assistant built for document Q&A. 
             You are friendly, professional, and provide accurate information. 
             When answering questions about documents, cite specific parts when possible.
             Keep responses concise but informative."""
             
-            # If there's document context, add it to the system message
-            if context:
-                system_message += f"\n\nDocument Context:\n{context[:3000]}"  # Limit context size
-            
-            messages.append({"role": "system", "content": system_message})
-            
-            # Add conversation history if provided
-            if conversation_history:
-                for msg in conversation_history[-5:]:  # Keep last 5 messages for context
-                    messages.append(msg)
-            
-            # Add current user message
-            messages.append({"role": "user", "content": message})
+            # Build the messages array for OpenAI (context and history trimmed to the token budget)
+            messages = self._build_messages(system_message, message, conversation_history, context)
             
             # Call OpenAI API
-            # This is where we actually talk to GPT!
-            response = client.chat.completions.create(
+            # This is where we actually talk to GPT! (await = other requests
+            # keep being served while we wait)
+            response = await get_async_client().chat.completions.create(
                 model=self.model,
                 messages=messages,
                 max_tokens=self.max_tokens,
@@ -83,13 +108,14 @@ class ChatService:
             
         except Exception as e:
             print(f"Error in chat service: {str(e)}")
-            return f"Sorry, I encountered an error: {str(e)}"
+            return ErrorReply(f"Sorry, I encountered an error: {str(e)}")
     
     async def get_streaming_response(
         self,
         message: str,
         conversation_history: List[Dict[str, str]] = None,
-        context: str = None
+        context: Union[str, List[str], None] = None,
+        usage: Optional[dict] = None
     ):
         """
         Get a streaming response from AI (word by word)
@@ -98,45 +124,32 @@ class ChatService:
         Args:
             message: The user's question
             conversation_history: Previous messages
-            context: Document context
+            context: Document context (one text, or chunks most relevant first)
+            usage: Filled with token counts when the answer is complete
             
         Yields:
             Chunks of the response as they come
         """
         try:
             # Build messages (same as above)
-            messages = []
-            
             system_message = """You are AutoQuery, a helpful AI assistant. 
             Provide clear, accurate, and concise responses."""
             
-            if context:
-                system_message += f"\n\nDocument Context:\n{context[:3000]}"
-            
-            messages.append({"role": "system", "content": system_message})
-            
-            if conversation_history:
-                for msg in conversation_history[-5:]:
-                    messages.append(msg)
-            
-            messages.append({"role": "user", "content": message})
+            messages = self._build_messages(system_message, message, conversation_history, context)
             
             # Call OpenAI with streaming enabled
-            response = client.chat.completions.create(
+            # Yield chunks as they come (awaited - other requests keep running)
+            async for piece in stream_completion(
+                messages,
+                usage=usage,
                 model=self.model,
-                messages=messages,
                 max_tokens=self.max_tokens,
-                temperature=self.temperature,
-                stream=True  # Enable streaming!
-            )
-            
-            # Yield chunks as they come
-            for chunk in response:
-                if chunk.choices[0].delta.content is not None:
-                    yield chunk.choices[0].delta.content
+                temperature=self.temperature
+            ):
+                yield piece
                     
         except Exception as e:
-            yield f"Error: {str(e)}"
+            yield ErrorReply(f"Error: {str(e)}")
 
 # Create a singleton instance
 # This means we only create one ChatService for the entire app
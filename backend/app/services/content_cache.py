@@ -0,0 +1,132 @@
+"""
+Content Cache - Remember work we've already done for a file
+============================================================
+People upload the same vehicle manual again and again. Instead of
+re-reading, re-chunking and re-embedding identical bytes every time, we
+fingerprint each upload with SHA-256 and keep the results on disk,
+filed under that fingerprint ("content addressed"):
+
+    vector_store/content/ab/abcdef.../text.json
+    vector_store/content/ab/abcdef.../chunks-1000-200.json
+
+Same bytes → same hash → same folder, so a repeat upload finds everything
+ready. (Embeddings are cached per chunk by the embedding service, which
+also covers chunks shared between different files.)
+"""
+
+import os
+import json
+import shutil
+import hashlib
+import threading
+from typing import BinaryIO, List, Optional
+
+# Read/hash uploads in 1 MB pieces so big files never sit fully in memory
+HASH_CHUNK_SIZE = 1024 * 1024
+
+
+def hash_file(file_path: str) -> str:
+    """SHA-256 of a file on disk (hex string)"""
+    digest = hashlib.sha256()
+    with open(file_path, "rb") as file:
+        for block in iter(lambda: file.read(HASH_CHUNK_SIZE), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def copy_and_hash(source: BinaryIO, dest_path: str) -> str:
+    """
+    Stream an upload to disk and hash it in the same pass
+
+    Returns: SHA-256 of the bytes written (hex string)
+    """
+    digest = hashlib.sha256()
+    with open(dest_path, "wb") as buffer:
+        for block in iter(lambda: source.read(HASH_CHUNK_SIZE), b""):
+            digest.update(block)
+            buffer.write(block)
+    return digest.hexdigest()
+
+
+class ContentCache:
+    """
+    On-disk cache of extracted text and chunks keyed by content hash
+
+    Every file is written to a temporary name and then renamed into place,
+    so a crash can never leave a half-written cache entry behind.
+    """
+
+    def __init__(self, root_dir: str):
+        self.root_dir = root_dir
+        os.makedirs(self.root_dir, exist_ok=True)
+
+    def _entry_dir(self, content_hash: str) -> str:
+        """Folder for one piece of content (sharded by the first two hex digits)"""
+        return os.path.join(self.root_dir, content_hash[:2], content_hash)
+
+    def _path(self, content_hash: str, name: str) -> str:
+        return os.path.join(self._entry_dir(content_hash), name)
+
+    def _write_atomic(self, path: str, data: bytes):
+        """Write to a temp file, then rename it over the real name"""
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = f"{path}.tmp-{os.getpid()}-{threading.get_ident()}"
+        with open(tmp_path, "wb") as file:
+            file.write(data)
+        os.replace(tmp_path, path)
+
+    def _read_json(self, path: str):
+        if not os.path.exists(path):
+            return None
+        try:
+            with open(path, "r", encoding="utf-8") as file:
+                return json.load(file)
+        except (OSError, ValueError):
+            return None
+
+    def delete(self, content_hash: str):
+        """Forget everything cached for this content"""
+        shutil.rmtree(self._entry_dir(content_hash), ignore_errors=True)
+
+    # ---------- extracted text ----------
+
+    def get_text(self, content_hash: str) -> Optional[dict]:
+        """
+        Cached extraction result
+
+        Returns: {"text": ..., "pages": ..., "page_starts": [...]} or None
+        """
+        return self._read_json(self._path(content_hash, "text.json"))
+
+    def has_text(self, content_hash: str) -> bool:
+        """True if text for this content is cached (without reading it)"""
+        return os.path.exists(self._path(content_hash, "text.json"))
+
+    def put_text(self, content_hash: str, text: str, pages: Optional[int], page_starts: List[int]):
+        """Cache the text extracted from a file"""
+        data = {"text": text, "pages": pages, "page_starts": page_starts}
+        self._write_atomic(
+            self._path(content_hash, "text.json"),
+            json.dumps(data, ensure_ascii=False).encode("utf-8")
+        )
+
+    # ---------- chunks ----------
+
+    def _chunks_name(self, chunk_size: int, chunk_overlap: int) -> str:
+        # Different splitter settings give different chunks, so they get their own file
+        return f"chunks-{chunk_size}-{chunk_overlap}.json"
+
+    def get_chunks(self, content_hash: str, chunk_size: int, chunk_overlap: int) -> Optional[List[dict]]:
+        """
+        Cached chunks for a file
+
+        Returns: [{"text": ..., "page": ...}, ...] or None
+        """
+        return self._read_json(self._path(content_hash, self._chunks_name(chunk_size, chunk_overlap)))
+
+    def put_chunks(self, content_hash: str, chunk_size: int, chunk_overlap: int, chunks: List[dict]):
+        """Cache the chunks a file was split into"""
+        self._write_atomic(
+            self._path(content_hash, self._chunks_name(chunk_size, chunk_overlap)),
+            json.dumps(chunks, ensure_ascii=False).encode("utf-8")
+        )
@@ -0,0 +1,95 @@
+"""
+Diversity - Maximal marginal relevance (MMR) selection
+======================================================
+Chunks overlap by CHUNK_OVERLAP characters, so the three chunks closest
+to a question are often nearly the same text three times. MMR picks
+results one at a time, each time taking the candidate with the best
+
+    lambda · similarity to the question - (1 - lambda) · similarity to
+    the closest chunk already picked
+
+so a chunk that repeats what we already have loses to one that adds
+something new. lambda = 1 is plain relevance order, lambda = 0 pure
+variety.
+
+The relevance term is the cosine similarity to the question by default.
+Keyword and hybrid searches pass their own ranking score instead (BM25
+rank / reciprocal rank fusion), scaled to 0..1, so MMR re-orders their
+ranking rather than replacing it with a pure embedding ranking.
+
+All similarities come from two matrix products done up front; each
+pick after that is a few vector operations over the candidate pool.
+"""
+
+from typing import List, Optional, Sequence
+
+# Try to import optional dependencies
+try:
+    import numpy as np
+    NUMPY_AVAILABLE = True
+except ImportError:
+    NUMPY_AVAILABLE = False
+
+
+def _normalize(vectors):
+    """Scale rows to unit length, so dot products are cosine similarities"""
+    norms = np.linalg.norm(vectors, axis=-1, keepdims=True)
+    return vectors / np.maximum(norms, 1e-12)
+
+
+def _scale(scores):
+    """Min-max scale scores to 0..1 (all equal → all 1)"""
+    scores = np.asarray(scores, dtype=np.float32)
+    spread = float(scores.max() - scores.min())
+    if spread <= 0:
+        return np.ones_like(scores)
+    return (scores - scores.min()) / spread
+
+
+def mmr_select(
+    query_vector,
+    candidate_vectors,
+    k: int,
+    lambda_mult: float = 0.5,
+    relevance: Optional[Sequence[float]] = None
+) -> List[int]:
+    """
+    Choose k relevant but mutually different candidates
+
+    Args:
+        query_vector: Query embedding (dim,) - only used without `relevance`
+        candidate_vectors: One embedding per candidate (n, dim)
+        k: How many to pick
+        lambda_mult: Relevance vs. variety trade-off, 0..1
+        relevance: The search's own score per candidate (higher = better),
+            used instead of cosine similarity to the query
+
+    Returns:
+        Positions of the chosen candidates, in pick order
+    """
+    vectors = _normalize(np.asarray(candidate_vectors, dtype=np.float32))
+    if len(vectors) == 0 or k <= 0:
+        return []
+    if relevance is not None:
+        relevance = _scale(relevance)  # (n,)
+    else:
+        query = _normalize(np.asarray(query_vector, dtype=np.float32).reshape(-1))
+        relevance = vectors @ query  # (n,)
+    similarity = vectors @ vectors.T  # (n, n)
+
+    first = int(np.argmax(relevance))
+    selected = [first]
+    # Similarity of every candidate to its closest already-picked chunk
+    redundancy = similarity[first].copy()
+    scores = lambda_mult * relevance - (1 - lambda_mult) * redundancy
+    scores[first] = -np.inf
+
+    while len(selected) < min(k, len(vectors)):
+        best = int(np.argmax(scores))
+        selected.append(best)
+        np.maximum(redundancy, similarity[best], out=redundancy)
+        picked = np.isneginf(scores)
+        scores = lambda_mult * relevance - (1 - lambda_mult) * redundancy
+        scores[picked] = -np.inf
+        scores[best] = -np.inf
+    return selected
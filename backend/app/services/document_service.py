@@ -10,32 +10,52 @@ For beginners: This is just using libraries to read files!
 """
 
 import os
+import re
+import time
 import uuid
-from typing import List, Tuple, Optional
+import bisect
+import hashlib
+import threading
+from concurrent.futures import Executor, ThreadPoolExecutor
+from typing import Callable, List, Tuple, Optional
 import logging
 from pathlib import Path
 import json
 
-# Document processing libraries
-import PyPDF2
-from docx import Document
+from app.services import text_extraction
+from app.services.content_cache import ContentCache, hash_file
+from app.services.diversity import mmr_select
+from app.services.embedding_service import EmbeddingCache, EmbeddingService, create_embedding_backend
+from app.services.file_lock import FileLock
+from app.services.lexical_index import LexicalIndex
+from app.services.metadata_store import MetadataStore
+from app.services.rank_fusion import reciprocal_rank_fusion
+from app.services.search_filters import SearchFilter
+from app.services.text_splitter import split_text
+from app.services.vector_store import VectorStore, FAISS_AVAILABLE
 
-# Try to import optional dependencies
-try:
-    from langchain.text_splitter import RecursiveCharacterTextSplitter
-    from langchain_openai import OpenAIEmbeddings
-    from langchain_community.vectorstores import FAISS
-    from langchain.schema import Document as LangChainDocument
-    LANGCHAIN_AVAILABLE = True
-except ImportError:
-    LANGCHAIN_AVAILABLE = False
-    print("⚠️  LangChain not installed - document search will use simple text matching")
+if not FAISS_AVAILABLE:
+    print("⚠️  FAISS not installed - document search will use keyword (BM25) matching")
 
 from app.core.config import settings
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+# progress(stage, fraction, **details) - see IngestionJob.update_stage
+ProgressCallback = Callable[..., None]
+
+# Text splitter settings (characters)
+CHUNK_SIZE = 1000
+CHUNK_OVERLAP = 200
+
+# Owner lock files of processes that exited are swept once this old (a
+# brand-new process may not have locked its file yet)
+OWNER_LOCK_MIN_AGE_SECONDS = 60
+
+# How search_documents can find chunks (see RETRIEVAL_MODE in config)
+RETRIEVAL_MODES = ("vector", "lexical", "hybrid")
+
 class DocumentService:
     """
     Service to handle document upload and processing
@@ -44,64 +64,218 @@ class DocumentService:
     
     def __init__(self):
         """Initialize the document service"""
-        global LANGCHAIN_AVAILABLE
         self.upload_dir = "uploads"
         self.vector_store_dir = "vector_store"
         self.document_store_path = os.path.join(self.vector_store_dir, "documents.json")
+        self.metadata_db_path = os.path.join(self.vector_store_dir, "documents.db")
         
         # Create directories if they don't exist
         os.makedirs(self.upload_dir, exist_ok=True)
         os.makedirs(self.vector_store_dir, exist_ok=True)
         
-        # Initialize embeddings and vector store if LangChain is available
-        if LANGCHAIN_AVAILABLE:
+        # This process's owner ID, written on the pending rows of its ingests.
+        # We hold its lock file until we exit, so other processes (and the
+        # next startup) can tell our unfinished ingests from crashed ones
+        self.owner_id = uuid.uuid4().hex
+        self.owners_dir = os.path.join(self.vector_store_dir, "ingest-owners")
+        os.makedirs(self.owners_dir, exist_ok=True)
+        self._owner_lock = FileLock(self._owner_lock_path(self.owner_id))
+        self._owner_lock.acquire()
+        
+        # Initialize embeddings and vector store if FAISS is available
+        self.embeddings = None
+        self.vector_store: Optional[VectorStore] = None
+        if FAISS_AVAILABLE:
             try:
-                self.embeddings = OpenAIEmbeddings(
-                    openai_api_key=settings.OPENAI_API_KEY
+                backend = create_embedding_backend(
+                    settings.EMBEDDING_MODEL,
+                    settings.OPENAI_API_KEY,
+                    local_dim=settings.LOCAL_EMBEDDING_DIM,
+                    requests_per_minute=settings.EMBEDDING_REQUESTS_PER_MINUTE,
+                    tokens_per_minute=settings.EMBEDDING_TOKENS_PER_MINUTE,
+                    max_retries=settings.EMBEDDING_MAX_RETRIES
+                )
+                self.embeddings = EmbeddingService(
+                    backend,
+                    cache=EmbeddingCache(os.path.join(self.vector_store_dir, "embeddings.db")),
+                    batch_tokens=settings.EMBEDDING_BATCH_TOKENS,
+                    concurrency=settings.EMBEDDING_CONCURRENCY,
+                    query_cache_size=settings.QUERY_CACHE_SIZE,
+                    query_cache_ttl=settings.QUERY_CACHE_TTL_SECONDS,
+                    persist_query_cache=settings.QUERY_CACHE_PERSIST,
+                    persisted_queries_max=settings.QUERY_CACHE_PERSIST_SIZE
                 )
-                self.vector_store: Optional[FAISS] = None
                 self._load_vector_store()
-                logger.info("✅ Document Service initialized with FAISS")
+                logger.info(f"✅ Document Service initialized with FAISS ({self.embeddings.model} embeddings)")
             except Exception as e:
                 logger.warning(f"⚠️  Could not initialize FAISS: {e}")
                 self.vector_store = None
-                LANGCHAIN_AVAILABLE = False
         else:
-            self.vector_store = None
-            logger.info("✅ Document Service initialized (without FAISS - using simple text search)")
+            logger.info("✅ Document Service initialized (without FAISS - using keyword search)")
+        
+        # Extracted text, chunks and embeddings, filed by content hash. An
+        # entry is deleted with the last document using it; this lock makes
+        # that check and an ingest's claim on the entry take turns
+        self.content_cache = ContentCache(os.path.join(self.vector_store_dir, "content"))
+        self._content_lock = FileLock(os.path.join(self.vector_store_dir, "content.lock"))
         
-        # Load document metadata
-        self.documents_metadata = self._load_documents_metadata()
+        # Document metadata (one SQLite row per document, text stays in the content cache)
+        self.metadata_store = MetadataStore(self.metadata_db_path)
+        self._migrate_documents_json()
+        
+        # BM25 keyword index over chunks (works without FAISS or an API key).
+        # Its postings are loaded in the background, so startup doesn't
+        # wait for them; keyword searches do. It keeps no chunk text -
+        # results are read back with _read_chunks.
+        self.lexical_index = LexicalIndex(
+            os.path.join(self.vector_store_dir, "lexical"),
+            self._read_chunks,
+            compact_ratio=settings.LEXICAL_COMPACT_RATIO
+        )
+        threading.Thread(target=self._load_lexical_index, name="lexical-index-load", daemon=True).start()
+        
+        # Runs the vector leg of hybrid searches next to the keyword leg
+        self._search_pool = ThreadPoolExecutor(
+            max_workers=settings.SEARCH_THREAD_WORKERS,
+            thread_name_prefix="search"
+        )
     
-    def _load_documents_metadata(self) -> dict:
-        """Load document metadata from JSON file"""
-        if os.path.exists(self.document_store_path):
-            try:
-                with open(self.document_store_path, 'r') as f:
-                    return json.load(f)
-            except:
-                return {}
-        return {}
+    def _migrate_documents_json(self):
+        """
+        Move documents from the old documents.json file into SQLite
+        
+        The old file kept every document's full text inline. The text now
+        goes to the content cache and only the small fields become rows.
+        """
+        if not os.path.exists(self.document_store_path):
+            return
+        
+        try:
+            with open(self.document_store_path, 'r') as f:
+                documents = json.load(f)
+        except Exception as e:
+            logger.warning(f"Could not read {self.document_store_path}: {e}")
+            return
+        
+        for doc_id, info in documents.items():
+            if self.metadata_store.get_document(doc_id) is not None:
+                continue
+            
+            text = info.get("text", "")
+            content_hash = info.get("content_hash")
+            upload_path = os.path.join(self.upload_dir, info["filename"])
+            if not content_hash:
+                if os.path.exists(upload_path):
+                    content_hash = hash_file(upload_path)
+                else:
+                    content_hash = hashlib.sha256(text.encode("utf-8")).hexdigest()
+            
+            if self.content_cache.get_text(content_hash) is None:
+                self.content_cache.put_text(content_hash, text, info.get("pages"), [])
+            
+            self.metadata_store.add_document(
+                doc_id,
+                info["filename"],
+                content_hash,
+                info.get("pages"),
+                info.get("chunks", 0),
+                info.get("total_chars", len(text)),
+                stored_filename=info["filename"] if os.path.exists(upload_path) else None
+            )
+            for alias in info.get("aliases", []):
+                self.metadata_store.add_alias(doc_id, alias)
+        
+        os.replace(self.document_store_path, self.document_store_path + ".migrated")
+        logger.info(f"✅ Migrated {len(documents)} documents from documents.json to SQLite")
+    
+    def _load_lexical_index(self):
+        """Rebuild the keyword index from its log, then add any missing documents"""
+        self.lexical_index.load()
+        try:
+            self._backfill_lexical_index()
+        except Exception as e:
+            logger.warning(f"⚠️  Could not backfill the keyword index: {e}")
     
-    def _save_documents_metadata(self):
-        """Save document metadata to JSON file"""
-        with open(self.document_store_path, 'w') as f:
-            json.dump(self.documents_metadata, f, indent=2)
+    def _backfill_lexical_index(self):
+        """
+        Add documents ingested before the keyword index existed
+        
+        Their chunks come from the content cache (or are split again from
+        the cached text), so this never re-reads the original files.
+        """
+        added = 0
+        for document in self.metadata_store.list_documents():
+            if self.lexical_index.has_document(document["id"]) or not document["content_hash"]:
+                continue
+            cached = self.content_cache.get_text(document["content_hash"])
+            if cached is None or not cached["text"].strip():
+                continue
+            chunk_records, _ = self._get_chunks(document["content_hash"], cached["text"], cached["page_starts"])
+            self.lexical_index.add(self._chunk_records(chunk_records, document["filename"], document["id"]))
+            added += 1
+        if added:
+            logger.info(f"✅ Added {added} existing documents to the keyword index")
     
     def _load_vector_store(self):
-        """Load existing vector store if available"""
-        vector_store_path = os.path.join(self.vector_store_dir, "faiss_index")
-        if os.path.exists(vector_store_path):
-            try:
-                self.vector_store = FAISS.load_local(
-                    vector_store_path, 
-                    self.embeddings,
-                    allow_dangerous_deserialization=True
-                )
-                logger.info("Loaded existing vector store")
-            except Exception as e:
-                logger.warning(f"Could not load vector store: {e}")
-                self.vector_store = None
+        """
+        Load existing vector store (base + segments) if available
+        
+        Vectors from different embedding models can't be compared, so every
+        model gets its own index folder: vector_store/index/<model>/.
+        Switching EMBEDDING_MODEL just starts (or reopens) another index.
+        """
+        index_root = os.path.join(self.vector_store_dir, "index")
+        index_dir = os.path.join(index_root, re.sub(r"[^A-Za-z0-9._-]+", "_", self.embeddings.model))
+        
+        self.vector_store = VectorStore(
+            index_dir,
+            merge_segments=settings.VECTOR_STORE_MERGE_SEGMENTS,
+            index_type=settings.VECTOR_INDEX_TYPE,
+            promote_at=settings.VECTOR_INDEX_PROMOTE_AT,
+            nprobe=settings.VECTOR_IVF_NPROBE,
+            hnsw_m=settings.VECTOR_HNSW_M,
+            ef_construction=settings.VECTOR_HNSW_EF_CONSTRUCTION,
+            ef_search=settings.VECTOR_HNSW_EF_SEARCH,
+            compact_ratio=settings.VECTOR_STORE_COMPACT_RATIO,
+            quantization=settings.VECTOR_QUANTIZATION,
+            pq_m=settings.VECTOR_PQ_M,
+            rerank_factor=settings.VECTOR_RERANK_FACTOR,
+            delta_max=settings.VECTOR_DELTA_MAX
+        )
+        self.vector_store.load()
+        if not self.embeddings.is_local:
+            self._migrate_legacy_index()
+    
+    def _migrate_legacy_index(self):
+        """
+        Import an old LangChain `faiss_index` folder into the new vector store
+        
+        Older versions saved the whole index with FAISS.save_local. We copy
+        its vectors and chunks over once, then rename the old folder.
+        """
+        legacy_path = os.path.join(self.vector_store_dir, "faiss_index")
+        if not os.path.exists(legacy_path) or self.vector_store.count > 0:
+            return
+        
+        try:
+            from langchain_community.vectorstores import FAISS
+            legacy = FAISS.load_local(
+                legacy_path,
+                self.embeddings,
+                allow_dangerous_deserialization=True
+            )
+            total = legacy.index.ntotal
+            vectors = legacy.index.reconstruct_n(0, total)
+            records = []
+            for i in range(total):
+                doc = legacy.docstore.search(legacy.index_to_docstore_id[i])
+                records.append({"text": doc.page_content, "metadata": dict(doc.metadata)})
+            
+            self.vector_store.add(records, vectors)
+            os.rename(legacy_path, legacy_path + ".migrated")
+            logger.info(f"✅ Migrated {total} chunks from the old faiss_index folder")
+        except Exception as e:
+            logger.warning(f"Could not migrate old vector store: {e}")
     
     def extract_text_from_pdf(self, file_path: str) -> Tuple[str, int]:
         """
@@ -109,21 +283,7 @@ class DocumentService:
         
         Returns: (text_content, number_of_pages)
         """
-        try:
-            with open(file_path, 'rb') as file:
-                pdf_reader = PyPDF2.PdfReader(file)
-                num_pages = len(pdf_reader.pages)
-                
-                text = ""
-                for page in pdf_reader.pages:
-                    text += page.extract_text() + "\n"
-                
-                logger.info(f"Extracted {len(text)} characters from {num_pages} pages")
-                return text, num_pages
-                
-        except Exception as e:
-            logger.error(f"Error reading PDF: {str(e)}")
-            raise Exception(f"Failed to read PDF: {str(e)}")
+        return text_extraction.extract_text_from_pdf(file_path)
     
     def extract_text_from_docx(self, file_path: str) -> str:
         """
@@ -131,15 +291,7 @@ class DocumentService:
         
         Returns: text_content
         """
-        try:
-            doc = Document(file_path)
-            text = "\n".join([paragraph.text for paragraph in doc.paragraphs])
-            logger.info(f"Extracted {len(text)} characters from DOCX")
-            return text
-            
-        except Exception as e:
-            logger.error(f"Error reading DOCX: {str(e)}")
-            raise Exception(f"Failed to read DOCX: {str(e)}")
+        return text_extraction.extract_text_from_docx(file_path)
     
     def extract_text_from_txt(self, file_path: str) -> str:
         """
@@ -147,164 +299,738 @@ class DocumentService:
         
         Returns: text_content
         """
+        return text_extraction.extract_text_from_txt(file_path)
+    
+    def extract_pages_from_pdf(
+        self,
+        file_path: str,
+        executor: Optional[Executor] = None,
+        progress: Optional[ProgressCallback] = None
+    ) -> List[Tuple[int, str]]:
+        """
+        Extract PDF text page by page, in parallel when a process pool is given
+        
+        Returns: List of (page_number, page_text), page numbers start at 1
+        """
+        on_progress = None
+        if progress:
+            on_progress = lambda done, total: progress("extracting", done / max(total, 1), pages=total)
+        
+        return text_extraction.extract_pdf_pages(
+            file_path,
+            executor=executor,
+            pages_per_task=settings.PDF_PAGES_PER_TASK,
+            min_parallel_pages=settings.PDF_PARALLEL_MIN_PAGES,
+            on_progress=on_progress
+        )
+    
+    def _extract_text(
+        self,
+        file_path: str,
+        file_ext: str,
+        executor: Optional[Executor] = None,
+        progress: Optional[ProgressCallback] = None
+    ) -> Tuple[str, Optional[int], List[int]]:
+        """
+        Extract text, optionally using worker processes
+        
+        Parsing a big PDF is pure CPU work. When the ingestion queue passes a
+        process pool we run it there (PDF page ranges are spread over all the
+        workers), so the web server's own process stays free to answer chats.
+        
+        Returns:
+            (text_content, number_of_pages, page_starts) where page_starts[i]
+            is the character offset where page i+1 begins (empty for non-PDFs)
+        """
+        if file_ext == '.pdf':
+            page_starts = []
+            parts = []
+            offset = 0
+            for _, page_text in self.extract_pages_from_pdf(file_path, executor, progress):
+                page_starts.append(offset)
+                parts.append(page_text + "\n")
+                offset += len(page_text) + 1
+            return "".join(parts), len(page_starts), page_starts
+        
+        if executor is not None:
+            text, pages = executor.submit(text_extraction.extract_text, file_path, file_ext).result()
+        else:
+            text, pages = text_extraction.extract_text(file_path, file_ext)
+        return text, pages, []
+    
+    def _chunk_pages(self, text: str, chunks: List[str], page_starts: List[int]) -> List[Optional[int]]:
+        """
+        Work out which page each chunk starts on
+        
+        Chunks come out of the splitter in order, so we just search forward
+        from the previous chunk's position and look the offset up in page_starts.
+        """
+        if not page_starts:
+            return [None] * len(chunks)
+        
+        pages = []
+        cursor = 0
+        for chunk in chunks:
+            position = text.find(chunk, cursor)
+            if position == -1:
+                position = cursor
+            else:
+                cursor = position + 1
+            pages.append(bisect.bisect_right(page_starts, position))
+        return pages
+    
+    def _get_chunks(self, content_hash: str, text: str, page_starts: List[int]) -> Tuple[List[dict], bool]:
+        """
+        Chunks for this content, from the content cache or freshly split
+        
+        Returns: ([{"text": ..., "page": ...}, ...], came_from_cache)
+        """
+        chunk_records = self.content_cache.get_chunks(content_hash, CHUNK_SIZE, CHUNK_OVERLAP)
+        if chunk_records is not None:
+            return chunk_records, True
+        
+        chunk_texts = split_text(text, CHUNK_SIZE, CHUNK_OVERLAP)
+        chunk_records = [
+            {"text": chunk, "page": page}
+            for chunk, page in zip(chunk_texts, self._chunk_pages(text, chunk_texts, page_starts))
+        ]
+        self.content_cache.put_chunks(content_hash, CHUNK_SIZE, CHUNK_OVERLAP, chunk_records)
+        return chunk_records, False
+    
+    def _chunk_records(self, chunk_records: List[dict], filename: str, doc_id: str) -> List[dict]:
+        """Turn cached chunks into index records: {"text", "metadata"}"""
+        records = []
+        for i, record in enumerate(chunk_records):
+            metadata = {
+                "source": filename,
+                "doc_id": doc_id,
+                "chunk_index": i
+            }
+            if record["page"] is not None:
+                metadata["page"] = record["page"]
+            records.append({"text": record["text"], "metadata": metadata})
+        return records
+    
+    def _read_chunks(self, places: List[Tuple[str, int]]) -> List[Optional[dict]]:
+        """
+        Index records for chunks given as (doc_id, chunk_index), read from disk
+        
+        The vector store's mapped files are tried first (one line each);
+        documents without vectors fall back to their cached chunk list,
+        read once per document. Gone documents give None.
+        """
+        records = []
+        documents = {}
+        for doc_id, chunk_index in places:
+            record = None
+            if self.vector_store is not None:
+                record = self.vector_store.get_document_chunk(doc_id, chunk_index)
+            if record is None:
+                if doc_id not in documents:
+                    documents[doc_id] = self._cached_chunk_records(doc_id)
+                cached = documents[doc_id]
+                if cached is not None and chunk_index < len(cached):
+                    record = cached[chunk_index]
+            records.append(record)
+        return records
+    
+    def _cached_chunk_records(self, doc_id: str) -> Optional[List[dict]]:
+        """All of a document's index records, rebuilt from the content cache (None if unknown)"""
+        document = self.metadata_store.get_document(doc_id)
+        if document is None or not document["content_hash"]:
+            return None
+        chunk_records = self.content_cache.get_chunks(document["content_hash"], CHUNK_SIZE, CHUNK_OVERLAP)
+        if chunk_records is None:
+            cached = self.content_cache.get_text(document["content_hash"])
+            if cached is None:
+                return None
+            chunk_records, _ = self._get_chunks(document["content_hash"], cached["text"], cached["page_starts"])
+        return self._chunk_records(chunk_records, document["filename"], doc_id)
+    
+    def get_document(self, doc_id: str) -> Optional[dict]:
+        """Metadata for one document (without its text), or None"""
+        return self.metadata_store.get_document(doc_id)
+    
+    def get_document_text(self, doc_id: str) -> Optional[str]:
+        """
+        Full extracted text of a document
+        
+        The text is read from the content cache only when asked for, so it
+        never has to sit in memory for every document.
+        """
+        document = self.metadata_store.get_document(doc_id)
+        if document is None or not document["content_hash"]:
+            return None
+        cached = self.content_cache.get_text(document["content_hash"])
+        return cached["text"] if cached else None
+    
+    def delete_document(self, doc_id: str) -> bool:
+        """
+        Delete a document everywhere: indexes, metadata, cache and upload
+        
+        Its chunks drop out of search immediately (the vector index just
+        marks them deleted; a background compaction removes them later).
+        The indexes go first and the metadata last, so the corpus version
+        only changes once searches can no longer see the document.
+        
+        Returns:
+            False if there is no such document
+        """
+        document = self.metadata_store.get_document(doc_id)
+        if document is None:
+            return False
+        
+        if self.vector_store is not None:
+            self.vector_store.delete_document(doc_id)
+        self.lexical_index.delete_document(doc_id)
+        self.metadata_store.delete_document(doc_id)
+        
+        # Other documents may still use the same bytes - including ones
+        # still being ingested (see process_document). Documents migrated
+        # from documents.json can share a file too
+        if document["content_hash"]:
+            with self._content_lock:
+                if not self.metadata_store.has_hash(document["content_hash"]):
+                    self.content_cache.delete(document["content_hash"])
+        stored_filename = document["stored_filename"]
+        if stored_filename and not self.metadata_store.has_stored_file(stored_filename):
+            upload_path = os.path.join(self.upload_dir, stored_filename)
+            if os.path.exists(upload_path):
+                os.remove(upload_path)
+        
+        logger.info(f"🗑️  Deleted document {doc_id} ({document['filename']})")
+        return True
+    
+    def _owner_lock_path(self, owner_id: str) -> str:
+        return os.path.join(self.owners_dir, f"{owner_id}.lock")
+    
+    def owner_alive(self, owner_id: str) -> bool:
+        """True while the process with this owner ID is still running (it holds its owner lock)"""
+        if owner_id == self.owner_id:
+            return True
+        owner_lock = FileLock(self._owner_lock_path(owner_id))
+        if not owner_lock.acquire(blocking=False):
+            return True
+        owner_lock.release()
+        return False
+    
+    def recover_interrupted_ingests(self):
+        """
+        Remove documents whose ingest was cut off by a crash
+        
+        A pending row names the process that wrote it, which holds its
+        owner lock until it exits. If we can take that lock, the process is
+        gone and its half-indexed chunks are removed; rows of processes
+        still running (other server workers in the middle of an ingest)
+        are left alone. The server calls this once, from its startup hook.
+        """
+        for document in self.metadata_store.pending_documents():
+            owner = document["owner"]
+            if owner == self.owner_id:
+                continue
+            owner_lock = FileLock(self._owner_lock_path(owner)) if owner else None
+            if owner_lock is not None and not owner_lock.acquire(blocking=False):
+                continue
+            try:
+                logger.warning(f"⚠️  Removing document {document['id']} - its ingest never finished")
+                self._discard_document(document["id"])
+            finally:
+                if owner_lock is not None:
+                    owner_lock.release()
+        self._remove_stale_owner_locks()
+    
+    def _remove_stale_owner_locks(self):
+        """Delete the lock files of processes that have exited (one is left behind per process)"""
+        still_pending = {document["owner"] for document in self.metadata_store.pending_documents()}
+        for name in os.listdir(self.owners_dir):
+            owner = name[:-len(".lock")]
+            path = os.path.join(self.owners_dir, name)
+            if owner == self.owner_id or owner in still_pending:
+                continue
+            try:
+                if time.time() - os.path.getmtime(path) < OWNER_LOCK_MIN_AGE_SECONDS:
+                    continue
+                owner_lock = FileLock(path)
+                if owner_lock.acquire(blocking=False):
+                    try:
+                        os.remove(path)
+                    finally:
+                        owner_lock.release()
+            except OSError:
+                continue
+    
+    def _discard_document(self, doc_id: str):
+        """
+        Roll back a document that was never fully indexed
+        
+        Its chunks leave both indexes first and its pending row last, so if
+        this fails too, the row is still there for the next recovery to retry.
+        """
         try:
-            with open(file_path, 'r', encoding='utf-8') as file:
-                text = file.read()
-            logger.info(f"Extracted {len(text)} characters from TXT")
-            return text
-            
+            if self.vector_store is not None:
+                self.vector_store.delete_document(doc_id)
+            self.lexical_index.delete_document(doc_id)
+            self.metadata_store.delete_document(doc_id)
         except Exception as e:
-            logger.error(f"Error reading TXT: {str(e)}")
-            raise Exception(f"Failed to read TXT: {str(e)}")
+            logger.error(f"❌ Could not roll back document {doc_id} (retried at next startup): {e}")
+    
+    def find_document_by_hash(self, content_hash: str) -> Optional[str]:
+        """Return the ID of an already-processed document with these exact bytes"""
+        document = self.metadata_store.find_by_hash(content_hash)
+        return document["id"] if document else None
+    
+    def register_duplicate(self, content_hash: str, filename: str) -> Optional[dict]:
+        """
+        Handle a re-upload of content we already have (metadata only)
+        
+        If these bytes were processed before, we just remember the new
+        filename on the existing document - no extraction, no embeddings.
+        
+        Returns:
+            The existing document's info, or None if the content is new
+        """
+        document = self.metadata_store.find_by_hash(content_hash)
+        if document is None:
+            return None
+        
+        self.metadata_store.add_alias(document["id"], filename)
+        
+        logger.info(f"♻️  {filename} is a duplicate of document {document['id']} - skipping processing")
+        return {
+            "doc_id": document["id"],
+            "filename": document["filename"],
+            "pages": document["pages"],
+            "chunks": document["chunks"],
+            "total_chars": document["total_chars"],
+            "deduplicated": True
+        }
     
-    def process_document(self, file_path: str, filename: str) -> dict:
+    def process_document(
+        self,
+        file_path: str,
+        filename: str,
+        doc_id: Optional[str] = None,
+        progress: Optional[ProgressCallback] = None,
+        executor: Optional[Executor] = None,
+        content_hash: Optional[str] = None,
+        stored_filename: Optional[str] = None
+    ) -> dict:
         """
         Process uploaded document and add to vector store
         
+        The work happens in stages (extracting → chunking → embedding →
+        indexing) and each stage reports how far along it is through the
+        optional progress callback, which is what the job-status endpoint shows.
+        
+        Every stage first checks the content cache: text, chunks and
+        embeddings we already made for these exact bytes are reused.
+        
         Args:
             file_path: Path to the uploaded file
             filename: Original filename
+            doc_id: Pre-assigned document ID (a new one is generated if missing)
+            progress: Called as progress(stage, fraction) while working
+            executor: Process pool used for CPU-heavy text extraction
+            content_hash: SHA-256 of the file (computed here if not given)
+            stored_filename: Name the caller keeps the file under in uploads/
+                (recorded so deleting the document removes that file)
         
         Returns:
             Dictionary with document info
         """
+        report = progress or (lambda stage, fraction, **details: None)
+        
+        content_hash = content_hash or hash_file(file_path)
+        duplicate = self.register_duplicate(content_hash, filename)
+        if duplicate is not None:
+            for stage in ("extracting", "chunking", "embedding", "indexing"):
+                report(stage, 1.0, cached=True)
+            return duplicate
         
         # Get file extension
         file_ext = Path(filename).suffix.lower()
         
-        # Extract text based on file type
-        if file_ext == '.pdf':
-            text, pages = self.extract_text_from_pdf(file_path)
-        elif file_ext == '.docx':
-            text = self.extract_text_from_docx(file_path)
-            pages = None
-        elif file_ext == '.txt':
-            text = self.extract_text_from_txt(file_path)
-            pages = None
+        # Extract text based on file type (or reuse what we extracted before)
+        report("extracting", 0.0)
+        cached_text = self.content_cache.get_text(content_hash)
+        if cached_text is not None:
+            text, pages, page_starts = cached_text["text"], cached_text["pages"], cached_text["page_starts"]
         else:
-            raise Exception(f"Unsupported file type: {file_ext}")
+            text, pages, page_starts = self._extract_text(file_path, file_ext, executor, progress)
+        report("extracting", 1.0, characters=len(text), pages=pages, cached=cached_text is not None)
         
         # Generate unique document ID
-        doc_id = str(uuid.uuid4())
+        doc_id = doc_id or str(uuid.uuid4())
         
-        # Store document metadata
-        self.documents_metadata[doc_id] = {
-            "filename": filename,
-            "text": text,
-            "pages": pages,
-            "chunks": 0
-        }
+        # Store document metadata first (one row - the text goes to the
+        # content cache), as pending: it stays hidden until the indexes have
+        # every chunk, and if we crash before that the next startup finds it
+        # (by our owner lock being free) and removes the half-indexed chunks.
+        # Under the content lock, so deleting another document with these
+        # bytes can't drop the cache entry between the two (once the row
+        # exists, delete_document sees it and leaves the entry alone)
+        with self._content_lock:
+            if not self.content_cache.has_text(content_hash):
+                self.content_cache.put_text(content_hash, text, pages, page_starts)
+            self.metadata_store.add_document(
+                doc_id, filename, content_hash, pages, 0, len(text),
+                pending=True, owner=self.owner_id, stored_filename=stored_filename
+            )
         
-        # If LangChain is available, use advanced processing
-        if LANGCHAIN_AVAILABLE:
-            try:
+        chunk_count = 0
+        
+        try:
+            if text.strip():
                 # Split text into chunks
-                text_splitter = RecursiveCharacterTextSplitter(
-                    chunk_size=1000,
-                    chunk_overlap=200,
-                    length_function=len,
-                )
-                
-                chunks = text_splitter.split_text(text)
+                report("chunking", 0.0)
+                chunk_records, chunks_cached = self._get_chunks(content_hash, text, page_starts)
+                records = self._chunk_records(chunk_records, filename, doc_id)
+                chunks = [record["text"] for record in records]
                 logger.info(f"Split document into {len(chunks)} chunks")
+                report("chunking", 1.0, chunks=len(chunks), cached=chunks_cached)
                 
-                # Create LangChain documents with metadata
-                documents = [
-                    LangChainDocument(
-                        page_content=chunk,
-                        metadata={
-                            "source": filename,
-                            "doc_id": doc_id,
-                            "chunk_index": i
-                        }
-                    )
-                    for i, chunk in enumerate(chunks)
-                ]
-                
-                # Add to vector store (FAISS)
-                if self.vector_store is None:
-                    self.vector_store = FAISS.from_documents(documents, self.embeddings)
-                else:
-                    self.vector_store.add_documents(documents)
-                
-                # Save vector store to disk
-                vector_store_path = os.path.join(self.vector_store_dir, "faiss_index")
-                self.vector_store.save_local(vector_store_path)
-                logger.info("✅ Vector store updated and saved")
+                # Keyword index first: it needs no API, so the document is
+                # searchable even if embedding fails below
+                self.lexical_index.add(records)
+                chunk_count = len(chunks)
                 
-                self.documents_metadata[doc_id]["chunks"] = len(chunks)
-            except Exception as e:
-                logger.warning(f"⚠️  Could not create embeddings: {e}. Document saved but search will be limited.")
-                # Document is still saved, just without advanced search
-        
-        # Save metadata
-        self._save_documents_metadata()
+                # If FAISS is available, use advanced processing
+                if self.vector_store is not None:
+                    try:
+                        # Embed in concurrent batches; chunks embedded before (by any
+                        # document) come straight from the embedding cache. This is
+                        # network I/O, so it runs on this worker thread, not in a process.
+                        report("embedding", 0.0)
+                        vectors = self.embeddings.embed_documents(
+                            chunks,
+                            progress=lambda fraction, **stats: report("embedding", min(fraction, 0.99), **stats)
+                        )
+                        report("embedding", 1.0)
+                        
+                        # Add to vector store (FAISS). This appends one new segment,
+                        # so it costs the size of this document, not the whole index.
+                        report("indexing", 0.0)
+                        self.vector_store.add(records, vectors)
+                        logger.info("✅ Vector store updated and saved")
+                    except Exception as e:
+                        logger.warning(f"⚠️  Could not create embeddings: {e}. Document saved with keyword search only.")
+                        # Document is still saved and keyword-searchable, just without vector search
+            
+            self.metadata_store.mark_ready(doc_id, chunk_count)
+        except Exception:
+            self._discard_document(doc_id)
+            raise
+        report("indexing", 1.0)
         
         return {
             "doc_id": doc_id,
             "filename": filename,
             "pages": pages,
-            "chunks": self.documents_metadata[doc_id]["chunks"],
+            "chunks": chunk_count,
             "total_chars": len(text)
         }
     
-    def search_documents(self, query: str, top_k: int = 3) -> List[str]:
+    def build_filter(
+        self,
+        doc_ids: Optional[List[str]] = None,
+        filenames: Optional[List[str]] = None,
+        page_from: Optional[int] = None,
+        page_to: Optional[int] = None
+    ) -> Optional[SearchFilter]:
         """
-        Search uploaded documents for relevant information
+        Turn filter options from a request into a SearchFilter
+        
+        Filenames are looked up (including re-upload aliases) and merged with
+        doc_ids. Returns None when nothing is filtered.
+        """
+        if doc_ids is None and filenames is None and page_from is None and page_to is None:
+            return None
         
-        This uses FAISS if available, otherwise uses simple text search
+        allowed = None
+        if doc_ids is not None or filenames is not None:
+            allowed = set(doc_ids or [])
+            for filename in filenames or []:
+                allowed.update(document["id"] for document in self.metadata_store.find_by_filename(filename))
+        return SearchFilter(allowed, page_from, page_to)
+    
+    def _lexical_search(self, query: str, k: int, search_filter: Optional[SearchFilter] = None) -> List[dict]:
+        """Chunks that best match the query's words (BM25), best first"""
+        return [record for record, _ in self.lexical_index.search(query, k=k, search_filter=search_filter)]
+    
+    def retrieve(
+        self,
+        query: str,
+        top_k: int = 3,
+        mode: Optional[str] = None,
+        search_filter: Optional[SearchFilter] = None,
+        diversify: Optional[bool] = None
+    ) -> List[dict]:
+        """
+        Find the chunks most relevant to a query
+        
+        Modes:
+        - "vector": embedding similarity (FAISS) - good at meaning and paraphrases
+        - "lexical": BM25 keywords - good at exact terms like "M12" or part numbers
+        - "hybrid": both at once, merged with reciprocal rank fusion
+        
+        The two legs of a hybrid search run at the same time (the vector leg
+        on a worker thread), so it takes as long as the slower leg, not both.
+        If vector search isn't available or fails, keyword results are used.
+        
+        A filter is applied inside both indexes (see search_filters.py), so
+        a search scoped to one small manual still returns top_k chunks from it.
+        
+        With diversify, a larger pool of MMR_CANDIDATES chunks is fetched and
+        top_k of them picked by maximal marginal relevance (see diversity.py),
+        so overlapping near-copies of one passage don't fill the context.
         
         Args:
             query: User's question
-            top_k: Number of relevant chunks to return
+            top_k: Number of chunks to return
+            mode: One of RETRIEVAL_MODES (defaults to settings.RETRIEVAL_MODE)
+            search_filter: Only return chunks this filter allows (see build_filter)
+            diversify: Apply MMR (defaults to settings.RETRIEVAL_DIVERSIFY)
         
         Returns:
-            List of relevant text chunks
+            List of chunk records {"id", "text", "metadata"}, best first
+        """
+        return self.retrieve_many([query], top_k=top_k, mode=mode, search_filter=search_filter, diversify=diversify)[0]
+    
+    def retrieve_many(
+        self,
+        queries: List[str],
+        top_k: int = 3,
+        mode: Optional[str] = None,
+        search_filter: Optional[SearchFilter] = None,
+        diversify: Optional[bool] = None
+    ) -> List[List[dict]]:
         """
+        retrieve() for many queries at once (same options)
+        
+        All queries are embedded in one batched call and searched in FAISS
+        as one matrix, so a batch of questions costs far less than asking
+        them one by one. Keyword searches are cheap and run per query.
         
-        # If FAISS is available and initialized, use it
-        if LANGCHAIN_AVAILABLE and self.vector_store is not None:
+        Returns:
+            One list of chunk records per query, best first
+        """
+        mode = mode or settings.RETRIEVAL_MODE
+        if mode not in RETRIEVAL_MODES:
+            raise ValueError(f"Unknown retrieval mode '{mode}' (use one of {', '.join(RETRIEVAL_MODES)})")
+        if diversify is None:
+            diversify = settings.RETRIEVAL_DIVERSIFY
+        diversify = diversify and self.embeddings is not None
+        pool_size = max(top_k, settings.MMR_CANDIDATES) if diversify else top_k
+        
+        results = []
+        for query, scored in zip(queries, self._retrieve_candidates(queries, pool_size, mode, search_filter)):
+            if diversify and len(scored) > top_k:
+                try:
+                    scored = self._diversify(query, scored, top_k)
+                except Exception as e:
+                    logger.error(f"❌ Error diversifying results: {str(e)}")
+            results.append([record for record, _ in scored[:top_k]])
+        return results
+    
+    def _vector_search_many(
+        self,
+        queries: List[str],
+        k: int,
+        search_filter: Optional[SearchFilter] = None
+    ) -> List[List[dict]]:
+        """Chunks closest to each query embedding (one batched embed + FAISS call)"""
+        query_vectors = self.embeddings.embed_queries(queries)
+        return [
+            [record for record, _ in results]
+            for results in self.vector_store.search_many(query_vectors, k=k, search_filter=search_filter)
+        ]
+    
+    def _fused(self, result_lists: List[List[dict]], top_k: int) -> List[Tuple[dict, float]]:
+        """Best-first lists merged by reciprocal rank fusion, with their fused scores"""
+        return reciprocal_rank_fusion(result_lists, k=settings.RRF_K)[:top_k]
+    
+    def _retrieve_candidates(
+        self,
+        queries: List[str],
+        top_k: int,
+        mode: str,
+        search_filter: Optional[SearchFilter]
+    ) -> List[List[Tuple[dict, Optional[float]]]]:
+        """
+        The top_k chunks of one retrieval mode for each query, best first (see retrieve)
+        
+        Returns:
+            (record, fused rank score) pairs - the score is None for pure
+            vector results, which MMR ranks by embedding similarity instead
+        """
+        vector_ready = self.vector_store is not None and self.vector_store.count > 0
+        if mode == "lexical" or not vector_ready:
+            return [self._fused([self._lexical_search(query, top_k, search_filter)], top_k) for query in queries]
+        
+        if mode == "vector":
             try:
-                results = self.vector_store.similarity_search(query, k=top_k)
-                relevant_texts = [doc.page_content for doc in results]
-                logger.info(f"✅ Found {len(relevant_texts)} relevant chunks using FAISS")
-                return relevant_texts
+                return [
+                    [(record, None) for record in records]
+                    for records in self._vector_search_many(queries, top_k, search_filter)
+                ]
             except Exception as e:
                 logger.error(f"❌ Error with FAISS search: {str(e)}")
-                # Fall back to simple search
-        
-        # Simple text search (fallback)
-        logger.info("Using simple text search (FAISS not available)")
-        relevant_texts = []
-        
-        for doc_id, metadata in self.documents_metadata.items():
-            if 'text' in metadata:
-                text = metadata['text']
-                # Simple keyword matching
-                query_words = query.lower().split()
-                text_lower = text.lower()
-                
-                # Check if query words appear in text
-                matches = sum(1 for word in query_words if word in text_lower)
-                if matches > 0:
-                    # Extract relevant portion (approximate)
-                    relevant_texts.append(text[:1000])  # First 1000 chars
-                    
-        return relevant_texts[:top_k]
+                return [self._fused([self._lexical_search(query, top_k, search_filter)], top_k) for query in queries]
+        
+        # Hybrid: fetch deeper candidate lists so fusion has something to work with
+        depth = max(top_k, settings.HYBRID_CANDIDATES)
+        vector_future = self._search_pool.submit(self._vector_search_many, queries, depth, search_filter)
+        lexical_results = [self._lexical_search(query, depth, search_filter) for query in queries]
+        try:
+            vector_results = vector_future.result()
+        except Exception as e:
+            logger.error(f"❌ Error with FAISS search: {str(e)}")
+            return [self._fused([results], top_k) for results in lexical_results]
+        
+        return [
+            self._fused([vectors, lexical], top_k)
+            for vectors, lexical in zip(vector_results, lexical_results)
+        ]
+    
+    def _candidate_vectors(self, records: List[dict]):
+        """
+        Stored embeddings of some chunks, in the same order
+        
+        Read from the vector store's files by chunk ID (keyword results
+        are matched by document and position). Chunks without a stored
+        vector - documents whose embedding failed - come from the embedding cache.
+        """
+        chunk_ids = [None] * len(records)
+        if self.vector_store is not None:
+            for i, record in enumerate(records):
+                metadata = record.get("metadata", {})
+                if "doc_id" in metadata and "chunk_index" in metadata:
+                    chunk_ids[i] = self.vector_store.find_chunk_id(metadata["doc_id"], metadata["chunk_index"])
+                else:
+                    chunk_ids[i] = record.get("id")
+        
+        found = {}
+        wanted = [chunk_id for chunk_id in chunk_ids if chunk_id is not None]
+        if wanted:
+            found_ids, found_vectors = self.vector_store.get_vectors(wanted)
+            found = dict(zip(found_ids.tolist(), found_vectors))
+        
+        missing = [i for i, chunk_id in enumerate(chunk_ids) if chunk_id not in found]
+        embedded = self.embeddings.embed_documents([records[i]["text"] for i in missing]) if missing else []
+        vectors = [found.get(chunk_id) for chunk_id in chunk_ids]
+        for i, vector in zip(missing, embedded):
+            vectors[i] = vector
+        return vectors
+    
+    def _diversify(
+        self,
+        query: str,
+        scored: List[Tuple[dict, Optional[float]]],
+        top_k: int
+    ) -> List[Tuple[dict, Optional[float]]]:
+        """
+        Pick top_k of the candidates by maximal marginal relevance
+        
+        Relevance is the fused rank score of keyword and hybrid results, so
+        MMR only trades that ranking off against redundancy; pure vector
+        results use the cosine similarity to the query (from the query cache).
+        Candidate vectors are the ones stored at ingestion (see _candidate_vectors).
+        """
+        records = [record for record, _ in scored]
+        relevance = [score for _, score in scored]
+        query_vector = None
+        if None in relevance:
+            relevance = None
+            query_vector = self.embeddings.embed_query(query)
+        vectors = self._candidate_vectors(records)
+        chosen = mmr_select(query_vector, vectors, top_k, lambda_mult=settings.MMR_LAMBDA, relevance=relevance)
+        return [scored[i] for i in chosen]
+    
+    def search_documents(
+        self,
+        query: str,
+        top_k: int = 3,
+        mode: Optional[str] = None,
+        search_filter: Optional[SearchFilter] = None,
+        diversify: Optional[bool] = None
+    ) -> List[str]:
+        """
+        Search uploaded documents for relevant information
+        
+        See retrieve() for the retrieval modes (hybrid by default).
+        
+        Args:
+            query: User's question
+            top_k: Number of relevant chunks to return
+            mode: "vector", "lexical" or "hybrid" (defaults to settings.RETRIEVAL_MODE)
+            search_filter: Only search these documents/pages (see build_filter)
+            diversify: Drop near-duplicate chunks with MMR (see retrieve)
+        
+        Returns:
+            List of relevant text chunks
+        """
+        records = self.retrieve(query, top_k=top_k, mode=mode, search_filter=search_filter, diversify=diversify)
+        logger.info(f"✅ Found {len(records)} relevant chunks ({mode or settings.RETRIEVAL_MODE} search)")
+        return [record["text"] for record in records]
+    
+    def corpus_version(self) -> int:
+        """Changes whenever a document is added or removed (see MetadataStore.corpus_version)"""
+        return self.metadata_store.corpus_version()
+    
+    def get_stats(self) -> dict:
+        """Index sizes and cache counters (shown by GET /api/stats)"""
+        return {
+            "documents": self.metadata_store.count(),
+            "corpus_version": self.metadata_store.corpus_version(),
+            "lexical_chunks": self.lexical_index.count,
+            "vector_store": self.vector_store.stats() if self.vector_store is not None else None,
+            "embeddings": self.embeddings.stats() if self.embeddings is not None else None,
+        }
     
     def get_all_documents(self) -> List[str]:
         """
         Get list of all uploaded documents
         
         Returns:
-            List of filenames
+            List of filenames (the names they were uploaded under, not the
+            unique names their files are kept under in uploads/)
         """
         try:
-            files = os.listdir(self.upload_dir)
-            return [f for f in files if not f.startswith('.')]
+            # dict.fromkeys drops repeats but keeps the upload order
+            return list(dict.fromkeys(
+                filename
+                for document in self.metadata_store.list_documents()
+                for filename in [document["filename"]] + document["aliases"]
+            ))
         except Exception as e:
             logger.error(f"Error listing documents: {str(e)}")
             return []
 
-# Create singleton instance
-document_service = DocumentService()
+class LazyDocumentService:
+    """
+    The shared DocumentService, built the first time it is used
+    
+    Building it opens the vector store and the databases and starts
+    background threads, so it must not happen on import: the extraction
+    worker processes import the server's modules too (see
+    ingestion_service.py). The server builds it in its startup hook;
+    scripts get it on first use. Every attribute is the real service's.
+    """
+    
+    def __init__(self):
+        self._service: Optional[DocumentService] = None
+        self._lock = threading.Lock()
+    
+    def get(self) -> DocumentService:
+        """The service, built now if it doesn't exist yet"""
+        if self._service is None:
+            with self._lock:
+                if self._service is None:
+                    self._service = DocumentService()
+        return self._service
+    
+    def __getattr__(self, name):
+        return getattr(self.get(), name)
+
+# Create singleton instance (built on first use - see LazyDocumentService)
+document_service = LazyDocumentService()
@@ -0,0 +1,653 @@
+"""
+Embedding Service - Turning chunks into vectors (fast, and only once)
+=====================================================================
+Embedding is the slowest part of ingesting a manual, because every
+chunk has to go to the embeddings API. This service makes that cheaper:
+
+- Cache: every vector is saved in SQLite under (model, hash of the chunk
+  text). Re-ingesting a manual, or two manuals sharing boilerplate
+  pages, never pays for the same chunk twice
+- Batching: chunks are grouped into requests by token count, not a
+  fixed number, so each request is as full as the API allows
+- Concurrency: several batches are in flight at once...
+- ...under a rate limit (requests and tokens per minute), with retries
+  and exponential backoff when the API pushes back
+
+Where the vectors come from is a pluggable *backend*, picked by
+EMBEDDING_MODEL:
+- an OpenAI model name (e.g. "text-embedding-ada-002") calls the API
+- "local-hash" embeds on this machine with NumPy (hashed character
+  n-grams). No network, no API key, thousands of chunks per second, and
+  the same text always gets the same vector - handy for bulk backfills,
+  tests and benchmarks. It is also used when no API key is configured.
+"""
+
+import os
+import time
+import random
+import sqlite3
+import hashlib
+import threading
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, List, Optional, Tuple
+import logging
+
+from openai import OpenAI, RateLimitError, APIConnectionError, APITimeoutError, InternalServerError
+
+from app.services.openai_client import get_sync_http_client
+from app.services.single_flight import SingleFlight
+from app.services.ttl_cache import TTLCache
+
+# Try to import optional dependencies
+try:
+    import numpy as np
+    NUMPY_AVAILABLE = True
+except ImportError:
+    NUMPY_AVAILABLE = False
+
+try:
+    import tiktoken
+    TIKTOKEN_AVAILABLE = True
+except ImportError:
+    TIKTOKEN_AVAILABLE = False
+
+logger = logging.getLogger(__name__)
+
+# Errors worth retrying - everything else (bad key, bad input) fails right away
+RETRYABLE_ERRORS = (RateLimitError, APIConnectionError, APITimeoutError, InternalServerError)
+
+# OpenAI accepts at most this many inputs in one embeddings request
+MAX_INPUTS_PER_REQUEST = 2048
+
+# EMBEDDING_MODEL values that select the local hashing backend
+LOCAL_MODEL_PREFIX = "local"
+
+# Local backend: character n-gram sizes, and how many texts to hash per NumPy pass
+LOCAL_NGRAM_SIZES = (3, 4, 5)
+LOCAL_BATCH_SIZE = 512
+
+
+def chunk_hash(text: str) -> str:
+    """Cache key for a chunk's text"""
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+def normalize_query(query: str) -> str:
+    """Lowercase and collapse whitespace, so trivially different questions share a cache entry"""
+    return " ".join(query.lower().split())
+
+
+class EmbeddingCache:
+    """
+    Persistent (model, chunk hash) → vector cache in SQLite
+
+    Vectors are stored as raw float32 bytes, so reading one back is a
+    single copy with no parsing.
+
+    Question vectors live in a table of their own with the time they were
+    stored: unlike chunks, questions are endless and mostly asked once, so
+    that table is trimmed by age and by size.
+    """
+
+    def __init__(self, db_path: str):
+        os.makedirs(os.path.dirname(db_path) or ".", exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(db_path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS embeddings ("
+            " model TEXT NOT NULL,"
+            " chunk_hash TEXT NOT NULL,"
+            " vector BLOB NOT NULL,"
+            " PRIMARY KEY (model, chunk_hash)"
+            ") WITHOUT ROWID"
+        )
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS queries ("
+            " model TEXT NOT NULL,"
+            " query_hash TEXT NOT NULL,"
+            " vector BLOB NOT NULL,"
+            " stored_at REAL NOT NULL,"
+            " PRIMARY KEY (model, query_hash)"
+            ")"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS queries_stored_at ON queries (stored_at)")
+
+    def get_many(self, model: str, hashes: List[str]) -> Dict[str, "np.ndarray"]:
+        """Look up many chunks at once; missing ones are simply absent from the result"""
+        found = {}
+        with self._lock:
+            # SQLite limits how many ? placeholders one statement may have
+            for start in range(0, len(hashes), 500):
+                batch = hashes[start:start + 500]
+                rows = self._conn.execute(
+                    f"SELECT chunk_hash, vector FROM embeddings WHERE model = ? "
+                    f"AND chunk_hash IN ({','.join('?' * len(batch))})",
+                    [model, *batch]
+                ).fetchall()
+                for key, blob in rows:
+                    found[key] = np.frombuffer(blob, dtype=np.float32)
+        return found
+
+    def put_many(self, model: str, items: Dict[str, "np.ndarray"]):
+        """Store vectors for many chunks in one transaction"""
+        with self._lock, self._conn:
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO embeddings (model, chunk_hash, vector) VALUES (?, ?, ?)",
+                [
+                    (model, key, np.asarray(vector, dtype=np.float32).tobytes())
+                    for key, vector in items.items()
+                ]
+            )
+
+    def get_queries(self, model: str, hashes: List[str], max_age: float) -> Dict[str, "np.ndarray"]:
+        """Look up question vectors stored less than max_age seconds ago (0 = any age)"""
+        oldest = time.time() - max_age if max_age else 0.0
+        found = {}
+        with self._lock:
+            for start in range(0, len(hashes), 500):
+                batch = hashes[start:start + 500]
+                rows = self._conn.execute(
+                    f"SELECT query_hash, vector FROM queries WHERE model = ? AND stored_at >= ? "
+                    f"AND query_hash IN ({','.join('?' * len(batch))})",
+                    [model, oldest, *batch]
+                ).fetchall()
+                for key, blob in rows:
+                    found[key] = np.frombuffer(blob, dtype=np.float32)
+        return found
+
+    def put_queries(self, model: str, items: Dict[str, "np.ndarray"], max_age: float, max_rows: int):
+        """
+        Store question vectors, then drop the expired ones and the oldest
+        beyond max_rows (0 = no limit)
+        """
+        now = time.time()
+        with self._lock, self._conn:
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO queries (model, query_hash, vector, stored_at) VALUES (?, ?, ?, ?)",
+                [
+                    (model, key, np.asarray(vector, dtype=np.float32).tobytes(), now)
+                    for key, vector in items.items()
+                ]
+            )
+            if max_age:
+                self._conn.execute("DELETE FROM queries WHERE stored_at < ?", (now - max_age,))
+            if max_rows:
+                self._conn.execute(
+                    "DELETE FROM queries WHERE rowid IN ("
+                    " SELECT rowid FROM queries ORDER BY stored_at DESC LIMIT -1 OFFSET ?"
+                    ")",
+                    (max_rows,)
+                )
+
+
+class RateLimiter:
+    """
+    Token-bucket limiter for requests per minute and tokens per minute
+
+    acquire() blocks until both buckets have room, so any number of
+    worker threads can share one limiter.
+    """
+
+    def __init__(self, requests_per_minute: int, tokens_per_minute: int):
+        self.request_capacity = float(requests_per_minute)
+        self.token_capacity = float(tokens_per_minute)
+        self.requests = self.request_capacity
+        self.tokens = self.token_capacity
+        self.updated_at = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _refill(self):
+        now = time.monotonic()
+        elapsed_minutes = (now - self.updated_at) / 60.0
+        self.requests = min(self.request_capacity, self.requests + elapsed_minutes * self.request_capacity)
+        self.tokens = min(self.token_capacity, self.tokens + elapsed_minutes * self.token_capacity)
+        self.updated_at = now
+
+    def acquire(self, tokens: int):
+        """Wait until one request costing `tokens` tokens is allowed"""
+        # A single batch bigger than a whole minute's budget could never fit
+        tokens = min(tokens, self.token_capacity)
+        while True:
+            with self._lock:
+                self._refill()
+                if self.requests >= 1 and self.tokens >= tokens:
+                    self.requests -= 1
+                    self.tokens -= tokens
+                    return
+                # How long until both buckets have refilled enough
+                wait = max(
+                    (1 - self.requests) / self.request_capacity,
+                    (tokens - self.tokens) / self.token_capacity
+                ) * 60.0
+            time.sleep(max(wait, 0.01))
+
+
+class OpenAIEmbeddingBackend:
+    """
+    Embeddings from the OpenAI API
+
+    embed() is one API request, rate limited and retried with backoff.
+    """
+
+    is_local = False
+
+    def __init__(
+        self,
+        model: str,
+        api_key: str,
+        requests_per_minute: int = 3000,
+        tokens_per_minute: int = 1_000_000,
+        max_retries: int = 5
+    ):
+        self.name = model
+        self.max_retries = max_retries
+        # We do our own retries (with the rate limiter in the loop), so the client shouldn't.
+        # Pool limits and timeouts are the shared OPENAI_* settings (see openai_client.py)
+        self.client = OpenAI(
+            api_key=api_key,
+            max_retries=0,
+            timeout=get_sync_http_client().timeout,
+            http_client=get_sync_http_client()
+        )
+        self.rate_limiter = RateLimiter(requests_per_minute, tokens_per_minute)
+        self._encoding = None
+        if TIKTOKEN_AVAILABLE:
+            try:
+                self._encoding = tiktoken.encoding_for_model(model)
+            except Exception:
+                # Unknown model name, or the tokenizer files can't be downloaded
+                self._encoding = None
+
+    def count_tokens(self, text: str) -> int:
+        """Tokens in a piece of text (≈ 4 characters per token without tiktoken)"""
+        if self._encoding is not None:
+            return len(self._encoding.encode(text, disallowed_special=()))
+        return len(text) // 4 + 1
+
+    def embed(self, texts: List[str]) -> "np.ndarray":
+        """One embeddings request, with rate limiting and retries"""
+        tokens = sum(self.count_tokens(text) for text in texts)
+        for attempt in range(self.max_retries + 1):
+            self.rate_limiter.acquire(tokens)
+            try:
+                response = self.client.embeddings.create(model=self.name, input=texts)
+                data = sorted(response.data, key=lambda item: item.index)
+                return np.asarray([item.embedding for item in data], dtype=np.float32)
+            except RETRYABLE_ERRORS as e:
+                if attempt == self.max_retries:
+                    raise
+                # Exponential backoff with jitter, but respect Retry-After if the API sent one
+                delay = min(2 ** attempt, 30) * (0.5 + random.random())
+                response = getattr(e, "response", None)
+                retry_after = response.headers.get("retry-after") if response is not None else None
+                if retry_after:
+                    try:
+                        delay = max(delay, float(retry_after))
+                    except ValueError:
+                        pass
+                logger.warning(f"⚠️  Embeddings request failed ({e.__class__.__name__}), retrying in {delay:.1f}s")
+                time.sleep(delay)
+
+
+class HashingEmbeddingBackend:
+    """
+    Local embeddings from hashed character n-grams (NumPy only)
+
+    Every 3-, 4- and 5-character slice of the lowercased text is hashed
+    into one of `dim` buckets (with a hashed +/- sign so collisions tend
+    to cancel out). Counts are log-scaled and the vector is normalised to
+    length 1, so texts sharing many word pieces end up close together.
+
+    A whole batch of texts is hashed in a few array operations - there is
+    no Python loop over characters - and no model or network is needed.
+    """
+
+    is_local = True
+
+    def __init__(self, dim: int = 512):
+        if dim < 2:
+            raise ValueError("Local embedding size must be at least 2")
+        self.dim = dim
+        self.name = f"{LOCAL_MODEL_PREFIX}-hash-{dim}"
+        # Lowercase ASCII letters, keep digits and non-ASCII (UTF-8) bytes,
+        # turn punctuation and whitespace into a plain space
+        table = bytearray(range(256))
+        for byte in range(128):
+            char = chr(byte)
+            table[byte] = ord(char.lower()) if char.isalnum() else ord(" ")
+        self._table = bytes(table)
+
+    def count_tokens(self, text: str) -> int:
+        """Rough size of a text (only used to size batches)"""
+        return len(text) // 4 + 1
+
+    def _encode(self, texts: List[str]) -> Tuple["np.ndarray", "np.ndarray"]:
+        """
+        All texts as one byte array, each padded with a space on both sides
+
+        Returns: (bytes as uint64, row number of every byte)
+        """
+        encoded = [b" " + text.encode("utf-8").translate(self._table) + b" " for text in texts]
+        lengths = np.fromiter((len(item) for item in encoded), dtype=np.int64, count=len(encoded))
+        data = np.frombuffer(b"".join(encoded), dtype=np.uint8).astype(np.uint64)
+        rows = np.repeat(np.arange(len(texts), dtype=np.int64), lengths)
+        return data, rows
+
+    def embed(self, texts: List[str]) -> "np.ndarray":
+        """Embed a batch of texts; returns a (len(texts), dim) float32 array"""
+        counts = np.zeros(len(texts) * self.dim, dtype=np.float64)
+        if not texts:
+            return counts.reshape(0, self.dim).astype(np.float32)
+
+        data, rows = self._encode(texts)
+        with np.errstate(over="ignore"):
+            for n in LOCAL_NGRAM_SIZES:
+                if len(data) < n:
+                    continue
+                # Polynomial hash of every n-byte window (uint64 wraps around on overflow)
+                hashes = np.zeros(len(data) - n + 1, dtype=np.uint64)
+                for offset in range(n):
+                    hashes = hashes * np.uint64(1_000_003) + data[offset:len(data) - n + 1 + offset]
+                # Scramble the bits so nearby hashes land in unrelated buckets
+                hashes = (hashes + np.uint64(n)) * np.uint64(0x9E3779B97F4A7C15)
+                hashes ^= hashes >> np.uint64(29)
+
+                # Skip windows that run across the boundary between two texts
+                window_rows = rows[:len(hashes)]
+                keep = window_rows == rows[n - 1:]
+                hashes = hashes[keep]
+                window_rows = window_rows[keep]
+
+                buckets = (hashes % np.uint64(self.dim)).astype(np.int64)
+                signs = np.where((hashes >> np.uint64(63)) == 1, -1.0, 1.0)
+                counts += np.bincount(
+                    window_rows * self.dim + buckets,
+                    weights=signs,
+                    minlength=len(texts) * self.dim
+                )
+
+        vectors = counts.reshape(len(texts), self.dim)
+        vectors = np.sign(vectors) * np.log1p(np.abs(vectors))
+        norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+        norms[norms == 0] = 1.0
+        return (vectors / norms).astype(np.float32)
+
+
+def create_embedding_backend(
+    model: str,
+    api_key: str,
+    local_dim: int = 512,
+    requests_per_minute: int = 3000,
+    tokens_per_minute: int = 1_000_000,
+    max_retries: int = 5
+):
+    """
+    Pick the embedding backend for a model name
+
+    Args:
+        model: EMBEDDING_MODEL - "local-hash" (or anything starting with
+            "local") for the NumPy backend, otherwise an OpenAI model name
+        api_key: OpenAI API key; without one we fall back to the local backend
+        local_dim: Vector size of the local backend
+
+    Returns:
+        An OpenAIEmbeddingBackend or HashingEmbeddingBackend
+    """
+    if model.lower().startswith(LOCAL_MODEL_PREFIX):
+        return HashingEmbeddingBackend(local_dim)
+    if not api_key:
+        logger.warning(f"⚠️  No OpenAI API key - using local embeddings instead of {model}")
+        return HashingEmbeddingBackend(local_dim)
+    return OpenAIEmbeddingBackend(
+        model,
+        api_key,
+        requests_per_minute=requests_per_minute,
+        tokens_per_minute=tokens_per_minute,
+        max_retries=max_retries
+    )
+
+
+class EmbeddingService:
+    """
+    Batched, concurrent, cached embeddings on top of a backend
+
+    API backends get the full treatment (cache, token-sized batches,
+    several requests in flight). The local backend is faster than a cache
+    lookup, so its batches are simply computed in place.
+    """
+
+    def __init__(
+        self,
+        backend,
+        cache: EmbeddingCache,
+        batch_tokens: int = 50_000,
+        concurrency: int = 4,
+        query_cache_size: int = 2048,
+        query_cache_ttl: float = 86400,
+        persist_query_cache: bool = True,
+        persisted_queries_max: int = 100_000
+    ):
+        if not NUMPY_AVAILABLE:
+            raise ImportError("numpy is required for embeddings")
+        self.backend = backend
+        self.model = backend.name
+        self.cache = cache
+        self.batch_tokens = batch_tokens
+        self._pool = ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix="embed")
+        
+        # Normalized query → vector. Popular questions skip the API round trip.
+        self.query_cache = TTLCache(query_cache_size, query_cache_ttl)
+        # Also keep query vectors in SQLite so they survive restarts (same
+        # TTL, and at most persisted_queries_max of them)
+        self.persist_query_cache = persist_query_cache
+        self.persisted_queries_max = persisted_queries_max
+        self.query_cache_persistent_hits = 0
+        self._stats_lock = threading.Lock()
+        # Identical questions arriving together share one embeddings request
+        self.query_flight = SingleFlight()
+
+    @property
+    def is_local(self) -> bool:
+        """True when vectors are computed on this machine (no API calls)"""
+        return self.backend.is_local
+
+    def _make_batches(self, texts: List[str]) -> List[List[int]]:
+        """Group text positions into requests that stay under the token budget"""
+        batches = []
+        current = []
+        current_tokens = 0
+        for i, text in enumerate(texts):
+            tokens = self.backend.count_tokens(text)
+            if current and (current_tokens + tokens > self.batch_tokens or len(current) >= MAX_INPUTS_PER_REQUEST):
+                batches.append(current)
+                current = []
+                current_tokens = 0
+            current.append(i)
+            current_tokens += tokens
+        if current:
+            batches.append(current)
+        return batches
+
+    def _embed_local(self, texts: List[str], report: Callable[..., None]) -> "np.ndarray":
+        """Embed with the local backend in fixed-size batches (no cache needed)"""
+        started = time.perf_counter()
+        parts = []
+        for start in range(0, len(texts), LOCAL_BATCH_SIZE):
+            parts.append(self.backend.embed(texts[start:start + LOCAL_BATCH_SIZE]))
+            done = min(start + LOCAL_BATCH_SIZE, len(texts))
+            elapsed = time.perf_counter() - started
+            report(
+                done / len(texts),
+                cached=0,
+                embedded=done,
+                chunks_per_sec=round(done / elapsed, 1) if elapsed > 0 else 0.0
+            )
+        logger.info(f"Embedded {len(texts)} chunks locally in {time.perf_counter() - started:.2f}s")
+        return np.vstack(parts)
+
+    def embed_documents(
+        self,
+        texts: List[str],
+        progress: Optional[Callable[..., None]] = None
+    ) -> "np.ndarray":
+        """
+        Embed many chunks, reusing cached vectors
+
+        Args:
+            texts: Chunk texts
+            progress: Called as progress(fraction, **stats) as batches finish
+
+        Returns:
+            float32 array with one row per text, in the same order
+        """
+        report = progress or (lambda fraction, **stats: None)
+        if not texts:
+            return np.zeros((0, 0), dtype=np.float32)
+        if self.is_local:
+            return self._embed_local(texts, report)
+
+        started = time.perf_counter()
+        hashes = [chunk_hash(text) for text in texts]
+        positions = Counter(hashes)
+        vectors = self.cache.get_many(self.model, list(positions))
+        cached = sum(1 for key in hashes if key in vectors)
+
+        # Only embed each distinct missing text once
+        missing = {}
+        for key, text in zip(hashes, texts):
+            if key not in vectors and key not in missing:
+                missing[key] = text
+        missing_keys = list(missing)
+        missing_texts = [missing[key] for key in missing_keys]
+
+        done = cached
+        report(done / len(texts), cached=cached, embedded=0, chunks_per_sec=0.0)
+
+        if missing_texts:
+            batches = self._make_batches(missing_texts)
+            futures = [
+                (batch, self._pool.submit(self.backend.embed, [missing_texts[i] for i in batch]))
+                for batch in batches
+            ]
+            embedded = 0
+            for batch, future in futures:
+                try:
+                    batch_vectors = future.result()
+                except Exception:
+                    # Don't leave the other batches queued behind a failure
+                    for _, other in futures:
+                        other.cancel()
+                    raise
+                new_vectors = {
+                    missing_keys[i]: vector
+                    for i, vector in zip(batch, batch_vectors)
+                }
+                self.cache.put_many(self.model, new_vectors)
+                vectors.update(new_vectors)
+
+                embedded += len(batch)
+                done += sum(positions[key] for key in new_vectors)
+                elapsed = time.perf_counter() - started
+                report(
+                    min(done / len(texts), 1.0),
+                    cached=cached,
+                    embedded=embedded,
+                    chunks_per_sec=round(done / elapsed, 1) if elapsed > 0 else 0.0
+                )
+
+        elapsed = time.perf_counter() - started
+        report(
+            1.0,
+            cached=cached,
+            embedded=len(missing_texts),
+            chunks_per_sec=round(len(texts) / elapsed, 1) if elapsed > 0 else 0.0
+        )
+        logger.info(
+            f"Embedded {len(texts)} chunks in {elapsed:.2f}s "
+            f"({cached} from cache, {len(missing_texts)} new)"
+        )
+        return np.vstack([vectors[key] for key in hashes])
+
+    def embed_query(self, text: str) -> "np.ndarray":
+        """
+        Embed one search query, using the query cache
+        
+        Lookup order: in-memory LRU → SQLite cache (if persisted) → backend.
+        The local backend is cheaper than a lookup, so it skips the caches.
+        """
+        return self.embed_queries([text])[0]
+    
+    def embed_queries(self, texts: List[str]) -> "np.ndarray":
+        """
+        Embed many search queries, with one backend call for all the misses
+        
+        Same caches as embed_query; repeated questions are embedded once
+        (and a single new question being embedded by another request right
+        now is waited for, not embedded again - see single_flight.py).
+        
+        Returns:
+            float32 array with one row per query, in the same order
+        """
+        if self.is_local:
+            return self.backend.embed(texts)
+        
+        queries = [normalize_query(text) for text in texts]
+        vectors = {}
+        missing = []
+        for query in dict.fromkeys(queries):
+            vector = self.query_cache.get(query)
+            if vector is not None:
+                vectors[query] = vector
+            else:
+                missing.append(query)
+        
+        if len(missing) == 1:
+            # The usual case (one new question): identical questions asked
+            # at the same moment wait for one API call instead of each making one
+            query = missing[0]
+            vectors[query] = self.query_flight.do(query, lambda: self._embed_missing_queries(missing)[query])
+        elif missing:
+            vectors.update(self._embed_missing_queries(missing))
+        
+        return np.vstack([vectors[query] for query in queries])
+    
+    def _embed_missing_queries(self, missing: List[str]) -> Dict[str, "np.ndarray"]:
+        """Vectors for normalized queries not in the memory cache (SQLite cache → backend)"""
+        vectors = {}
+        keys = {chunk_hash(query): query for query in missing}
+        if self.persist_query_cache:
+            found = self.cache.get_queries(self.model, list(keys), self.query_cache.ttl_seconds)
+            for key, vector in found.items():
+                vectors[keys[key]] = vector
+            with self._stats_lock:
+                self.query_cache_persistent_hits += len(found)
+        new_keys = [key for key, query in keys.items() if query not in vectors]
+        new_vectors = {}
+        for batch in self._make_batches([keys[key] for key in new_keys]):
+            batch_vectors = self.backend.embed([keys[new_keys[i]] for i in batch])
+            new_vectors.update((new_keys[i], vector) for i, vector in zip(batch, batch_vectors))
+        if new_vectors and self.persist_query_cache:
+            self.cache.put_queries(
+                self.model, new_vectors, self.query_cache.ttl_seconds, self.persisted_queries_max
+            )
+        for key, vector in new_vectors.items():
+            vectors[keys[key]] = vector
+        for query in missing:
+            self.query_cache.put(query, vectors[query])
+        return vectors
+    
+    def stats(self) -> dict:
+        """Query cache counters for the stats endpoint"""
+        return {
+            "model": self.model,
+            "local": self.is_local,
+            "query_cache": dict(
+                self.query_cache.stats(),
+                persistent=self.persist_query_cache,
+                persistent_hits=self.query_cache_persistent_hits
+            ),
+            "query_single_flight": self.query_flight.stats()
+        }
@@ -0,0 +1,108 @@
+"""
+File Lock - A lock shared by threads AND processes
+==================================================
+threading.Lock only works inside one process. Several server workers
+(or a script running next to the server) use the same vector_store/
+folder, so some work has to take turns across processes too. This lock
+does both: a thread lock for the threads of this process, plus an
+operating-system lock on a small lock file for everyone else.
+
+The operating system drops the file lock when its process exits - even
+when it crashes - so a lock that can be taken also tells us that its
+last holder is gone.
+"""
+
+import os
+import time
+import threading
+from typing import Optional
+
+# Try to import the lock call for this platform
+try:
+    import fcntl
+    FCNTL_AVAILABLE = True
+except ImportError:
+    import msvcrt
+    FCNTL_AVAILABLE = False
+
+
+def _lock_file(fd: int, blocking: bool) -> bool:
+    """Lock an open file for this process; False if blocking=False and someone else holds it"""
+    if FCNTL_AVAILABLE:
+        try:
+            fcntl.flock(fd, fcntl.LOCK_EX if blocking else fcntl.LOCK_EX | fcntl.LOCK_NB)
+            return True
+        except BlockingIOError:
+            return False
+    # Windows: lock the first byte (LK_LOCK only retries for 10 seconds, so poll instead)
+    while True:
+        try:
+            msvcrt.locking(fd, msvcrt.LK_NBLCK, 1)
+            return True
+        except OSError:
+            if not blocking:
+                return False
+            time.sleep(0.05)
+
+
+def _unlock_file(fd: int):
+    if FCNTL_AVAILABLE:
+        fcntl.flock(fd, fcntl.LOCK_UN)
+    else:
+        os.lseek(fd, 0, os.SEEK_SET)
+        msvcrt.locking(fd, msvcrt.LK_UNLCK, 1)
+
+
+class FileLock:
+    """
+    Mutual exclusion across threads and processes, through a lock file
+
+    Use it like threading.Lock: `with lock:` or acquire()/release().
+    Not re-entrant. The lock file is created on first use and left in
+    place (deleting it while another process waits on it would let two
+    holders in at once).
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._thread_lock = threading.Lock()
+        self._fd: Optional[int] = None
+
+    def acquire(self, blocking: bool = True) -> bool:
+        """Take the lock; with blocking=False, return False instead of waiting"""
+        if not self._thread_lock.acquire(blocking):
+            return False
+        try:
+            fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o644)
+        except BaseException:
+            self._thread_lock.release()
+            raise
+        locked = False
+        try:
+            locked = _lock_file(fd, blocking)
+        finally:
+            if not locked:
+                os.close(fd)
+                self._thread_lock.release()
+        if locked:
+            self._fd = fd
+        return locked
+
+    def release(self):
+        fd, self._fd = self._fd, None
+        try:
+            _unlock_file(fd)
+        finally:
+            os.close(fd)
+            self._thread_lock.release()
+
+    def locked(self) -> bool:
+        """True while a thread of this process holds the lock"""
+        return self._fd is not None
+
+    def __enter__(self):
+        self.acquire()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.release()
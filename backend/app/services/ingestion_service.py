@@ -0,0 +1,422 @@
+"""
+Ingestion Service - Background processing of uploaded documents
+================================================================
+Parsing, chunking and embedding a 300-page manual takes a long time.
+If the upload endpoint did all of that itself, the whole server would
+freeze until it finished. Instead:
+
+1. The upload endpoint saves the file under a path of its own
+   (uploads/incoming/<job_id>_<filename>) and calls ingestion_service.submit()
+2. It immediately gets back a job with an ID
+3. The job runs on a small pool of worker threads; text extraction is
+   handed to worker processes because it is CPU heavy
+4. The frontend polls GET /api/documents/jobs/{id} to see progress. Each
+   job's status is also saved to vector_store/jobs.db as it changes
+   (see job_store.py), so with several server workers any of them can
+   answer the poll
+5. A finished upload is moved to uploads/<doc_id>_<filename>, a name
+   recorded on its metadata row; a failed one - or a re-upload of bytes
+   we already have - is deleted. Either way only this job's file is
+   touched, so two uploads with the same name never overwrite or delete
+   each other's file
+
+If an extraction worker process dies (a crash inside a PDF parser, the
+OOM killer), the pool is replaced and the job that hit it is retried once.
+"""
+
+import os
+import uuid
+import time
+import threading
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import Dict, Optional, Tuple
+import logging
+
+from app.core.config import settings
+from app.services.document_service import document_service
+from app.services.job_store import JobStore
+
+logger = logging.getLogger(__name__)
+
+# The order documents move through while being ingested
+STAGES = ("extracting", "chunking", "embedding", "indexing")
+
+# Progress updates are saved to the job store at most this often (stage
+# and status changes are always saved right away)
+JOB_SAVE_INTERVAL_SECONDS = 0.5
+
+
+class IngestionQueueFull(Exception):
+    """Raised when too many uploads are already waiting to be processed"""
+
+
+class IngestionJob:
+    """
+    One uploaded document moving through the ingestion stages
+
+    Worker threads update it while the API reads it, so every change
+    goes through a small lock.
+    """
+
+    def __init__(
+        self,
+        filename: str,
+        file_path: str,
+        content_hash: Optional[str] = None,
+        job_id: Optional[str] = None
+    ):
+        self.id = job_id or str(uuid.uuid4())
+        self.doc_id = str(uuid.uuid4())
+        self.filename = filename
+        self.file_path = file_path
+        self.content_hash = content_hash
+        self.status = "queued"  # queued → running → completed / failed
+        self.stages = {
+            stage: {"status": "pending", "progress": 0.0}
+            for stage in STAGES
+        }
+        self.result: Optional[dict] = None
+        self.error: Optional[str] = None
+        self.created_at = time.time()
+        self.started_at: Optional[float] = None
+        self.finished_at: Optional[float] = None
+        self._saved_at = 0.0
+        self._lock = threading.Lock()
+
+    def update_stage(self, stage: str, fraction: float, **details):
+        """
+        Record progress for one stage (this is the progress callback
+        DocumentService.process_document calls)
+
+        Args:
+            stage: One of STAGES
+            fraction: 0.0 when the stage starts, 1.0 when it is done
+            details: Extra numbers worth showing (chunks, pages, ...)
+        """
+        now = time.time()
+        with self._lock:
+            info = self.stages[stage]
+            if info["status"] == "pending":
+                info["status"] = "running"
+                info["started_at"] = now
+            info["progress"] = round(min(max(fraction, 0.0), 1.0), 4)
+            info.update(details)
+            if fraction >= 1.0:
+                info["status"] = "completed"
+                info["finished_at"] = now
+                info["duration_seconds"] = round(now - info["started_at"], 3)
+
+    def start(self):
+        """Mark the job running"""
+        with self._lock:
+            self.status = "running"
+            self.started_at = time.time()
+
+    def move_file(self, file_path: str):
+        """Record that the upload was moved to `file_path`"""
+        with self._lock:
+            self.file_path = file_path
+
+    def finish(self, result: dict):
+        """Mark the job completed with the document info it produced"""
+        with self._lock:
+            self.result = result
+            self.doc_id = result["doc_id"]
+            self.status = "completed"
+            self.finished_at = time.time()
+
+    def fail(self, error: str):
+        """Mark the job failed"""
+        with self._lock:
+            self.error = error
+            self.status = "failed"
+            self.finished_at = time.time()
+
+    def save_due(self, interval: float) -> bool:
+        """True (and the clock restarts) if the last save is at least `interval` seconds old"""
+        now = time.time()
+        with self._lock:
+            if now - self._saved_at < interval:
+                return False
+            self._saved_at = now
+            return True
+
+    def to_dict(self) -> dict:
+        """Snapshot of the job for the status endpoint"""
+        with self._lock:
+            return {
+                "job_id": self.id,
+                "doc_id": self.doc_id,
+                "filename": self.filename,
+                "status": self.status,
+                "stages": {stage: dict(info) for stage, info in self.stages.items()},
+                "result": self.result,
+                "error": self.error,
+                "created_at": self.created_at,
+                "started_at": self.started_at,
+                "finished_at": self.finished_at,
+            }
+
+
+class IngestionService:
+    """
+    Runs document ingestion in the background on bounded worker pools
+
+    - Threads run the jobs themselves (mostly waiting on the embeddings API)
+    - Processes do the text extraction (CPU heavy, would hog the GIL)
+    """
+
+    def __init__(self):
+        self.jobs: Dict[str, IngestionJob] = {}
+        self._lock = threading.Lock()
+        self._thread_pool: Optional[ThreadPoolExecutor] = None
+        self._process_pool: Optional[ProcessPoolExecutor] = None
+        self._job_store: Optional[JobStore] = None
+
+    def _get_thread_pool(self) -> ThreadPoolExecutor:
+        """Create the job thread pool on first use"""
+        if self._thread_pool is None:
+            self._thread_pool = ThreadPoolExecutor(
+                max_workers=settings.INGEST_THREAD_WORKERS,
+                thread_name_prefix="ingest"
+            )
+        return self._thread_pool
+
+    def _get_process_pool(self) -> ProcessPoolExecutor:
+        """
+        Create the extraction process pool on first use
+
+        We use "spawn" rather than forking a server that already has
+        threads (forking those can deadlock). A spawned worker re-imports
+        the server's main module, so importing it must stay cheap: the
+        document service is only built in the server's startup hook (see
+        LazyDocumentService), never in a worker.
+        """
+        with self._lock:
+            if self._process_pool is None:
+                self._process_pool = ProcessPoolExecutor(
+                    max_workers=settings.INGEST_PROCESS_WORKERS,
+                    mp_context=multiprocessing.get_context("spawn")
+                )
+            return self._process_pool
+
+    def _get_job_store(self) -> JobStore:
+        """Open the job status database on first use (next to the metadata database)"""
+        with self._lock:
+            if self._job_store is None:
+                self._job_store = JobStore(os.path.join(document_service.vector_store_dir, "jobs.db"))
+            return self._job_store
+
+    def _save_job(self, job: IngestionJob, force: bool = True):
+        """
+        Save a job's status for the other server workers to read
+
+        Progress updates (force=False) are throttled. A failed save only
+        costs other workers a stale status, so it never fails the job.
+        """
+        if not job.save_due(0.0 if force else JOB_SAVE_INTERVAL_SECONDS):
+            return
+        try:
+            self._get_job_store().save(job.to_dict(), document_service.owner_id)
+        except Exception as e:
+            logger.warning(f"⚠️  Could not save the status of ingestion job {job.id}: {e}")
+
+    def _progress(self, job: IngestionJob):
+        """The progress callback for one job: update it, then save it"""
+        def progress(stage: str, fraction: float, **details):
+            job.update_stage(stage, fraction, **details)
+            self._save_job(job, force=fraction <= 0.0 or fraction >= 1.0)
+        return progress
+
+    def _replace_broken_pool(self, pool: ProcessPoolExecutor):
+        """
+        Drop a process pool one of whose workers died
+
+        A broken pool refuses all new work, so without this every later
+        upload would fail. The next job creates a fresh pool.
+        """
+        with self._lock:
+            if self._process_pool is pool:
+                self._process_pool = None
+        pool.shutdown(wait=False, cancel_futures=True)
+        logger.warning("⚠️  An extraction worker process died - starting a new process pool")
+
+    def new_upload_path(self, filename: str) -> Tuple[str, str]:
+        """
+        A job ID and the path its upload should be saved to
+
+        The path is unique to the job, so concurrent uploads with the same
+        filename can't overwrite each other.
+
+        Returns: (job_id, file_path)
+        """
+        job_id = str(uuid.uuid4())
+        incoming_dir = os.path.join(document_service.upload_dir, "incoming")
+        os.makedirs(incoming_dir, exist_ok=True)
+        return job_id, os.path.join(incoming_dir, f"{job_id}_{os.path.basename(filename)}")
+
+    def _stored_filename(self, job: IngestionJob) -> str:
+        """The unique name a job's document keeps its file under in uploads/"""
+        return f"{job.doc_id}_{os.path.basename(job.filename)}"
+
+    def _keep_upload(self, job: IngestionJob, result: dict):
+        """
+        Move a processed upload from its job path to its stored name
+
+        A duplicate's document already has a file, so its copy is deleted.
+        """
+        if not os.path.exists(job.file_path):
+            return
+        if result.get("deduplicated"):
+            os.remove(job.file_path)
+            return
+        final_path = os.path.join(document_service.upload_dir, self._stored_filename(job))
+        os.replace(job.file_path, final_path)
+        job.move_file(final_path)
+
+    def _pending_count(self) -> int:
+        """Number of jobs that are still waiting or running"""
+        return sum(1 for job in self.jobs.values() if job.status in ("queued", "running"))
+
+    def _forget_old_jobs(self):
+        """Drop finished jobs nobody has asked about for a while (call with self._lock held)"""
+        cutoff = time.time() - settings.INGEST_JOB_TTL_SECONDS
+        for job_id, job in list(self.jobs.items()):
+            if job.finished_at is not None and job.finished_at < cutoff:
+                del self.jobs[job_id]
+        if self._job_store is not None:
+            self._job_store.forget_finished_before(cutoff)
+
+    def submit(
+        self,
+        file_path: str,
+        filename: str,
+        content_hash: Optional[str] = None,
+        job_id: Optional[str] = None
+    ) -> IngestionJob:
+        """
+        Queue a saved upload for processing
+
+        If we've already processed the exact same bytes, the job is
+        finished on the spot (metadata only) and never reaches the workers.
+
+        Args:
+            file_path: Where the upload was saved (see new_upload_path)
+            filename: Original filename
+            content_hash: SHA-256 of the upload, if the caller computed it
+            job_id: ID to give the job (the one new_upload_path returned)
+
+        Returns:
+            The new IngestionJob (poll it with get_job_status)
+
+        Raises:
+            IngestionQueueFull: if too many jobs are already pending
+        """
+        if content_hash is not None:
+            duplicate = document_service.register_duplicate(content_hash, filename)
+            if duplicate is not None:
+                job = IngestionJob(filename, file_path, content_hash, job_id)
+                job.start()
+                for stage in STAGES:
+                    job.update_stage(stage, 1.0, cached=True)
+                self._keep_upload(job, duplicate)
+                job.finish(duplicate)
+                with self._lock:
+                    self.jobs[job.id] = job
+                self._save_job(job)
+                return job
+
+        with self._lock:
+            self._forget_old_jobs()
+            if self._pending_count() >= settings.INGEST_MAX_PENDING_JOBS:
+                raise IngestionQueueFull(
+                    f"{settings.INGEST_MAX_PENDING_JOBS} documents are already being processed"
+                )
+            job = IngestionJob(filename, file_path, content_hash, job_id)
+            self.jobs[job.id] = job
+
+        self._save_job(job)
+        self._get_thread_pool().submit(self._run_job, job)
+        logger.info(f"📥 Queued ingestion job {job.id} for {filename}")
+        return job
+
+    def _run_job(self, job: IngestionJob):
+        """Process one job (runs on a worker thread)"""
+        job.start()
+        self._save_job(job)
+
+        try:
+            for attempt in range(2):
+                pool = self._get_process_pool()
+                try:
+                    result = document_service.process_document(
+                        job.file_path,
+                        job.filename,
+                        doc_id=job.doc_id,
+                        progress=self._progress(job),
+                        executor=pool,
+                        content_hash=job.content_hash,
+                        stored_filename=self._stored_filename(job)
+                    )
+                    break
+                except BrokenProcessPool:
+                    # Only extraction uses the pool, so nothing was stored yet
+                    self._replace_broken_pool(pool)
+                    if attempt:
+                        raise
+                    logger.warning(f"⚠️  Retrying ingestion job {job.id} ({job.filename}) on the new pool")
+            self._keep_upload(job, result)
+            job.finish(result)
+            self._save_job(job)
+            logger.info(f"✅ Ingestion job {job.id} finished ({job.filename})")
+
+        except Exception as e:
+            error = str(e) or type(e).__name__
+            logger.error(f"❌ Ingestion job {job.id} failed: {error}")
+
+            # Clean up this job's own file (never another upload's)
+            if os.path.exists(job.file_path):
+                os.remove(job.file_path)
+
+            job.fail(error)
+            self._save_job(job)
+
+    def get_job_status(self, job_id: str) -> Optional[dict]:
+        """
+        A job's status snapshot (None if unknown or expired)
+
+        Jobs of this process are read from memory, those of other server
+        workers from the job store. A stored job that never finished
+        because its process died is reported (and saved) as failed.
+        """
+        with self._lock:
+            job = self.jobs.get(job_id)
+        if job is not None:
+            return job.to_dict()
+
+        stored = self._get_job_store().get(job_id)
+        if stored is None:
+            return None
+        snapshot = stored["job"]
+        if snapshot["status"] in ("queued", "running") and not document_service.owner_alive(stored["owner"]):
+            snapshot.update(
+                status="failed",
+                error="The server process running this job stopped",
+                finished_at=time.time()
+            )
+            self._get_job_store().save(snapshot, stored["owner"])
+        return snapshot
+
+    def shutdown(self):
+        """Stop the worker pools (called when the server shuts down)"""
+        if self._thread_pool is not None:
+            self._thread_pool.shutdown(wait=False, cancel_futures=True)
+        if self._process_pool is not None:
+            self._process_pool.shutdown(wait=False, cancel_futures=True)
+        if self._job_store is not None:
+            self._job_store.close()
+
+# Create singleton instance
+ingestion_service = IngestionService()
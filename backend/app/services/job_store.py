@@ -0,0 +1,76 @@
+"""
+Job Store - Ingestion job status in SQLite
+==========================================
+The frontend polls GET /api/documents/jobs/{id} until an upload is
+processed. With several server worker processes, that poll can land on
+a different process than the one running the job, whose jobs only live
+in its own memory. So every job's status is also saved here - one small
+row, rewritten as the job moves along - and any process can read it.
+
+Each row names the process running the job (its owner, see
+DocumentService.owner_alive), so a job whose process died can be
+reported as failed instead of "running" forever.
+"""
+
+import os
+import json
+import time
+import sqlite3
+import threading
+from typing import Optional
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    id           TEXT PRIMARY KEY,
+    owner        TEXT NOT NULL,
+    status       TEXT NOT NULL,
+    finished_at  REAL,
+    updated_at   REAL NOT NULL,
+    data         TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_jobs_finished_at ON jobs(finished_at);
+"""
+
+
+class JobStore:
+    """
+    Job ID → latest status snapshot (the dict the status endpoint returns)
+
+    One connection shared by all threads behind a lock, like MetadataStore.
+    """
+
+    def __init__(self, db_path: str):
+        os.makedirs(os.path.dirname(db_path) or ".", exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(db_path, check_same_thread=False)
+        self._conn.row_factory = sqlite3.Row
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.executescript(SCHEMA)
+
+    def save(self, snapshot: dict, owner: str):
+        """Store (or replace) a job's status snapshot"""
+        with self._lock, self._conn:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO jobs (id, owner, status, finished_at, updated_at, data) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                (snapshot["job_id"], owner, snapshot["status"], snapshot["finished_at"], time.time(),
+                 json.dumps(snapshot))
+            )
+
+    def get(self, job_id: str) -> Optional[dict]:
+        """{"owner", "job": snapshot} for a job, or None if unknown or expired"""
+        with self._lock:
+            row = self._conn.execute("SELECT owner, data FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        if row is None:
+            return None
+        return {"owner": row["owner"], "job": json.loads(row["data"])}
+
+    def forget_finished_before(self, cutoff: float):
+        """Delete jobs that finished before `cutoff` (a time.time() value)"""
+        with self._lock, self._conn:
+            self._conn.execute("DELETE FROM jobs WHERE finished_at IS NOT NULL AND finished_at < ?", (cutoff,))
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
@@ -0,0 +1,404 @@
+"""
+Lexical Index - BM25 keyword search over chunks
+================================================
+An inverted index maps every word to the chunks that contain it, like
+the index at the back of a book. To answer a query we only look at the
+chunks containing the query's words - never the whole corpus - and rank
+them with BM25, the classic search-engine scoring formula:
+
+- a word counts more the more often it appears in a chunk (with
+  diminishing returns)...
+- ...and the rarer it is across all chunks (so "torque" outweighs "the")
+- long chunks don't win just by being long
+
+This works without FAISS, numpy or an API key, and returns the chunks
+that actually matched instead of the start of the document.
+
+Only the postings, chunk lengths and each chunk's place (document,
+position, page) are kept in memory. Chunk text already lives on disk in
+the content cache and the vector store, so the k winners of a search
+are read from there (see read_chunks) instead of holding every chunk's
+text in RAM.
+
+Saving, in vector_store/lexical/:
+
+    postings.json   snapshot of the postings and chunk places
+    chunks.jsonl    changes since the snapshot: one line per new chunk
+                    (with its word counts already worked out) and
+                    {"op": "delete"} lines
+
+Startup loads the snapshot and replays the short log - no text is read
+or tokenized. It can run in a background thread: adds, deletes and
+searches wait for it to finish, everything else starts right away.
+A delete only forgets the document's chunks; their stale postings are
+skipped by searches and dropped when the snapshot is next written
+(once deleted chunks make up COMPACT_RATIO of the index, in the background).
+"""
+
+import os
+import re
+import sys
+import json
+import math
+import time
+import heapq
+import shutil
+import threading
+from collections import Counter
+from typing import Callable, Dict, List, Optional, Tuple
+import logging
+
+from app.services.search_filters import DocPages, SearchFilter, add_page_run
+
+logger = logging.getLogger(__name__)
+
+# BM25 tuning: k1 controls how fast repeated words stop adding score,
+# b how much long chunks are penalised. These are the usual defaults.
+BM25_K1 = 1.2
+BM25_B = 0.75
+
+TOKEN_PATTERN = re.compile(r"\w+", re.UNICODE)
+
+# read_chunks([(doc_id, chunk_index), ...]) → one {"text", "metadata"} record
+# (or None if it is gone) per place, in the same order
+ChunkReader = Callable[[List[Tuple[str, int]]], List[Optional[dict]]]
+
+
+def tokenize(text: str) -> List[str]:
+    """Lowercase words (letters/digits), in order"""
+    return TOKEN_PATTERN.findall(text.lower())
+
+
+class LexicalIndex:
+    """
+    Chunk-level inverted index with BM25 ranking, persisted as a snapshot plus an append-only log
+
+    Chunks get local integer IDs in the order they were added; results
+    carry each chunk's text and metadata (source, doc_id, chunk_index, page),
+    read through read_chunks.
+    """
+
+    def __init__(self, root_dir: str, read_chunks: ChunkReader, compact_ratio: float = 0.2):
+        """
+        Args:
+            root_dir: Folder for the snapshot and the log
+            read_chunks: Reads the text and metadata of chunks by their
+                (doc_id, chunk_index), for the results of a search
+            compact_ratio: Write a new snapshot once this share of the chunks is deleted
+        """
+        self.root_dir = root_dir
+        self.read_chunks = read_chunks
+        self.compact_ratio = compact_ratio
+        self.log_path = os.path.join(root_dir, "chunks.jsonl")
+        self.snapshot_path = os.path.join(root_dir, "postings.json")
+
+        self.postings: Dict[str, Dict[int, int]] = {}  # word → {chunk id: count}
+        self.lengths: Dict[int, int] = {}  # chunk id → number of words
+        self.chunks: Dict[int, tuple] = {}  # chunk id → (doc_id, chunk_index, page)
+        self.doc_chunks: Dict[str, List[int]] = {}  # doc_id → chunk IDs (for filtered searches)
+        self.doc_pages: DocPages = {}  # doc_id → page runs (for page-range searches)
+        self.total_length = 0
+        self.next_id = 0
+        self.deleted_in_log = 0  # deleted chunks still in the postings and the log
+
+        self._lock = threading.RLock()
+        self._ready = threading.Event()  # set once load() has finished
+        self._compact_thread: Optional[threading.Thread] = None
+        os.makedirs(self.root_dir, exist_ok=True)
+
+    # ---------- loading / saving ----------
+
+    def load(self):
+        """Rebuild the in-memory index from the snapshot and the log"""
+        try:
+            if os.path.exists(self.snapshot_path):
+                self._load_snapshot()
+            if os.path.exists(self.log_path):
+                self._load_log()
+        finally:
+            self._ready.set()
+        logger.info(f"Loaded lexical index: {len(self.chunks)} chunks, {len(self.postings)} words")
+
+    def _load_snapshot(self):
+        with open(self.snapshot_path, "r", encoding="utf-8") as f:
+            snapshot = json.load(f)
+        self.next_id = max(self.next_id, snapshot["next_id"])
+        for chunk_id, doc_id, chunk_index, page, length in snapshot["chunks"]:
+            self._place_chunk(chunk_id, doc_id, chunk_index, page, length)
+        for term, flat in snapshot["postings"].items():
+            # [id, count, id, count, ...]
+            self.postings[term] = dict(zip(flat[::2], flat[1::2]))
+
+    def _load_log(self):
+
+        valid_bytes = 0
+        with open(self.log_path, "rb") as f:
+            for line in f:
+                try:
+                    entry = json.loads(line)
+                except ValueError:
+                    # A half-written last line from a crash - cut it off below
+                    break
+                self._apply(entry)
+                valid_bytes += len(line)
+
+        if valid_bytes < os.path.getsize(self.log_path):
+            with open(self.log_path, "r+b") as f:
+                f.truncate(valid_bytes)
+            logger.warning("⚠️  Dropped an incomplete entry at the end of the lexical index log")
+
+    def _place_chunk(self, chunk_id: int, doc_id: str, chunk_index: int, page: Optional[int], length: int):
+        """Remember where a chunk lives and how long it is (its postings are added separately)"""
+        doc_id = sys.intern(doc_id)  # one string per document, not per chunk
+        self.chunks[chunk_id] = (doc_id, chunk_index, page)
+        self.lengths[chunk_id] = length
+        self.total_length += length
+        self.doc_chunks.setdefault(doc_id, []).append(chunk_id)
+        add_page_run(self.doc_pages.setdefault(doc_id, []), chunk_id, page)
+        self.next_id = max(self.next_id, chunk_id + 1)
+
+    def _apply(self, entry: dict):
+        """Replay one log entry (a chunk, a deletion or the next free ID)"""
+        op = entry.get("op")
+        if op == "delete":
+            self._remove_document(entry["doc_id"])
+            return
+        if op == "next_id":
+            self.next_id = max(self.next_id, entry["next_id"])
+            return
+
+        chunk_id = entry["id"]
+        if chunk_id in self.chunks:
+            # Already in the snapshot (a crash between writing it and the new log)
+            return
+        if not entry.get("doc_id") or entry.get("chunk_index") is None:
+            # Its text couldn't be found again, so it could never be returned
+            self.next_id = max(self.next_id, chunk_id + 1)
+            return
+
+        terms = entry["terms"]
+        for term, count in terms.items():
+            self.postings.setdefault(term, {})[chunk_id] = count
+        self._place_chunk(chunk_id, entry["doc_id"], entry["chunk_index"], entry.get("page"), sum(terms.values()))
+
+    def add(self, records: List[dict]) -> List[int]:
+        """
+        Index new chunks and append them to the log (one write per call)
+
+        Only the word counts are logged - the text stays in the content
+        cache and the vector store.
+
+        Args:
+            records: [{"text": ..., "metadata": {"doc_id", "chunk_index", "page"?, ...}}, ...]
+
+        Returns:
+            The chunk IDs assigned to the records
+        """
+        if not records:
+            return []
+
+        self._ready.wait()
+        with self._lock:
+            entries = []
+            for offset, record in enumerate(records):
+                entries.append({
+                    "id": self.next_id + offset,
+                    "doc_id": record["metadata"].get("doc_id"),
+                    "chunk_index": record["metadata"].get("chunk_index"),
+                    "page": record["metadata"].get("page"),
+                    "terms": dict(Counter(tokenize(record["text"])))
+                })
+
+            data = "".join(json.dumps(entry, ensure_ascii=False) + "\n" for entry in entries)
+            with open(self.log_path, "a", encoding="utf-8") as f:
+                f.write(data)
+                f.flush()
+                os.fsync(f.fileno())
+
+            for entry in entries:
+                self._apply(entry)
+            self.next_id = max(self.next_id, entries[-1]["id"] + 1)
+            return [entry["id"] for entry in entries]
+
+    # ---------- deleting ----------
+
+    def _remove_document(self, doc_id: str) -> int:
+        """
+        Forget a document's chunks
+
+        Their postings stay until the next snapshot (searches skip chunk IDs
+        that are no longer in self.chunks), so nothing is re-tokenized here.
+        """
+        chunk_ids = self.doc_chunks.pop(doc_id, [])
+        self.doc_pages.pop(doc_id, None)
+        for chunk_id in chunk_ids:
+            self.chunks.pop(chunk_id, None)
+            self.total_length -= self.lengths.pop(chunk_id, 0)
+        self.deleted_in_log += len(chunk_ids)
+        return len(chunk_ids)
+
+    def delete_document(self, doc_id: str) -> int:
+        """
+        Remove a document's chunks from the index
+
+        Returns: Number of chunks removed
+        """
+        self._ready.wait()
+        with self._lock:
+            if doc_id not in self.doc_chunks:
+                return 0
+            with open(self.log_path, "a", encoding="utf-8") as f:
+                f.write(json.dumps({"op": "delete", "doc_id": doc_id}, ensure_ascii=False) + "\n")
+                f.flush()
+                os.fsync(f.fileno())
+            removed = self._remove_document(doc_id)
+
+        logger.info(f"🗑️  Deleted {removed} chunks of document {doc_id} from the lexical index")
+        self._maybe_compact()
+        return removed
+
+    def _maybe_compact(self):
+        """Start a background snapshot once enough of the index is deleted"""
+        indexed = self.deleted_in_log + len(self.chunks)
+        if not self.deleted_in_log or self.deleted_in_log < self.compact_ratio * indexed:
+            return
+        if self._compact_thread is not None and self._compact_thread.is_alive():
+            return
+        self._compact_thread = threading.Thread(target=self.compact, name="lexical-index-compact", daemon=True)
+        self._compact_thread.start()
+
+    def compact(self):
+        """
+        Write a new snapshot of the live chunks and start an empty log
+
+        Stale postings of deleted chunks are dropped (in memory too). The
+        snapshot is written without holding the lock; anything appended to
+        the log meanwhile is carried over into the new log before the swap.
+        """
+        try:
+            with self._lock:
+                # One pass over the postings: drop the stale ones and take a
+                # flat copy to write out
+                postings = {}
+                flat = {}
+                for term, term_postings in self.postings.items():
+                    live = {chunk_id: count for chunk_id, count in term_postings.items() if chunk_id in self.chunks}
+                    if live:
+                        postings[term] = live
+                        flat[term] = [value for item in live.items() for value in item]
+                self.postings = postings
+                chunks = [
+                    [chunk_id, doc_id, chunk_index, page, self.lengths[chunk_id]]
+                    for chunk_id, (doc_id, chunk_index, page) in self.chunks.items()
+                ]
+                next_id = self.next_id
+                dropped = self.deleted_in_log
+                self.deleted_in_log = 0
+                snapshot_bytes = os.path.getsize(self.log_path) if os.path.exists(self.log_path) else 0
+
+            started = time.perf_counter()
+            tmp_path = self.snapshot_path + ".tmp"
+            try:
+                with open(tmp_path, "w", encoding="utf-8") as f:
+                    json.dump({"next_id": next_id, "chunks": chunks, "postings": flat}, f, ensure_ascii=False)
+                    f.flush()
+                    os.fsync(f.fileno())
+                del chunks, flat
+
+                with self._lock:
+                    log_tmp_path = self.log_path + ".tmp"
+                    with open(log_tmp_path, "wb") as out:
+                        if os.path.exists(self.log_path):
+                            with open(self.log_path, "rb") as src:
+                                src.seek(snapshot_bytes)
+                                shutil.copyfileobj(src, out)
+                        out.flush()
+                        os.fsync(out.fileno())
+                    # Snapshot first: replaying the old log over it changes nothing
+                    os.replace(tmp_path, self.snapshot_path)
+                    os.replace(log_tmp_path, self.log_path)
+            except Exception:
+                with self._lock:
+                    self.deleted_in_log += dropped
+                raise
+
+            logger.info(
+                f"✅ Wrote lexical index snapshot: {len(self.chunks)} chunks, dropped {dropped} deleted chunks "
+                f"in {time.perf_counter() - started:.1f}s"
+            )
+        except Exception as e:
+            # The old snapshot and log are untouched, so nothing is lost
+            logger.error(f"❌ Lexical index compaction failed: {str(e)}")
+
+    # ---------- searching ----------
+
+    @property
+    def count(self) -> int:
+        """Number of chunks indexed"""
+        return len(self.chunks)
+
+    def has_document(self, doc_id: str) -> bool:
+        """True if any chunk of this document is indexed"""
+        self._ready.wait()
+        return doc_id in self.doc_chunks
+
+    def search(
+        self,
+        query: str,
+        k: int = 3,
+        search_filter: Optional[SearchFilter] = None
+    ) -> List[Tuple[dict, float]]:
+        """
+        Find the k chunks that best match the query's words
+
+        With a filter, only the allowed chunks are scored. When they are
+        fewer than a word's postings (e.g. one small manual), we look each
+        allowed chunk up in the postings instead of walking all of them.
+
+        Only the winners' text is read (after the lock is released).
+
+        Returns:
+            List of (record, BM25 score), best first
+        """
+        terms = set(tokenize(query))
+        self._ready.wait()
+        with self._lock:
+            total = len(self.chunks)
+            if not terms or total == 0:
+                return []
+            average_length = self.total_length / total
+
+            allowed = None
+            if search_filter is not None:
+                allowed = search_filter.allowed_ids(self.doc_chunks, self.doc_pages)
+                if not allowed:
+                    return []
+                allowed_set = set(allowed)
+
+            scores: Dict[int, float] = {}
+            for term in terms:
+                postings = self.postings.get(term)
+                if not postings:
+                    continue
+                idf = math.log(1 + (total - len(postings) + 0.5) / (len(postings) + 0.5))
+                if allowed is None:
+                    matches = postings.items()
+                elif len(allowed) < len(postings):
+                    matches = [(chunk_id, postings[chunk_id]) for chunk_id in allowed if chunk_id in postings]
+                else:
+                    matches = [(chunk_id, count) for chunk_id, count in postings.items() if chunk_id in allowed_set]
+                for chunk_id, count in matches:
+                    length = self.lengths.get(chunk_id)
+                    if length is None:
+                        continue  # deleted, postings not dropped yet
+                    norm = BM25_K1 * (1 - BM25_B + BM25_B * length / average_length)
+                    scores[chunk_id] = scores.get(chunk_id, 0.0) + idf * count * (BM25_K1 + 1) / (count + norm)
+
+            best = heapq.nlargest(k, scores.items(), key=lambda item: item[1])
+            places = [self.chunks[chunk_id][:2] for chunk_id, _ in best]
+
+        results = []
+        for (chunk_id, score), record in zip(best, self.read_chunks(places)):
+            if record is not None:
+                results.append((dict(record, id=chunk_id), score))
+        return results
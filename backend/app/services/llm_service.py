@@ -8,15 +8,22 @@ For beginners: You don't need to understand HOW GPT works internally.
 Just know: Send text → Get smart response back!
 """
 
-from openai import OpenAI
 from app.core.config import settings
-from typing import List, Optional
+from app.services.openai_client import get_async_client
+from app.services.prompt_budget import fit_prompt
+from app.services.streaming import stream_completion
+from typing import List, Optional, Union
 import logging
 
 # Set up logging (helps with debugging)
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+def _as_chunks(context: Union[str, List[str], None]) -> List[str]:
+    """Context as a list of chunks, most relevant first (one text = one chunk)"""
+    chunks = [context] if isinstance(context, str) else list(context or [])
+    return [chunk for chunk in chunks if chunk]
+
 class LLMService:
     """
     Service to interact with OpenAI's GPT models
@@ -24,15 +31,14 @@ class LLMService:
     """
     
     def __init__(self):
-        """Initialize OpenAI client with API key"""
-        self.client = OpenAI(api_key=settings.OPENAI_API_KEY)
+        """Pick the model (the OpenAI client is shared - see openai_client.py)"""
         self.model = settings.MODEL_NAME
         logger.info(f"LLM Service initialized with model: {self.model}")
     
-    def chat(
+    async def chat(
         self, 
         user_message: str, 
-        context: Optional[str] = None,
+        context: Union[str, List[str], None] = None,
         conversation_history: Optional[List[dict]] = None
     ) -> str:
         """
@@ -40,7 +46,8 @@ class LLMService:
         
         Args:
             user_message: The user's question/message
-            context: Additional context (like document text)
+            context: Additional context (like document text) - one text,
+                or document chunks most relevant first
             conversation_history: Previous messages in the conversation
         
         Returns:
@@ -63,18 +70,25 @@ class LLMService:
         
         messages.append({"role": "system", "content": system_prompt})
         
+        context_intro = "Here is relevant information from the uploaded documents:\n\n"
+        context_outro = """\n\nPlease answer the user's question based on this information. If the answer is not in the documents, 
+let the user know."""
+        
+        # Keep as many chunks (best first) and as much recent history as the token budget allows
+        fit = fit_prompt(
+            self.model,
+            fixed=[system_prompt, context_intro + context_outro, user_message],
+            chunks=_as_chunks(context),
+            history=conversation_history,
+            max_tokens=1000
+        )
+        
         # Add conversation history if available
-        if conversation_history:
-            messages.extend(conversation_history)
+        messages.extend(fit["history"])
         
         # Add context from documents if available
-        if context:
-            context_message = f"""Here is relevant information from the uploaded documents:
-
-{context}
-
-Please answer the user's question based on this information. If the answer is not in the documents, 
-let the user know."""
+        if fit["chunks"]:
+            context_message = context_intro + "\n\n".join(fit["chunks"]) + context_outro
             messages.append({"role": "system", "content": context_message})
         
         # Add the user's current message
@@ -85,7 +99,7 @@ let the user know."""
             # But really, it's just an API call. OpenAI does all the hard work.
             logger.info(f"Sending request to OpenAI with {len(messages)} messages")
             
-            response = self.client.chat.completions.create(
+            response = await get_async_client().chat.completions.create(
                 model=self.model,
                 messages=messages,
                 temperature=0.7,  # Controls randomness (0=deterministic, 1=creative)
@@ -102,43 +116,48 @@ let the user know."""
             logger.error(f"Error calling OpenAI API: {str(e)}")
             raise Exception(f"Failed to get AI response: {str(e)}")
     
-    def chat_stream(
+    async def chat_stream(
         self, 
         user_message: str, 
-        context: Optional[str] = None
+        context: Union[str, List[str], None] = None
     ):
         """
         Stream responses from GPT (for real-time typing effect)
         This makes your chatbot look more professional!
         
-        Returns: Generator that yields response chunks
+        context: One text, or document chunks most relevant first
+        
+        Returns: Async generator that yields response chunks
         """
         
         messages = [
             {"role": "system", "content": "You are a helpful AI assistant."},
         ]
         
-        if context:
+        # Keep the best chunks that fit the token budget
+        fit = fit_prompt(
+            self.model,
+            fixed=["You are a helpful AI assistant.", "Context: ", user_message],
+            chunks=_as_chunks(context),
+            max_tokens=1000
+        )
+        if fit["chunks"]:
             messages.append({
                 "role": "system", 
-                "content": f"Context: {context}"
+                "content": "Context: " + "\n\n".join(fit["chunks"])
             })
         
         messages.append({"role": "user", "content": user_message})
         
         try:
-            # Stream the response
-            stream = self.client.chat.completions.create(
+            # Stream the response (stops GPT if the caller stops reading)
+            async for piece in stream_completion(
+                messages,
                 model=self.model,
-                messages=messages,
                 temperature=0.7,
-                max_tokens=1000,
-                stream=True  # Enable streaming!
-            )
-            
-            for chunk in stream:
-                if chunk.choices[0].delta.content:
-                    yield chunk.choices[0].delta.content
+                max_tokens=1000
+            ):
+                yield piece
                     
         except Exception as e:
             logger.error(f"Error streaming from OpenAI: {str(e)}")
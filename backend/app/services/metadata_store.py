@@ -0,0 +1,225 @@
+"""
+Metadata Store - Document records in SQLite
+===========================================
+One small row per uploaded document (name, pages, chunk count, content
+hash, the name its file is kept under in uploads/...). The full extracted text is NOT stored here - it lives in the
+content cache and is only read when someone actually asks for it.
+
+Why SQLite instead of a JSON file?
+- Adding a document inserts one row instead of rewriting every document
+- Startup doesn't have to read the whole corpus into memory
+- Lookups by content hash or filename use an index
+
+A document's row is written *before* its chunks go into the indexes,
+marked "pending", and only becomes "ready" once they are all in. Pending
+rows are invisible to every lookup below. Each one records the process
+doing the ingest (its owner): one whose owner is gone belongs to an
+ingest that crashed halfway, and its chunks are removed again (see
+DocumentService.recover_interrupted_ingests).
+"""
+
+import os
+import json
+import time
+import sqlite3
+import threading
+from typing import List, Optional
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS documents (
+    id              TEXT PRIMARY KEY,
+    filename        TEXT NOT NULL,
+    content_hash    TEXT,
+    pages           INTEGER,
+    chunks          INTEGER NOT NULL DEFAULT 0,
+    total_chars     INTEGER NOT NULL DEFAULT 0,
+    aliases         TEXT NOT NULL DEFAULT '[]',
+    created_at      REAL NOT NULL,
+    status          TEXT NOT NULL DEFAULT 'ready',
+    owner           TEXT,
+    stored_filename TEXT
+);
+CREATE INDEX IF NOT EXISTS idx_documents_content_hash ON documents(content_hash);
+CREATE INDEX IF NOT EXISTS idx_documents_filename ON documents(filename);
+CREATE TABLE IF NOT EXISTS meta (
+    key    TEXT PRIMARY KEY,
+    value  TEXT NOT NULL
+);
+"""
+
+
+class MetadataStore:
+    """
+    Per-document metadata backed by an embedded SQLite database
+
+    One connection is shared by all threads; a lock keeps them from using
+    it at the same time (each call is a short, single-row statement).
+    """
+
+    def __init__(self, db_path: str):
+        self.db_path = db_path
+        os.makedirs(os.path.dirname(db_path) or ".", exist_ok=True)
+
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(db_path, check_same_thread=False)
+        self._conn.row_factory = sqlite3.Row
+        # WAL turns each commit into a cheap append to the log file
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.executescript(SCHEMA)
+
+    def _to_dict(self, row: Optional[sqlite3.Row]) -> Optional[dict]:
+        if row is None:
+            return None
+        document = dict(row)
+        document["aliases"] = json.loads(document["aliases"])
+        return document
+
+    def _bump_corpus_version(self):
+        """Increase the corpus version (call inside a write transaction)"""
+        self._conn.execute(
+            "INSERT INTO meta (key, value) VALUES ('corpus_version', '1') "
+            "ON CONFLICT(key) DO UPDATE SET value = CAST(value AS INTEGER) + 1"
+        )
+
+    def corpus_version(self) -> int:
+        """
+        A number that changes whenever the set of documents changes
+
+        Anything computed from the corpus (like cached answers) stays valid
+        only while this number stays the same.
+        """
+        with self._lock:
+            row = self._conn.execute("SELECT value FROM meta WHERE key = 'corpus_version'").fetchone()
+        return int(row["value"]) if row else 0
+
+    def add_document(
+        self,
+        doc_id: str,
+        filename: str,
+        content_hash: Optional[str],
+        pages: Optional[int],
+        chunks: int,
+        total_chars: int,
+        created_at: Optional[float] = None,
+        pending: bool = False,
+        owner: Optional[str] = None,
+        stored_filename: Optional[str] = None
+    ):
+        """
+        Insert one document row (its own small transaction)
+
+        pending=True hides the row until mark_ready() - use it while the
+        document's chunks are still being indexed, with `owner` naming the
+        process doing it. `stored_filename` is the name of the document's
+        file in uploads/ (None if it kept no file).
+        """
+        with self._lock, self._conn:
+            self._conn.execute(
+                "INSERT INTO documents (id, filename, content_hash, pages, chunks, total_chars, created_at, status, owner, "
+                "stored_filename) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (doc_id, filename, content_hash, pages, chunks, total_chars, created_at or time.time(),
+                 "pending" if pending else "ready", owner if pending else None, stored_filename)
+            )
+            if not pending:
+                self._bump_corpus_version()
+
+    def mark_ready(self, doc_id: str, chunks: int):
+        """A pending document's chunks are all indexed - make it visible"""
+        with self._lock, self._conn:
+            self._conn.execute(
+                "UPDATE documents SET status = 'ready', chunks = ?, owner = NULL WHERE id = ? AND status = 'pending'",
+                (chunks, doc_id)
+            )
+            self._bump_corpus_version()
+
+    def pending_documents(self) -> List[dict]:
+        """{"id", "owner"} of documents whose ingest hasn't finished (or never will - it crashed)"""
+        with self._lock:
+            rows = self._conn.execute("SELECT id, owner FROM documents WHERE status = 'pending'").fetchall()
+        return [dict(row) for row in rows]
+
+    def delete_document(self, doc_id: str) -> bool:
+        """Remove one document row (pending or not); returns False if there was none"""
+        with self._lock, self._conn:
+            deleted = self._conn.execute("DELETE FROM documents WHERE id = ?", (doc_id,)).rowcount
+            if deleted:
+                self._bump_corpus_version()
+        return bool(deleted)
+
+    def get_document(self, doc_id: str) -> Optional[dict]:
+        """One (ready) document's metadata, or None"""
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT * FROM documents WHERE id = ? AND status = 'ready'", (doc_id,)
+            ).fetchone()
+        return self._to_dict(row)
+
+    def find_by_hash(self, content_hash: str) -> Optional[dict]:
+        """The document whose file had exactly these bytes, or None"""
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT * FROM documents WHERE content_hash = ? AND status = 'ready' ORDER BY created_at LIMIT 1",
+                (content_hash,)
+            ).fetchone()
+        return self._to_dict(row)
+
+    def has_hash(self, content_hash: str) -> bool:
+        """True if any document (pending or not) has these exact bytes"""
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT 1 FROM documents WHERE content_hash = ? LIMIT 1", (content_hash,)
+            ).fetchone()
+        return row is not None
+
+    def find_by_filename(self, filename: str) -> List[dict]:
+        """Documents uploaded under this filename (as the main name or an alias)"""
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT * FROM documents WHERE (filename = ? OR aliases LIKE ?) AND status = 'ready' ORDER BY created_at",
+                (filename, f"%{json.dumps(filename)}%")
+            ).fetchall()
+        documents = [self._to_dict(row) for row in rows]
+        # LIKE can match inside a longer alias - check the alias list properly
+        return [
+            document for document in documents
+            if document["filename"] == filename or filename in document["aliases"]
+        ]
+
+    def has_stored_file(self, stored_filename: str) -> bool:
+        """True if any document (pending or not) keeps its file under this name"""
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT 1 FROM documents WHERE stored_filename = ? LIMIT 1", (stored_filename,)
+            ).fetchone()
+        return row is not None
+
+    def add_alias(self, doc_id: str, filename: str):
+        """Remember another filename the same content was uploaded under"""
+        with self._lock, self._conn:
+            row = self._conn.execute(
+                "SELECT filename, aliases FROM documents WHERE id = ?", (doc_id,)
+            ).fetchone()
+            if row is None:
+                return
+            aliases = json.loads(row["aliases"])
+            if filename != row["filename"] and filename not in aliases:
+                aliases.append(filename)
+                self._conn.execute(
+                    "UPDATE documents SET aliases = ? WHERE id = ?", (json.dumps(aliases), doc_id)
+                )
+
+    def list_documents(self) -> List[dict]:
+        """All documents, oldest first"""
+        with self._lock:
+            rows = self._conn.execute("SELECT * FROM documents WHERE status = 'ready' ORDER BY created_at").fetchall()
+        return [self._to_dict(row) for row in rows]
+
+    def count(self) -> int:
+        """How many documents are stored"""
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM documents WHERE status = 'ready'").fetchone()[0]
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
@@ -0,0 +1,87 @@
+"""
+OpenAI Client - One shared connection pool for every chat call
+===============================================================
+Creating an OpenAI client per service (or per request) means a new
+connection pool each time, and the synchronous client blocks the event
+loop while GPT is thinking - one slow answer holds up every other user.
+
+Instead every chat path uses the same AsyncOpenAI client:
+- `await client.chat.completions.create(...)` hands control back to the
+  event loop while waiting, so one worker can have hundreds of answers
+  in flight at once
+- its httpx connection pool keeps connections to the API open between
+  requests (no new TLS handshake per question)
+- pool size, keep-alive and timeouts come from the OPENAI_* settings
+
+Embeddings are requested from worker threads with the synchronous
+client, so they get their own httpx.Client (get_sync_http_client) with
+the same pool limits and timeouts.
+
+The clients are created on first use. close_clients() is called when the
+server shuts down.
+"""
+
+from typing import Optional
+import logging
+import threading
+
+import httpx
+from openai import AsyncOpenAI
+
+from app.core.config import settings
+
+logger = logging.getLogger(__name__)
+
+_async_client: Optional[AsyncOpenAI] = None
+_sync_http_client: Optional[httpx.Client] = None
+_sync_lock = threading.Lock()
+
+
+def _http_limits() -> httpx.Limits:
+    return httpx.Limits(
+        max_connections=settings.OPENAI_MAX_CONNECTIONS,
+        max_keepalive_connections=settings.OPENAI_MAX_KEEPALIVE_CONNECTIONS,
+        keepalive_expiry=settings.OPENAI_KEEPALIVE_SECONDS
+    )
+
+
+def _http_timeout() -> httpx.Timeout:
+    return httpx.Timeout(settings.OPENAI_TIMEOUT_SECONDS, connect=settings.OPENAI_CONNECT_TIMEOUT_SECONDS)
+
+
+def get_async_client() -> AsyncOpenAI:
+    """The shared AsyncOpenAI client (created on first use)"""
+    global _async_client
+    if _async_client is None:
+        _async_client = AsyncOpenAI(
+            api_key=settings.OPENAI_API_KEY,
+            max_retries=settings.OPENAI_MAX_RETRIES,
+            timeout=_http_timeout(),
+            http_client=httpx.AsyncClient(limits=_http_limits(), timeout=_http_timeout())
+        )
+        logger.info(
+            f"✅ OpenAI client ready (up to {settings.OPENAI_MAX_CONNECTIONS} connections, "
+            f"{settings.OPENAI_TIMEOUT_SECONDS:g}s timeout)"
+        )
+    return _async_client
+
+
+def get_sync_http_client() -> httpx.Client:
+    """The shared connection pool for synchronous OpenAI clients (created on first use)"""
+    global _sync_http_client
+    with _sync_lock:
+        if _sync_http_client is None or _sync_http_client.is_closed:
+            _sync_http_client = httpx.Client(limits=_http_limits(), timeout=_http_timeout())
+        return _sync_http_client
+
+
+async def close_clients():
+    """Close the shared connection pools (server shutdown)"""
+    global _async_client, _sync_http_client
+    if _async_client is not None:
+        await _async_client.close()
+        _async_client = None
+    with _sync_lock:
+        if _sync_http_client is not None:
+            _sync_http_client.close()
+            _sync_http_client = None
@@ -0,0 +1,172 @@
+"""
+Prompt Budget - Fitting context and history into a token budget
+===============================================================
+Every token we send to GPT costs money and adds latency, and every model
+has a hard limit (its context window). Cutting the context at 3000
+characters or "the last 5 messages" ignores both: it can chop a manual
+section in half, and five long messages can still overflow the window.
+
+fit_prompt() works in tokens instead:
+
+    input budget = min(PROMPT_MAX_INPUT_TOKENS,
+                       context window of the model - max_tokens of the answer)
+
+1. The fixed parts (system prompt, question, instructions) always go in
+2. Retrieved chunks are added best first, whole chunks only - one that
+   doesn't fit is skipped and the next (shorter) one tried
+3. Conversation history gets what's left, newest message first, but the
+   chunks can't squeeze it below PROMPT_HISTORY_SHARE of the budget
+
+Tokens are counted with tiktoken when it is installed (the tokenizer is
+loaded once per model and counts of repeated chunks are cached), or
+estimated at ~4 characters per token without it.
+"""
+
+from functools import lru_cache
+from typing import Optional, Sequence
+import logging
+
+from app.core.config import settings
+
+# Try to import optional dependencies
+try:
+    import tiktoken
+    TIKTOKEN_AVAILABLE = True
+except ImportError:
+    TIKTOKEN_AVAILABLE = False
+
+logger = logging.getLogger(__name__)
+
+# Context window (input + answer) in tokens; longest matching prefix wins
+MODEL_CONTEXT_WINDOWS = {
+    "gpt-4o": 128000,
+    "gpt-4-turbo": 128000,
+    "gpt-4-1106": 128000,
+    "gpt-4-0125": 128000,
+    "gpt-4-32k": 32768,
+    "gpt-4": 8192,
+    "gpt-3.5-turbo": 16385
+}
+DEFAULT_CONTEXT_WINDOW = 8192
+
+# Tokens the chat format adds around every message (role, separators)
+MESSAGE_OVERHEAD_TOKENS = 4
+
+
+def context_window(model: str) -> int:
+    """Context window of a model (DEFAULT_CONTEXT_WINDOW if unknown)"""
+    matches = [prefix for prefix in MODEL_CONTEXT_WINDOWS if model.startswith(prefix)]
+    if not matches:
+        return DEFAULT_CONTEXT_WINDOW
+    return MODEL_CONTEXT_WINDOWS[max(matches, key=len)]
+
+
+def input_budget(model: str, max_tokens: int) -> int:
+    """Tokens we allow ourselves to send to `model` when asking for up to `max_tokens` back"""
+    return max(0, min(settings.PROMPT_MAX_INPUT_TOKENS, context_window(model) - max_tokens))
+
+
+@lru_cache(maxsize=None)
+def _encoding(model: str):
+    """The tokenizer for a model (loaded once), or None to estimate"""
+    if not TIKTOKEN_AVAILABLE:
+        return None
+    try:
+        return tiktoken.encoding_for_model(model)
+    except KeyError:
+        # Model newer than the installed tiktoken - same family tokenizer
+        try:
+            return tiktoken.get_encoding("o200k_base" if model.startswith("gpt-4o") else "cl100k_base")
+        except Exception:
+            return None
+    except Exception:
+        # The tokenizer files can't be downloaded
+        logger.warning(f"⚠️  No tokenizer for {model}, estimating token counts")
+        return None
+
+
+@lru_cache(maxsize=8192)
+def count_tokens(text: str, model: str) -> int:
+    """Tokens in a piece of text (≈ 4 characters per token without tiktoken)"""
+    encoding = _encoding(model)
+    if encoding is not None:
+        return len(encoding.encode(text, disallowed_special=()))
+    return len(text) // 4 + 1
+
+
+def _truncate(text: str, tokens: int, model: str) -> str:
+    """The first `tokens` tokens of a text"""
+    encoding = _encoding(model)
+    if encoding is not None:
+        return encoding.decode(encoding.encode(text, disallowed_special=())[:tokens])
+    return text[:tokens * 4]
+
+
+def fit_prompt(
+    model: str,
+    fixed: Sequence[str],
+    chunks: Sequence[str] = (),
+    history: Optional[Sequence[dict]] = None,
+    max_tokens: int = 1000
+) -> dict:
+    """
+    Choose the chunks and history messages that fit the model's input budget
+
+    Args:
+        model: Chat model the prompt is for
+        fixed: Texts that always go in (system prompt, question, instructions)
+        chunks: Retrieved document chunks, most relevant first
+        history: Earlier messages ({"role", "content"}), oldest first
+        max_tokens: Room to leave for the answer
+
+    Returns:
+        {"chunks": [...], "history": [...], "input_tokens": n,
+         "dropped_chunks": n, "dropped_history": n} - chunks keep their
+        order, history stays oldest first
+    """
+    history = list(history or [])
+    budget = input_budget(model, max_tokens)
+    used = sum(count_tokens(text, model) + MESSAGE_OVERHEAD_TOKENS for text in fixed)
+    remaining = max(0, budget - used)
+
+    history_sizes = [count_tokens(msg.get("content") or "", model) + MESSAGE_OVERHEAD_TOKENS for msg in history]
+    # Chunks first, but keep the history's share free if it needs it
+    history_reserve = min(sum(history_sizes), int(remaining * settings.PROMPT_HISTORY_SHARE))
+
+    chunk_budget = remaining - history_reserve
+    kept_chunks = []
+    for chunk in chunks:
+        size = count_tokens(chunk, model)
+        if size <= chunk_budget:
+            kept_chunks.append(chunk)
+            chunk_budget -= size
+    if chunks and not kept_chunks and chunk_budget > 0:
+        # Even the best chunk is too big - better part of it than nothing
+        kept_chunks.append(_truncate(chunks[0], chunk_budget, model))
+        chunk_budget -= count_tokens(kept_chunks[0], model)
+    chunk_tokens = remaining - history_reserve - chunk_budget
+
+    history_budget = remaining - chunk_tokens
+    history_tokens = 0
+    kept_history = []
+    for msg, size in zip(reversed(history), reversed(history_sizes)):
+        if history_tokens + size > history_budget:
+            break  # Older messages without the newer ones make no sense
+        kept_history.append(msg)
+        history_tokens += size
+    kept_history.reverse()
+
+    dropped_chunks = len(chunks) - len(kept_chunks)
+    dropped_history = len(history) - len(kept_history)
+    if dropped_chunks or dropped_history:
+        logger.info(
+            f"✂️ Prompt trimmed to {budget} tokens for {model}: "
+            f"dropped {dropped_chunks} chunks, {dropped_history} history messages"
+        )
+    return {
+        "chunks": kept_chunks,
+        "history": kept_history,
+        "input_tokens": used + chunk_tokens + history_tokens,
+        "dropped_chunks": dropped_chunks,
+        "dropped_history": dropped_history
+    }
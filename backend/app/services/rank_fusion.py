@@ -0,0 +1,50 @@
+"""
+Rank Fusion - Merging ranked result lists
+=========================================
+Vector search and keyword (BM25) search score chunks on completely
+different scales (a distance vs. a BM25 score), so we can't just add
+their scores. Reciprocal Rank Fusion only looks at *positions*:
+
+    score(chunk) = sum over lists of 1 / (k + rank in that list)
+
+A chunk ranked highly by either search does well; a chunk both searches
+agree on does best. k (60 by convention) stops the very top ranks from
+completely drowning out the rest.
+"""
+
+from typing import Dict, Hashable, List, Sequence, Tuple
+
+
+def chunk_key(record: dict) -> Hashable:
+    """
+    Identify a chunk across indexes
+
+    The vector store and the keyword index number chunks independently,
+    but both keep the document ID and position in the metadata.
+    """
+    metadata = record.get("metadata", {})
+    if "doc_id" in metadata and "chunk_index" in metadata:
+        return (metadata["doc_id"], metadata["chunk_index"])
+    return record["text"]
+
+
+def reciprocal_rank_fusion(result_lists: Sequence[List[dict]], k: int = 60) -> List[Tuple[dict, float]]:
+    """
+    Merge several best-first lists of records into one
+
+    Args:
+        result_lists: Each a list of records, best first
+        k: RRF damping constant
+
+    Returns:
+        List of (record, fused score), best first
+    """
+    scores: Dict[Hashable, float] = {}
+    records: Dict[Hashable, dict] = {}
+    for results in result_lists:
+        for rank, record in enumerate(results, start=1):
+            key = chunk_key(record)
+            scores[key] = scores.get(key, 0.0) + 1.0 / (k + rank)
+            records.setdefault(key, record)
+    ranked = sorted(scores.items(), key=lambda item: item[1], reverse=True)
+    return [(records[key], score) for key, score in ranked]
@@ -0,0 +1,110 @@
+"""
+Search Filters - Limiting a search to some documents or pages
+=============================================================
+"Search only the Civic manual, pages 40-60."
+
+Instead of searching everything and throwing away results from other
+documents afterwards (which can leave you with nothing when the target
+document is small), the indexes work out up front which chunk IDs are
+allowed and search only those:
+
+- each index remembers which chunk IDs belong to which document
+- and, per document, which chunk IDs are on which page, as *page runs*:
+  [page, first chunk ID, last chunk ID] for each stretch of consecutive
+  chunks on the same page - a few numbers per page, not per chunk
+- a page range then picks the runs whose page is inside it, so even
+  "pages 40-60 of every manual" never has to read a single chunk
+"""
+
+from typing import Dict, Iterable, List, Optional
+
+# doc_id → [[page, first chunk ID, last chunk ID], ...] in chunk ID order
+# (chunks without a page number are left out - no page range includes them)
+DocPages = Dict[str, List[List[int]]]
+
+
+def add_page_run(runs: List[List[int]], chunk_id: int, page: Optional[int]):
+    """Record that chunk_id is on page (runs stay few when chunk IDs come in increasing order)"""
+    if page is None:
+        return
+    if runs and runs[-1][0] == page and runs[-1][2] == chunk_id - 1:
+        runs[-1][2] = chunk_id
+    else:
+        runs.append([page, chunk_id, chunk_id])
+
+
+class SearchFilter:
+    """
+    Which chunks a search may return
+
+    Filenames are resolved to document IDs by DocumentService before a
+    filter reaches the indexes, so the indexes only deal with IDs.
+    """
+
+    def __init__(
+        self,
+        doc_ids: Optional[Iterable[str]] = None,
+        page_from: Optional[int] = None,
+        page_to: Optional[int] = None
+    ):
+        """
+        Args:
+            doc_ids: Only these documents (None = all documents)
+            page_from: First page to include (None = from the start)
+            page_to: Last page to include (None = to the end)
+        """
+        self.doc_ids = set(doc_ids) if doc_ids is not None else None
+        self.page_from = page_from
+        self.page_to = page_to
+
+    @property
+    def has_pages(self) -> bool:
+        return self.page_from is not None or self.page_to is not None
+
+    def matches_page(self, metadata: dict) -> bool:
+        """True if a chunk's page is inside the range (chunks without pages never are)"""
+        return self.matches_page_number(metadata.get("page"))
+
+    def matches_page_number(self, page: Optional[int]) -> bool:
+        """True if a page number is inside the range (None never is, unless there's no range)"""
+        if not self.has_pages:
+            return True
+        if page is None:
+            return False
+        if self.page_from is not None and page < self.page_from:
+            return False
+        if self.page_to is not None and page > self.page_to:
+            return False
+        return True
+
+    def allowed_ids(self, doc_chunks: Dict[str, List[int]], doc_pages: DocPages) -> List[int]:
+        """
+        Chunk IDs this filter lets through, sorted
+
+        Chunks that don't belong to a document never match a filter.
+
+        Args:
+            doc_chunks: document ID → its chunk IDs (kept by each index)
+            doc_pages: document ID → its page runs (see add_page_run)
+        """
+        doc_ids: Iterable[str] = doc_chunks.keys() if self.doc_ids is None else self.doc_ids
+        if not self.has_pages:
+            candidates = [
+                chunk_id
+                for doc_id in doc_ids
+                for chunk_id in doc_chunks.get(doc_id, ())
+            ]
+        else:
+            candidates = [
+                chunk_id
+                for doc_id in doc_ids if doc_id in doc_chunks
+                for page, first, last in doc_pages.get(doc_id, ())
+                if self.matches_page_number(page)
+                for chunk_id in range(first, last + 1)
+            ]
+        return sorted(candidates)
+
+    def cache_key(self) -> str:
+        """Stable text form, so cached answers are kept per filter"""
+        doc_ids = ",".join(sorted(self.doc_ids)) if self.doc_ids is not None else "*"
+        return f"docs={doc_ids};pages={self.page_from}-{self.page_to}"
@@ -0,0 +1,378 @@
+"""
+Session Store - Remembering conversations on the server
+=======================================================
+Without it, the browser has to send the whole conversation with every
+question: requests get bigger each turn, and so does the prompt.
+
+Now a client just sends a session_id and the server keeps the turns:
+
+- Sessions live in memory in LRU order (most recently used last). Ones
+  idle for SESSION_IDLE_SECONDS are dropped, and the least recently used
+  ones go when all sessions together pass SESSION_MAX_BYTES
+- Once a session's turns add up to SESSION_COMPACT_TOKENS, the older
+  ones are folded into a short rolling summary (written by GPT, in the
+  background) and only the last SESSION_KEEP_TURNS messages stay word
+  for word - so a long chat stops growing
+- With SESSION_STORE_PERSIST the sessions are also saved in SQLite, so
+  they survive restarts and come back after being dropped from memory
+  (rows are deleted after SESSION_PERSIST_TTL_SECONDS without use)
+
+The prompt history for a session is the summary (as a system message)
+followed by the recent turns.
+"""
+
+from collections import OrderedDict
+from typing import Awaitable, Callable, List, Optional
+import asyncio
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+
+from app.core.config import settings
+from app.services.openai_client import get_async_client
+from app.services.prompt_budget import count_tokens
+
+logger = logging.getLogger(__name__)
+
+# Model used to count tokens and write summaries
+SUMMARY_MODEL = "gpt-4o-mini"
+
+# Rough memory used by one turn besides its text (dict, timestamps...)
+TURN_OVERHEAD_BYTES = 200
+
+# Delete expired rows from SQLite every this many saves
+PRUNE_EVERY_SAVES = 500
+
+SUMMARY_PROMPT = """Summarize this conversation between a user and an assistant about vehicle/document manuals.
+Keep names, numbers, part names and decisions; drop small talk. Write at most {words} words.
+
+{previous}Conversation:
+{turns}"""
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS sessions (
+    id          TEXT PRIMARY KEY,
+    summary     TEXT NOT NULL DEFAULT '',
+    turns       TEXT NOT NULL DEFAULT '[]',
+    updated_at  REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_sessions_updated_at ON sessions(updated_at);
+"""
+
+
+class SessionStore:
+    """
+    Thread-safe per-session conversation turns with a rolling summary
+
+    Each session is a dict: {"summary", "turns", "updated_at", "touched_at",
+    "bytes", "tokens"}, where every turn is {"role", "content", "timestamp",
+    "tokens"}. updated_at is the last new turn (saved to SQLite), touched_at
+    the last time the session was used (memory only - the sessions are kept
+    in touched_at order, least recent first).
+    """
+
+    def __init__(
+        self,
+        max_bytes: int = 64 * 1024 * 1024,
+        idle_seconds: float = 3600,
+        compact_tokens: int = 2000,
+        keep_turns: int = 6,
+        summary_tokens: int = 300,
+        db_path: Optional[str] = None,
+        persist_ttl_seconds: float = 7 * 24 * 3600,
+        summarize: Optional[Callable[[str, List[dict]], Awaitable[str]]] = None
+    ):
+        """
+        Args:
+            max_bytes: Memory cap for all sessions together (roughly)
+            idle_seconds: Drop sessions from memory after this long unused (0 = never)
+            compact_tokens: Summarize older turns once a session has this many tokens (0 = never)
+            keep_turns: Messages kept word for word when compacting
+            summary_tokens: Length of the rolling summary
+            db_path: SQLite file to save sessions in (None = memory only)
+            persist_ttl_seconds: Delete saved sessions unused for this long
+            summarize: async (previous summary, turns) → new summary (defaults to GPT)
+        """
+        self.max_bytes = max_bytes
+        self.idle_seconds = idle_seconds
+        self.compact_tokens = compact_tokens
+        self.keep_turns = keep_turns
+        self.summary_tokens = summary_tokens
+        self.persist_ttl_seconds = persist_ttl_seconds
+        self._summarize = summarize or self._summarize_with_gpt
+
+        self._sessions: "OrderedDict[str, dict]" = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self._compacting = set()
+        self._tasks = set()
+        self.compactions = 0
+        self.idle_evictions = 0
+        self.memory_evictions = 0
+
+        self._conn = None
+        self._saves = 0
+        if db_path:
+            os.makedirs(os.path.dirname(db_path) or ".", exist_ok=True)
+            self._conn = sqlite3.connect(db_path, check_same_thread=False)
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute("PRAGMA synchronous=NORMAL")
+            self._conn.executescript(SCHEMA)
+            self._prune_disk()
+
+    # ---------- memory bookkeeping (call with the lock held) ----------
+
+    def _resize(self, session: dict):
+        """Recount a session's size after its turns or summary changed"""
+        self._bytes -= session["bytes"]
+        session["tokens"] = count_tokens(session["summary"], SUMMARY_MODEL) + sum(turn["tokens"] for turn in session["turns"])
+        session["bytes"] = len(session["summary"]) + sum(
+            len(turn["content"]) + TURN_OVERHEAD_BYTES for turn in session["turns"]
+        )
+        self._bytes += session["bytes"]
+
+    def _drop(self, session_id: str):
+        session = self._sessions.pop(session_id)
+        self._bytes -= session["bytes"]
+
+    def _evict(self):
+        """Drop idle sessions, then least recently used ones while over the memory cap"""
+        if self.idle_seconds:
+            cutoff = time.time() - self.idle_seconds
+            while self._sessions:
+                session_id, session = next(iter(self._sessions.items()))
+                if session["touched_at"] >= cutoff:
+                    break
+                self._drop(session_id)
+                self.idle_evictions += 1
+        while self._bytes > self.max_bytes and len(self._sessions) > 1:
+            self._drop(next(iter(self._sessions)))
+            self.memory_evictions += 1
+
+    def _lookup(self, session_id: str) -> Optional[dict]:
+        """A session from memory, or loaded back from SQLite"""
+        self._evict()
+        session = self._sessions.get(session_id)
+        if session is not None:
+            session["touched_at"] = time.time()
+            self._sessions.move_to_end(session_id)
+            return session
+        if self._conn is None:
+            return None
+        row = self._conn.execute(
+            "SELECT summary, turns, updated_at FROM sessions WHERE id = ? AND updated_at >= ?",
+            (session_id, time.time() - self.persist_ttl_seconds)
+        ).fetchone()
+        if row is None:
+            return None
+        session = {
+            "summary": row[0], "turns": json.loads(row[1]), "updated_at": row[2],
+            "touched_at": time.time(), "bytes": 0, "tokens": 0
+        }
+        self._sessions[session_id] = session
+        self._resize(session)
+        return session
+
+    # ---------- SQLite ----------
+
+    def _save(self, session_id: str, session: dict):
+        """Write one session to SQLite (call with the lock held)"""
+        if self._conn is None:
+            return
+        with self._conn:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO sessions (id, summary, turns, updated_at) VALUES (?, ?, ?, ?)",
+                (session_id, session["summary"], json.dumps(session["turns"], ensure_ascii=False), session["updated_at"])
+            )
+        self._saves += 1
+        if self._saves % PRUNE_EVERY_SAVES == 0:
+            self._prune_disk()
+
+    def _prune_disk(self):
+        with self._conn:
+            deleted = self._conn.execute(
+                "DELETE FROM sessions WHERE updated_at < ?", (time.time() - self.persist_ttl_seconds,)
+            ).rowcount
+        if deleted:
+            logger.info(f"🗑️ Deleted {deleted} expired sessions")
+
+    # ---------- public API ----------
+
+    def get_history(self, session_id: str) -> List[dict]:
+        """Prompt messages for a session: the summary (if any), then the recent turns"""
+        with self._lock:
+            session = self._lookup(session_id)
+            if session is None:
+                return []
+            history = [{"role": turn["role"], "content": turn["content"]} for turn in session["turns"]]
+            if session["summary"]:
+                history.insert(0, {
+                    "role": "system",
+                    "content": f"Summary of the earlier conversation:\n{session['summary']}"
+                })
+            return history
+
+    def get_session(self, session_id: str) -> Optional[dict]:
+        """A session as shown by the history endpoint, or None"""
+        with self._lock:
+            session = self._lookup(session_id)
+            if session is None:
+                return None
+            return {
+                "session_id": session_id,
+                "summary": session["summary"],
+                "history": [
+                    {"role": turn["role"], "content": turn["content"], "timestamp": turn["timestamp"]}
+                    for turn in session["turns"]
+                ],
+                "tokens": session["tokens"],
+                "updated_at": session["updated_at"]
+            }
+
+    def append(self, session_id: str, question: str, answer: str):
+        """Add one question and its answer to a session (created if new)"""
+        now = time.time()
+        turns = [
+            {"role": role, "content": content, "timestamp": now, "tokens": count_tokens(content, SUMMARY_MODEL)}
+            for role, content in (("user", question), ("assistant", answer))
+        ]
+        with self._lock:
+            session = self._lookup(session_id)
+            if session is None:
+                session = {"summary": "", "turns": [], "updated_at": now, "touched_at": now, "bytes": 0, "tokens": 0}
+                self._sessions[session_id] = session
+            session["turns"].extend(turns)
+            session["updated_at"] = now
+            self._resize(session)
+            self._save(session_id, session)
+            self._evict()
+
+    def clear(self, session_id: str) -> bool:
+        """Forget a session; True if it existed"""
+        with self._lock:
+            existed = self._lookup(session_id) is not None
+            if session_id in self._sessions:
+                self._drop(session_id)
+            if self._conn is not None:
+                with self._conn:
+                    self._conn.execute("DELETE FROM sessions WHERE id = ?", (session_id,))
+            return existed
+
+    # ---------- compaction ----------
+
+    def needs_compaction(self, session_id: str) -> bool:
+        with self._lock:
+            session = self._sessions.get(session_id)
+            return (
+                session is not None
+                and bool(self.compact_tokens)
+                and session["tokens"] > self.compact_tokens
+                and len(session["turns"]) > self.keep_turns
+                and session_id not in self._compacting
+            )
+
+    def schedule_compaction(self, session_id: str):
+        """Compact a session in the background if it has grown too long (call from async code)"""
+        if not self.needs_compaction(session_id):
+            return
+        task = asyncio.get_running_loop().create_task(self.compact(session_id))
+        # Keep a reference so the task isn't garbage collected mid-way
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def compact(self, session_id: str) -> bool:
+        """
+        Fold all but the last keep_turns messages into the rolling summary
+
+        New turns may arrive while the summary is being written; they are
+        kept, because only the turns that were summarized are removed.
+        """
+        with self._lock:
+            session = self._sessions.get(session_id)
+            if session is None or session_id in self._compacting:
+                return False
+            old_turns = session["turns"][:len(session["turns"]) - self.keep_turns]
+            if not old_turns:
+                return False
+            previous = session["summary"]
+            self._compacting.add(session_id)
+
+        try:
+            try:
+                summary = await self._summarize(previous, old_turns)
+            except Exception as e:
+                logger.warning(f"⚠️  Session summary failed ({e}), keeping a shortened transcript instead")
+                summary = self._clip_summary(previous, old_turns)
+        finally:
+            with self._lock:
+                self._compacting.discard(session_id)
+
+        with self._lock:
+            if self._sessions.get(session_id) is not session:
+                return False  # Cleared or evicted meanwhile
+            session["turns"] = session["turns"][len(old_turns):]
+            session["summary"] = summary
+            self._resize(session)
+            self._save(session_id, session)
+            self.compactions += 1
+        logger.info(f"✅ Compacted session {session_id}: {len(old_turns)} messages → summary")
+        return True
+
+    def _clip_summary(self, previous: str, turns: List[dict]) -> str:
+        """A summary without GPT: the most recent lines that fit summary_tokens"""
+        lines = [previous] if previous else []
+        lines += [f"{turn['role']}: {turn['content'][:300]}" for turn in turns]
+        text = "\n".join(lines)
+        return text[-self.summary_tokens * 4:]
+
+    async def _summarize_with_gpt(self, previous: str, turns: List[dict]) -> str:
+        if not settings.OPENAI_API_KEY:
+            return self._clip_summary(previous, turns)
+        prompt = SUMMARY_PROMPT.format(
+            words=int(self.summary_tokens * 0.75),
+            previous=f"Summary so far:\n{previous}\n\n" if previous else "",
+            turns="\n".join(f"{turn['role']}: {turn['content']}" for turn in turns)
+        )
+        response = await get_async_client().chat.completions.create(
+            model=SUMMARY_MODEL,
+            messages=[{"role": "user", "content": prompt}],
+            temperature=0.2,
+            max_tokens=self.summary_tokens
+        )
+        return response.choices[0].message.content.strip()
+
+    # ---------- monitoring ----------
+
+    def stats(self) -> dict:
+        """Counters for monitoring"""
+        with self._lock:
+            return {
+                "sessions": len(self._sessions),
+                "bytes": self._bytes,
+                "max_bytes": self.max_bytes,
+                "compactions": self.compactions,
+                "idle_evictions": self.idle_evictions,
+                "memory_evictions": self.memory_evictions,
+                "persistent": self._conn is not None
+            }
+
+    def close(self):
+        with self._lock:
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
+
+
+# Create singleton instance
+session_store = SessionStore(
+    max_bytes=settings.SESSION_MAX_BYTES,
+    idle_seconds=settings.SESSION_IDLE_SECONDS,
+    compact_tokens=settings.SESSION_COMPACT_TOKENS,
+    keep_turns=settings.SESSION_KEEP_TURNS,
+    summary_tokens=settings.SESSION_SUMMARY_TOKENS,
+    db_path=os.path.join("vector_store", "sessions.db") if settings.SESSION_STORE_PERSIST else None,
+    persist_ttl_seconds=settings.SESSION_PERSIST_TTL_SECONDS
+)
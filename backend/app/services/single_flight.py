@@ -0,0 +1,117 @@
+"""
+Single Flight - One upstream call for many identical requests
+=============================================================
+When a popular question spikes (a recall notice goes out), dozens of
+people ask the same thing within the same second. The caches can't help
+yet - the first answer isn't finished - so every request would embed the
+question and call GPT on its own.
+
+With single flight, the first request with a given key does the work
+and the others that arrive while it's running simply wait for its
+result. Nothing is stored afterwards: the next request after it
+finishes does the work again (or hits the normal caches), so there's
+no staleness.
+
+- SingleFlight: for code running on worker threads (query embeddings)
+- AsyncSingleFlight: for async code (GPT calls in the chat endpoint).
+  If every waiter goes away (clients disconnected), the shared call is
+  cancelled too
+"""
+
+from typing import Any, Awaitable, Callable, Dict, Hashable
+import asyncio
+import threading
+
+
+class _Call:
+    """One call in progress, shared by everyone asking for the same key"""
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class SingleFlight:
+    """Thread-safe: concurrent do() calls with the same key run fn once"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._calls: Dict[Hashable, _Call] = {}
+        self.calls = 0
+        self.shared = 0
+
+    def do(self, key: Hashable, fn: Callable[[], Any]) -> Any:
+        """Run fn(), or wait for the identical call already running and return its result (or error)"""
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = _Call()
+                self.calls += 1
+            else:
+                self.shared += 1
+
+        if not leader:
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result
+
+        try:
+            call.result = fn()
+        except BaseException as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.done.set()
+        return call.result
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {"calls": self.calls, "shared": self.shared, "in_flight": len(self._calls)}
+
+
+class AsyncSingleFlight:
+    """Event-loop version: concurrent do() calls with the same key share one task"""
+
+    def __init__(self):
+        self._calls: Dict[Hashable, dict] = {}  # key → {"task", "waiters"}
+        self.calls = 0
+        self.shared = 0
+        self.cancelled = 0
+
+    def in_flight(self, key: Hashable) -> bool:
+        """True while a call for key is running (someone is still waiting for it)"""
+        return key in self._calls
+
+    def _forget(self, key: Hashable, call: dict):
+        if self._calls.get(key) is call:
+            del self._calls[key]
+
+    async def do(self, key: Hashable, make_call: Callable[[], Awaitable[Any]]) -> Any:
+        """Await make_call(), or the identical call already running"""
+        call = self._calls.get(key)
+        if call is None:
+            call = self._calls[key] = {"task": asyncio.ensure_future(make_call()), "waiters": 0}
+            call["task"].add_done_callback(lambda _: self._forget(key, call))
+            self.calls += 1
+        else:
+            self.shared += 1
+
+        call["waiters"] += 1
+        try:
+            # Shielded: one waiter being cancelled mustn't cancel the call for the others
+            return await asyncio.shield(call["task"])
+        finally:
+            call["waiters"] -= 1
+            if call["waiters"] == 0 and not call["task"].done():
+                # Nobody is waiting any more - stop the upstream call
+                call["task"].cancel()
+                self._forget(key, call)
+                self.cancelled += 1
+
+    def stats(self) -> dict:
+        return {"calls": self.calls, "shared": self.shared, "cancelled": self.cancelled, "in_flight": len(self._calls)}
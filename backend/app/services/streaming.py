@@ -0,0 +1,94 @@
+"""
+Streaming - Sending answers while GPT is still writing them
+===========================================================
+Without streaming, the browser sees nothing until GPT has finished the
+whole answer. With Server-Sent Events (SSE) the response stays open and
+we push small messages down it as things happen:
+
+    event: sources        which manual sections the answer is based on
+    data: {...}           (sent as soon as the search is done)
+
+    event: delta          a few words of the answer
+    data: {"content": "..."}
+
+    event: done           token usage and timings
+    data: {...}
+
+Each message is "event: <name>", "data: <json>" and a blank line - the
+browser's EventSource (or any SSE client) splits them apart.
+
+If the client disconnects mid-answer the stream is cancelled, and
+stream_completion() closes the OpenAI response so GPT stops writing
+(see cancellation.py).
+"""
+
+import asyncio
+import json
+from typing import AsyncIterator, List, Optional
+
+import anyio
+
+from app.services.cancellation import cancellation_stats
+from app.services.openai_client import get_async_client
+
+SSE_HEADERS = {
+    "Cache-Control": "no-cache",
+    "X-Accel-Buffering": "no"  # Tell nginx-style proxies not to buffer the stream
+}
+
+
+def sse_event(event: str, data: dict) -> str:
+    """Format one Server-Sent Event"""
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+
+async def stream_completion(
+    messages: List[dict],
+    usage: Optional[dict] = None,
+    **params
+) -> AsyncIterator[str]:
+    """
+    Ask GPT for a streamed answer and yield its text pieces as they arrive
+
+    Args:
+        messages: Chat messages
+        usage: Filled with the token counts once the stream ends (counted
+            from the pieces - an estimate - if the API doesn't report them)
+        **params: model, temperature, max_tokens...
+    """
+    stream = await get_async_client().chat.completions.create(
+        messages=messages,
+        stream=True,
+        # Ask for a last chunk with the token counts
+        extra_body={"stream_options": {"include_usage": True}},
+        **params
+    )
+    pieces = 0
+    reported = None
+    finished = False
+    try:
+        async for chunk in stream:
+            chunk_usage = getattr(chunk, "usage", None)
+            if chunk_usage:
+                reported = chunk_usage if isinstance(chunk_usage, dict) else chunk_usage.model_dump()
+            if chunk.choices and chunk.choices[0].delta.content:
+                pieces += 1
+                yield chunk.choices[0].delta.content
+        finished = True
+    except (asyncio.CancelledError, GeneratorExit):
+        # Nobody is reading any more (client disconnected)
+        cancellation_stats.record("generation", tokens_saved=params.get("max_tokens", 0) - pieces)
+        raise
+    finally:
+        if not finished:
+            # Closing the response aborts the request, so OpenAI stops generating.
+            # Shielded: the surrounding task is being cancelled.
+            with anyio.CancelScope(shield=True):
+                await stream.close()
+
+    if usage is not None:
+        if reported:
+            usage.update(reported)
+        else:
+            # One streamed piece is about one token
+            usage.update(completion_tokens=pieces, estimated=True)
@@ -0,0 +1,173 @@
+"""
+Text Extraction Helpers
+=======================
+Plain functions that pull text out of PDF, DOCX and TXT files.
+
+They live in their own small module (instead of on DocumentService) so they
+can be shipped to worker processes: a process pool only needs to import this
+file, not the whole app with its vector store and API clients.
+"""
+
+from concurrent.futures import Executor, as_completed
+from concurrent.futures.process import BrokenProcessPool
+from typing import Callable, List, Optional, Tuple
+import logging
+
+# Document processing libraries
+import PyPDF2
+from docx import Document
+
+logger = logging.getLogger(__name__)
+
+
+def count_pdf_pages(file_path: str) -> int:
+    """Number of pages in a PDF (cheap - pages are parsed lazily)"""
+    with open(file_path, 'rb') as file:
+        return len(PyPDF2.PdfReader(file).pages)
+
+
+def extract_pdf_page_range(file_path: str, start: int, stop: int) -> List[str]:
+    """
+    Extract the text of pages [start, stop) of a PDF
+
+    Each worker process opens the file itself, so only the file path and
+    the small list of page texts travel between processes.
+
+    Returns: one string per page, in page order
+    """
+    with open(file_path, 'rb') as file:
+        pdf_reader = PyPDF2.PdfReader(file)
+        return [pdf_reader.pages[i].extract_text() or "" for i in range(start, stop)]
+
+
+def extract_pdf_pages(
+    file_path: str,
+    executor: Optional[Executor] = None,
+    pages_per_task: int = 16,
+    min_parallel_pages: int = 32,
+    on_progress: Optional[Callable[[int, int], None]] = None
+) -> List[Tuple[int, str]]:
+    """
+    Extract text page by page, fanning page ranges out to a process pool
+
+    Small PDFs (or no executor) are read serially in this process, since
+    starting work in other processes costs more than it saves.
+
+    Args:
+        file_path: Path to the PDF
+        executor: Process pool to spread page ranges over
+        pages_per_task: How many pages each worker task extracts
+        min_parallel_pages: Below this many pages, don't bother going parallel
+        on_progress: Called as on_progress(pages_done, total_pages)
+
+    Returns:
+        List of (page_number, page_text) with page numbers starting at 1
+    """
+    try:
+        num_pages = count_pdf_pages(file_path)
+
+        if executor is None or num_pages < min_parallel_pages:
+            page_texts = extract_pdf_page_range(file_path, 0, num_pages)
+        else:
+            ranges = [
+                (start, min(start + pages_per_task, num_pages))
+                for start in range(0, num_pages, pages_per_task)
+            ]
+            futures = {
+                executor.submit(extract_pdf_page_range, file_path, start, stop): start
+                for start, stop in ranges
+            }
+            results = {}
+            pages_done = 0
+            for future in as_completed(futures):
+                page_list = future.result()
+                results[futures[future]] = page_list
+                pages_done += len(page_list)
+                if on_progress:
+                    on_progress(pages_done, num_pages)
+
+            # Put the ranges back in page order
+            page_texts = [text for start, _ in ranges for text in results[start]]
+
+        if on_progress:
+            on_progress(num_pages, num_pages)
+
+        logger.info(f"Extracted {sum(len(t) for t in page_texts)} characters from {num_pages} pages")
+        return [(i + 1, text) for i, text in enumerate(page_texts)]
+
+    except BrokenProcessPool:
+        # A worker died, not the PDF's fault - the caller replaces the pool
+        raise
+    except Exception as e:
+        logger.error(f"Error reading PDF: {str(e)}")
+        raise Exception(f"Failed to read PDF: {str(e)}")
+
+
+def extract_text_from_pdf(file_path: str) -> Tuple[str, int]:
+    """
+    Extract text from PDF file
+
+    Returns: (text_content, number_of_pages)
+    """
+    pages = extract_pdf_pages(file_path)
+    # Join once at the end instead of growing a string page by page
+    text = "".join(page_text + "\n" for _, page_text in pages)
+    return text, len(pages)
+
+
+def extract_text_from_docx(file_path: str) -> str:
+    """
+    Extract text from Word document (.docx)
+
+    Returns: text_content
+    """
+    try:
+        doc = Document(file_path)
+        text = "\n".join([paragraph.text for paragraph in doc.paragraphs])
+        logger.info(f"Extracted {len(text)} characters from DOCX")
+        return text
+
+    except Exception as e:
+        logger.error(f"Error reading DOCX: {str(e)}")
+        raise Exception(f"Failed to read DOCX: {str(e)}")
+
+
+def extract_text_from_txt(file_path: str) -> str:
+    """
+    Extract text from plain text file
+
+    Returns: text_content
+    """
+    try:
+        with open(file_path, 'r', encoding='utf-8') as file:
+            text = file.read()
+        logger.info(f"Extracted {len(text)} characters from TXT")
+        return text
+
+    except Exception as e:
+        logger.error(f"Error reading TXT: {str(e)}")
+        raise Exception(f"Failed to read TXT: {str(e)}")
+
+
+def extract_text(file_path: str, file_ext: str) -> Tuple[str, Optional[int]]:
+    """
+    Extract text from any supported file type
+
+    This is the function worker processes run, so it must stay a
+    module-level function (process pools can only call picklable things).
+
+    Args:
+        file_path: Path to the file on disk
+        file_ext: Lowercase extension including the dot (".pdf", ".docx", ".txt")
+
+    Returns:
+        (text_content, number_of_pages) - pages is None for non-PDF files
+    """
+    if file_ext == '.pdf':
+        return extract_text_from_pdf(file_path)
+    elif file_ext == '.docx':
+        return extract_text_from_docx(file_path), None
+    elif file_ext == '.txt':
+        return extract_text_from_txt(file_path), None
+    else:
+        raise Exception(f"Unsupported file type: {file_ext}")
@@ -0,0 +1,103 @@
+"""
+Text Splitter - Cutting documents into overlapping chunks
+=========================================================
+Search works on chunks of about CHUNK_SIZE characters, not whole
+documents. When LangChain is installed we use its
+RecursiveCharacterTextSplitter; otherwise this module does the same job
+itself, so chunking (and vector search) never depends on LangChain.
+
+How the fallback splits:
+- Try to cut on paragraph breaks first, then lines, then spaces, and
+  only cut inside a word when nothing else works
+- Pack the pieces back together up to chunk_size characters
+- Start each new chunk with the last ~chunk_overlap characters of the
+  previous one, so a sentence on a chunk boundary is never lost
+"""
+
+from typing import List
+
+# Try to import optional dependencies
+try:
+    from langchain.text_splitter import RecursiveCharacterTextSplitter
+    LANGCHAIN_AVAILABLE = True
+except ImportError:
+    LANGCHAIN_AVAILABLE = False
+
+# Separators tried in order, from "nicest" cut to "any character"
+SEPARATORS = ["\n\n", "\n", " ", ""]
+
+
+def _merge(pieces: List[str], separator: str, chunk_size: int, chunk_overlap: int) -> List[str]:
+    """Join small pieces into chunks of at most chunk_size, with overlap"""
+    chunks = []
+    current: List[str] = []
+    length = 0
+    for piece in pieces:
+        extra = len(piece) + (len(separator) if current else 0)
+        if current and length + extra > chunk_size:
+            chunk = separator.join(current).strip()
+            if chunk:
+                chunks.append(chunk)
+            # Drop pieces from the front until only the overlap is left
+            while current and (length > chunk_overlap or length + extra > chunk_size):
+                length -= len(current[0]) + (len(separator) if len(current) > 1 else 0)
+                current.pop(0)
+            extra = len(piece) + (len(separator) if current else 0)
+        current.append(piece)
+        length += extra
+    chunk = separator.join(current).strip()
+    if chunk:
+        chunks.append(chunk)
+    return chunks
+
+
+def _split(text: str, separators: List[str], chunk_size: int, chunk_overlap: int) -> List[str]:
+    """Split on the first separator that occurs, recursing into pieces that are still too long"""
+    separator = separators[-1]
+    remaining: List[str] = []
+    for i, candidate in enumerate(separators):
+        if candidate == "" or candidate in text:
+            separator = candidate
+            remaining = separators[i + 1:]
+            break
+
+    pieces = text.split(separator) if separator else list(text)
+
+    chunks = []
+    small: List[str] = []
+    for piece in pieces:
+        if len(piece) <= chunk_size:
+            small.append(piece)
+            continue
+        if small:
+            chunks.extend(_merge(small, separator, chunk_size, chunk_overlap))
+            small = []
+        if remaining:
+            chunks.extend(_split(piece, remaining, chunk_size, chunk_overlap))
+        else:
+            chunks.append(piece)
+    if small:
+        chunks.extend(_merge(small, separator, chunk_size, chunk_overlap))
+    return chunks
+
+
+def split_text(text: str, chunk_size: int, chunk_overlap: int) -> List[str]:
+    """
+    Split text into overlapping chunks
+
+    Args:
+        text: Full document text
+        chunk_size: Maximum characters per chunk
+        chunk_overlap: Characters repeated between neighbouring chunks
+
+    Returns:
+        List of chunk texts, in document order
+    """
+    if LANGCHAIN_AVAILABLE:
+        splitter = RecursiveCharacterTextSplitter(
+            chunk_size=chunk_size,
+            chunk_overlap=chunk_overlap,
+            length_function=len,
+        )
+        return splitter.split_text(text)
+    return _split(text, SEPARATORS, chunk_size, chunk_overlap)
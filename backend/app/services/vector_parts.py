@@ -0,0 +1,208 @@
+"""
+Vector Parts - Reading base/segment folders without loading them
+================================================================
+Each base or segment folder of the vector store is immutable once
+published. Instead of reading every chunk and vector into memory at
+startup, we *memory-map* the files: the operating system pages in only
+the bytes a search actually touches, and every process on the machine
+(e.g. several uvicorn workers) shares one copy in the page cache.
+
+Besides chunks.jsonl / vector_ids.i64 / vectors.f32, every folder has
+small lookup files so a chunk can be found without scanning:
+
+    chunk_ids.i64       chunk IDs in file order (sorted)
+    chunk_offsets.i64   byte offset of each chunk's line in chunks.jsonl
+                        (plus one final offset = end of file)
+    pages.json          doc_id → [[page, first chunk ID, last chunk ID], ...]
+                        (page runs, for page-range filters - see search_filters.py)
+    docs.json           doc_id → [[first chunk ID, last chunk ID], ...]
+"""
+
+import os
+import json
+import mmap
+import bisect
+from collections.abc import Mapping
+from typing import Dict, Iterator, List, Optional
+
+from app.services.search_filters import DocPages, add_page_run
+
+# Try to import optional dependencies
+try:
+    import numpy as np
+    NUMPY_AVAILABLE = True
+except ImportError:
+    NUMPY_AVAILABLE = False
+
+
+def _map_array(path: str, dtype, shape=None):
+    """Memory-map a binary array file (empty files give an empty array)"""
+    if not os.path.exists(path) or os.path.getsize(path) == 0:
+        return np.zeros((0,) + tuple((shape or (0,))[1:]), dtype=dtype)
+    return np.memmap(path, dtype=dtype, mode="r", shape=shape)
+
+
+def chunk_files(records: List[dict]) -> Dict[str, bytes]:
+    """
+    File contents for a folder's chunks: chunks.jsonl and its lookup files
+
+    Args:
+        records: [{"id", "text", "metadata"}, ...] in ID order
+    """
+    lines = [(json.dumps(record, ensure_ascii=False) + "\n").encode("utf-8") for record in records]
+    offsets = np.zeros(len(lines) + 1, dtype=np.int64)
+    if lines:
+        np.cumsum([len(line) for line in lines], out=offsets[1:])
+
+    docs: Dict[str, List[List[int]]] = {}
+    pages: DocPages = {}
+    for record in records:
+        doc_id = record["metadata"].get("doc_id")
+        if not doc_id:
+            continue
+        spans = docs.setdefault(doc_id, [])
+        if spans and spans[-1][1] == record["id"] - 1:
+            spans[-1][1] = record["id"]
+        else:
+            spans.append([record["id"], record["id"]])
+        add_page_run(pages.setdefault(doc_id, []), record["id"], record["metadata"].get("page"))
+
+    return {
+        "chunks.jsonl": b"".join(lines),
+        "chunk_ids.i64": np.asarray([record["id"] for record in records], dtype=np.int64).tobytes(),
+        "chunk_offsets.i64": offsets.tobytes(),
+        "pages.json": json.dumps(pages).encode("utf-8"),
+        "docs.json": json.dumps(docs).encode("utf-8")
+    }
+
+
+def merged_lookup_files(parts: List["PartReader"]) -> Dict[str, bytes]:
+    """
+    Lookup files for a folder whose chunks.jsonl is the parts' files joined
+
+    The chunks themselves are copied byte for byte, so only the offsets
+    need shifting.
+    """
+    offsets = [np.zeros(1, dtype=np.int64)]
+    docs: Dict[str, List[List[int]]] = {}
+    pages: DocPages = {}
+    shift = 0
+    for part in parts:
+        offsets.append(np.asarray(part.offsets[1:], dtype=np.int64) + shift)
+        shift += int(part.offsets[-1]) if len(part.offsets) else 0
+        for doc_id, spans in part.docs.items():
+            docs.setdefault(doc_id, []).extend(spans)
+        for doc_id, runs in part.pages.items():
+            pages.setdefault(doc_id, []).extend(runs)
+    return {
+        "chunk_ids.i64": b"".join(np.asarray(part.chunk_ids, dtype=np.int64).tobytes() for part in parts),
+        "chunk_offsets.i64": np.concatenate(offsets).tobytes(),
+        "pages.json": json.dumps(pages).encode("utf-8"),
+        "docs.json": json.dumps(docs).encode("utf-8")
+    }
+
+
+class PartReader:
+    """
+    One published base/segment folder, memory-mapped
+
+    Only the folder's file handles and the small docs.json / pages.json
+    live in Python memory; chunk text and vectors are read on demand.
+    """
+
+    def __init__(self, path: str, dim: Optional[int]):
+        self.path = path
+        self.name = os.path.basename(path)
+
+        self.chunk_ids = _map_array(os.path.join(path, "chunk_ids.i64"), np.int64)
+        self.offsets = _map_array(os.path.join(path, "chunk_offsets.i64"), np.int64)
+        with open(os.path.join(path, "docs.json"), "r") as f:
+            self.docs: Dict[str, List[List[int]]] = json.load(f)
+        with open(os.path.join(path, "pages.json"), "r") as f:
+            self.pages: DocPages = json.load(f)
+
+        self._chunks = None
+        chunks_path = os.path.join(path, "chunks.jsonl")
+        if os.path.getsize(chunks_path) > 0:
+            with open(chunks_path, "rb") as f:
+                self._chunks = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+        self.vector_ids = _map_array(os.path.join(path, "vector_ids.i64"), np.int64)
+        self.vectors = None
+        if len(self.vector_ids) and dim:
+            self.vectors = _map_array(os.path.join(path, "vectors.f32"), np.float32, (len(self.vector_ids), dim))
+
+    @property
+    def first_id(self) -> int:
+        return int(self.chunk_ids[0]) if len(self.chunk_ids) else -1
+
+    def get(self, chunk_id: int) -> Optional[dict]:
+        """One chunk's record, read from the mapped file (None if not here)"""
+        position = int(np.searchsorted(self.chunk_ids, chunk_id))
+        if position >= len(self.chunk_ids) or self.chunk_ids[position] != chunk_id:
+            return None
+        line = self._chunks[int(self.offsets[position]):int(self.offsets[position + 1])]
+        return json.loads(line)
+
+    def vectors_for(self, ids, out, found):
+        """Copy the vectors of whichever `ids` live here into `out` (marking `found`)"""
+        if self.vectors is None:
+            return
+        # IDs only grow, so the ID list is sorted
+        positions = np.minimum(np.searchsorted(self.vector_ids, ids), len(self.vector_ids) - 1)
+        hit = (self.vector_ids[positions] == ids) & ~found
+        if hit.any():
+            out[hit] = self.vectors[positions[hit]]
+            found |= hit
+
+
+class RecordsView(Mapping):
+    """
+    chunk ID → record, read lazily from the published parts
+
+    Behaves like the dict the vector store used to keep in memory.
+    Deleted (tombstoned) chunks are left out.
+    """
+
+    def __init__(self, parts: List[PartReader], tombstones: set):
+        self._parts = [part for part in parts if len(part.chunk_ids)]
+        self._firsts = [part.first_id for part in self._parts]
+        self._tombstones = tombstones
+        self._total = sum(len(part.chunk_ids) for part in self._parts)
+
+    def _part_for(self, chunk_id: int) -> Optional[PartReader]:
+        # Parts cover increasing, non-overlapping ID ranges
+        slot = bisect.bisect_right(self._firsts, chunk_id) - 1
+        return self._parts[slot] if slot >= 0 else None
+
+    def get(self, chunk_id: int, default=None) -> Optional[dict]:
+        if chunk_id in self._tombstones:
+            return default
+        part = self._part_for(chunk_id)
+        record = part.get(chunk_id) if part is not None else None
+        return record if record is not None else default
+
+    def __getitem__(self, chunk_id: int) -> dict:
+        record = self.get(chunk_id)
+        if record is None:
+            raise KeyError(chunk_id)
+        return record
+
+    def __contains__(self, chunk_id) -> bool:
+        if chunk_id in self._tombstones:
+            return False
+        part = self._part_for(chunk_id)
+        if part is None:
+            return False
+        position = int(np.searchsorted(part.chunk_ids, chunk_id))
+        return position < len(part.chunk_ids) and part.chunk_ids[position] == chunk_id
+
+    def __iter__(self) -> Iterator[int]:
+        for part in self._parts:
+            for chunk_id in part.chunk_ids.tolist():
+                if chunk_id not in self._tombstones:
+                    yield chunk_id
+
+    def __len__(self) -> int:
+        # Tombstones always name chunks that are still in some part
+        return self._total - len(self._tombstones)
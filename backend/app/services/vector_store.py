@@ -0,0 +1,1282 @@
+"""
+Vector Store - FAISS index with append-only persistence
+=======================================================
+Keeps chunk embeddings in a FAISS index for similarity search, and saves
+them to disk without ever rewriting what is already there.
+
+How saving works:
+- Every ingested document becomes a new, immutable *segment* folder
+  holding only its own chunks and vectors
+- MANIFEST.json lists which segments make up the index. A segment only
+  "exists" once the manifest mentions it, and the manifest is swapped in
+  atomically, so a crash mid-write can never corrupt the index
+- When segments pile up, a background thread merges them into a single
+  *base* folder and publishes a new manifest
+
+So adding document N+1 costs as much as writing document N+1, no matter
+how big the index already is.
+
+Several processes (e.g. uvicorn workers) can share one folder. Writing
+takes a lock file in it (write.lock), and a writer first catches up with
+manifests the others published - each manifest carries a generation
+number. Searches notice a replaced manifest with one stat() and catch up
+too. Merges, rebuilds and compactions take turns through maintenance.lock.
+
+Starting up without loading: the FAISS index is saved to an
+index-NNNNNN.faiss file named by the manifest (next to a note of which
+chunks it covers), so publishing a new one is the same single manifest
+swap as everything else. It is opened *memory-mapped* - the operating system reads pages of it only when
+a search touches them, and several server processes on one machine share
+one copy. Chunks are read straight from the segment files when a result
+needs them (see vector_parts.py). A mapped index is read-only, so vectors
+added after it was saved go into a small in-memory *delta* index, and
+searches look at both. When the delta reaches DELTA_MAX vectors, a
+background *checkpoint* saves a new index file that includes them.
+
+Index type: searches start on an exact flat index. Once the store holds
+`promote_at` vectors, a background thread builds the configured ANN
+index (IVF or HNSW - see ann_index.py), measures its recall against
+exact search, saves it and swaps it in. It is rebuilt
+again each time the corpus doubles.
+
+Quantization (optional): the promoted index can keep its vectors as
+fp16, int8 or PQ codes instead of float32 - 2x to ~100x less memory.
+Searches then fetch RERANK_FACTOR times more candidates and re-rank them
+exactly using the float32 vectors, which stay on disk and are read
+through a memory map (only the few rows needed are paged in).
+
+Deleting: a deleted document's chunk IDs become *tombstones*. They are
+written to a small tomb-NNNNNN.i64 file named by the manifest, and
+searches skip them straight away (an ID selector inside FAISS). Once
+tombstones make up COMPACT_RATIO of the index, a background compaction
+writes a new base without them, saves a fresh index built off to the
+side and swaps it in.
+
+Layout on disk:
+    vector_store/index/MANIFEST.json
+    vector_store/index/base-000012/    (merged segments)
+    vector_store/index/seg-000013/     (one ingest)
+        chunks.jsonl      one JSON record per chunk: {"id", "text", "metadata"}
+        chunk_ids.i64, chunk_offsets.i64, pages.json, docs.json   lookup files
+        vector_ids.i64    int64 ids of the rows in vectors.f32
+        vectors.f32       float32 embeddings, one row per vector id
+        segment.json      counts and dimensions
+    vector_store/index/index-000015.faiss   saved index (flat, IVF or HNSW)
+    vector_store/index/tomb-000014.i64   IDs of deleted chunks
+"""
+
+import os
+import json
+import time
+import shutil
+import threading
+from typing import Dict, List, Optional, Set, Tuple
+import logging
+
+from app.services import ann_index
+from app.services.file_lock import FileLock
+from app.services.search_filters import DocPages, SearchFilter
+from app.services.vector_parts import PartReader, RecordsView, chunk_files, merged_lookup_files
+
+# Try to import optional dependencies
+try:
+    import numpy as np
+    import faiss
+    FAISS_AVAILABLE = True
+except ImportError:
+    FAISS_AVAILABLE = False
+
+logger = logging.getLogger(__name__)
+
+MANIFEST_NAME = "MANIFEST.json"
+
+# Filtered searches over at most this many chunks compare against each of
+# them exactly instead of asking the (approximate) index
+EXACT_SCAN_MAX = 20000
+
+def _fsync_dir(path: str):
+    """Make a rename inside `path` durable (not supported on Windows - skip there)"""
+    try:
+        fd = os.open(path, os.O_RDONLY)
+    except OSError:
+        return
+    try:
+        os.fsync(fd)
+    except OSError:
+        pass
+    finally:
+        os.close(fd)
+
+
+def _add_doc_spans(
+    doc_chunks: Dict[str, List[int]],
+    doc_pages: DocPages,
+    tombstones: Set[int],
+    docs: Dict[str, List[List[int]]],
+    pages: DocPages
+):
+    """Add one part's documents (chunk ID spans and page runs) to the lookup maps, skipping deleted ones"""
+    for doc_id, spans in docs.items():
+        if spans[0][0] in tombstones:
+            continue
+        doc_pages.setdefault(doc_id, []).extend(pages.get(doc_id, []))
+        existing = doc_chunks.get(doc_id)
+        if existing is None and len(spans) == 1:
+            # The usual case - a range costs nothing per chunk
+            doc_chunks[doc_id] = range(spans[0][0], spans[0][1] + 1)
+        else:
+            doc_chunks[doc_id] = list(existing or []) + [
+                chunk_id for first, last in spans for chunk_id in range(first, last + 1)
+            ]
+
+
+def _write_file(path: str, data: bytes):
+    """Write a file and make sure it actually reached the disk"""
+    with open(path, "wb") as file:
+        file.write(data)
+        file.flush()
+        os.fsync(file.fileno())
+
+
+class VectorStore:
+    """
+    FAISS index of chunk embeddings, persisted as a base + append-only segments
+
+    Chunk IDs are global integers handed out in order, and they are also
+    the FAISS vector IDs, so a search result maps straight to its record.
+    """
+
+    def __init__(
+        self,
+        root_dir: str,
+        merge_segments: int = 8,
+        index_type: str = "flat",
+        promote_at: int = 20000,
+        nprobe: int = 16,
+        hnsw_m: int = 32,
+        ef_construction: int = 200,
+        ef_search: int = 64,
+        compact_ratio: float = 0.2,
+        quantization: str = "none",
+        pq_m: int = 64,
+        rerank_factor: int = 4,
+        delta_max: int = 20000
+    ):
+        """
+        Args:
+            root_dir: Folder holding the manifest, base and segments
+            merge_segments: Start a background merge once this many segments exist
+            index_type: "flat", "ivf" or "hnsw" - the index to promote to
+            promote_at: Stay on the exact flat index below this many vectors
+            nprobe: IVF clusters scanned per search
+            hnsw_m: HNSW links per node
+            ef_construction: HNSW build-time search depth
+            ef_search: HNSW search depth
+            compact_ratio: Compact once this share of the vectors is deleted
+            quantization: How the promoted index stores vectors: "none",
+                "fp16", "int8" or "pq"
+            pq_m: Bytes per vector with "pq"
+            rerank_factor: Candidates fetched per result for exact re-ranking
+                (quantized indexes only)
+            delta_max: Checkpoint once this many vectors are held in memory
+                outside the saved index
+        """
+        if index_type not in ann_index.INDEX_TYPES:
+            raise ValueError(f"Unknown index type '{index_type}' (use one of {', '.join(ann_index.INDEX_TYPES)})")
+        if quantization not in ann_index.QUANTIZATIONS:
+            raise ValueError(
+                f"Unknown quantization '{quantization}' (use one of {', '.join(ann_index.QUANTIZATIONS)})"
+            )
+        self.root_dir = root_dir
+        self.merge_segments = merge_segments
+        self.index_type = index_type
+        self.promote_at = promote_at
+        self.nprobe = nprobe
+        self.hnsw_m = hnsw_m
+        self.ef_construction = ef_construction
+        self.ef_search = ef_search
+        self.compact_ratio = compact_ratio
+        self.quantization = quantization
+        self.pq_m = pq_m
+        self.rerank_factor = max(rerank_factor, 1)
+        self.delta_max = delta_max
+        self.manifest = {
+            "version": 1,
+            "dim": None,
+            "base": None,
+            "segments": [],
+            "tombstones": None,
+            "next_id": 0,
+            "next_segment": 1,
+            "generation": 0,  # +1 on every publish
+            "index": None,  # saved index file
+            "index_info": None  # which chunks it covers + recall report
+        }
+
+        # main: the saved index file, memory-mapped and read-only, holding
+        #   every vector below covered_id
+        # delta: in-memory flat index with the vectors added since
+        self.main = None
+        self.delta = None
+        self.covered_id = 0
+
+        # Deleted chunk IDs whose vectors may still be in the index, and the
+        # FAISS selector that hides them from searches
+        self.tombstones: Set[int] = set()
+        self._live_selector = None
+
+        # Published parts (memory-mapped) and a chunk ID → record view over them
+        self._parts: Dict[str, PartReader] = {}
+        self.records = RecordsView([], self.tombstones)
+        self.doc_chunks: Dict[str, List[int]] = {}  # doc_id → chunk IDs (for filtered searches)
+        self.doc_pages: DocPages = {}  # doc_id → page runs (for page-range searches)
+
+        # How many vectors the current ANN index was built from, and the
+        # last rebuild's report
+        self.ann_built_count = 0
+        self.last_rebuild: Optional[dict] = None
+
+        os.makedirs(self.root_dir, exist_ok=True)
+
+        # _write_lock: one writer at a time (segment files + manifest),
+        #   across processes too - several server workers can share the
+        #   folder. Whoever takes it first catches up with what the others
+        #   published (_sync), and searches do the same when the manifest
+        #   changed (_refresh)
+        # _lock: protects the in-memory state; searches hold it only to
+        #   copy references (main, the selector, records are replaced
+        #   whole, never changed in place)
+        # _delta_lock: the delta index is changed in place, so adding to
+        #   or trimming it (which also holds _lock) and searching it take turns
+        # _maintenance_lock: merges, checkpoints, rebuilds and compactions
+        #   read part files, so they take turns, across processes too (a
+        #   merge deletes the parts it merged)
+        self._write_lock = FileLock(os.path.join(self.root_dir, "write.lock"))
+        self._lock = threading.RLock()
+        self._delta_lock = threading.Lock()
+        self._maintenance_lock = FileLock(os.path.join(self.root_dir, "maintenance.lock"))
+        self._manifest_stamp: Optional[tuple] = None  # the MANIFEST.json we last read or wrote
+        self._merge_thread: Optional[threading.Thread] = None
+        self._rebuild_thread: Optional[threading.Thread] = None
+        self._compact_thread: Optional[threading.Thread] = None
+
+    # ---------- loading ----------
+
+    def load(self):
+        """
+        Open the published index: map the saved index and the part files
+
+        Only vectors newer than the saved index are read into memory, so
+        this takes about as long for ten manuals as for ten thousand.
+        """
+        with self._write_lock:
+            manifest = self._read_manifest() or self.manifest
+            # Leftovers are only safe to delete while nobody is writing: we
+            # hold the write lock, and maintenance (which writes outside it)
+            # must not be running in any process either
+            if self._maintenance_lock.acquire(blocking=False):
+                try:
+                    self._remove_unpublished(manifest)
+                finally:
+                    self._maintenance_lock.release()
+            self._apply_manifest(manifest)
+
+        logger.info(
+            f"Loaded vector store: {len(self.records)} chunks in {len(self._parts)} parts, "
+            f"{self.index_kind} index ({self._mapped_count} vectors mapped, {self._delta_count} in memory)"
+        )
+        self._maybe_rebuild()
+
+    def _manifest_stamp_now(self) -> Optional[tuple]:
+        """Changes whenever MANIFEST.json is replaced (None while there is none)"""
+        try:
+            stat = os.stat(os.path.join(self.root_dir, MANIFEST_NAME))
+        except OSError:
+            return None
+        return (stat.st_ino, stat.st_mtime_ns, stat.st_size)
+
+    def _read_manifest(self) -> Optional[dict]:
+        """The published manifest on disk, or None if nothing was published yet"""
+        stamp = self._manifest_stamp_now()
+        try:
+            with open(os.path.join(self.root_dir, MANIFEST_NAME), "r") as f:
+                manifest = json.load(f)
+        except FileNotFoundError:
+            return None
+        self._manifest_stamp = stamp
+        return manifest
+
+    def _sync(self):
+        """
+        Catch up with manifests other processes published (call with the
+        write lock held, before changing anything)
+        """
+        if self._manifest_stamp_now() == self._manifest_stamp:
+            return
+        manifest = self._read_manifest()
+        if manifest is not None and manifest.get("generation", 0) != self.manifest.get("generation", 0):
+            self._apply_manifest(manifest)
+
+    def _refresh(self):
+        """
+        Pick up what other processes published, for searches
+
+        Costs one stat() when nothing changed. If a writer is busy right
+        now, the refresh is left to the next search.
+        """
+        if self._manifest_stamp_now() == self._manifest_stamp:
+            return
+        if not self._write_lock.acquire(blocking=False):
+            return
+        try:
+            self._sync()
+        finally:
+            self._write_lock.release()
+
+    def _apply_manifest(self, manifest: dict):
+        """
+        Bring the in-memory state up to a published manifest (call with
+        the write lock held)
+
+        Used at load and after other processes published. Parts already
+        open are reused, the saved index is only mapped again if the
+        manifest names a different one, and only vectors added since the
+        last manifest we saw are read into the delta.
+        """
+        old = self.manifest
+        dim = manifest["dim"]
+        tombstones = self._read_tombstones(manifest)
+        parts = self._open_parts(manifest)
+
+        main, info = self.main, self.last_rebuild
+        if manifest.get("index") != old.get("index") or (main is None and manifest.get("index")):
+            main, info = self._map_main(manifest)
+        covered_id = info["covered_id"] if main is not None else 0
+
+        # The delta holds the live vectors from covered_id up to next_id
+        delta, start = self.delta, max(old["next_id"], covered_id)
+        if delta is None or covered_id < self.covered_id:
+            delta, start = (self._empty_flat(dim) if dim else None), covered_id
+        new_ids, new_vectors = self._read_vector_range(parts.values(), start, manifest["next_id"], tombstones)
+
+        doc_chunks: Dict[str, List[int]] = {}
+        doc_pages: DocPages = {}
+        for part in parts.values():
+            _add_doc_spans(doc_chunks, doc_pages, tombstones, part.docs, part.pages)
+
+        with self._lock:
+            self.manifest = manifest
+            self.tombstones = tombstones
+            self._set_parts(parts)
+            self.doc_chunks, self.doc_pages = doc_chunks, doc_pages
+            with self._delta_lock:
+                if len(new_ids):
+                    delta.add_with_ids(new_vectors, new_ids)
+                self.delta = delta
+            if main is None:
+                self.main, self.covered_id, self.ann_built_count = None, 0, 0
+            elif main is not self.main:
+                self._swap_main(main, info)
+            self._update_live_selector()
+
+    def _map_main(self, manifest: dict):
+        """
+        Memory-map the saved index a manifest names
+
+        Returns: (index, its info), or (None, None) if there is no usable one
+        """
+        name = manifest.get("index")
+        info = manifest.get("index_info")
+        if not name or not info:
+            return None, None
+        try:
+            index = ann_index.read_index_mapped(os.path.join(self.root_dir, name))
+            ann_index.set_search_params(index, nprobe=self.nprobe, ef_search=self.ef_search)
+        except Exception as e:
+            logger.warning(f"⚠️  Could not open saved index {name}, rebuilding it: {e}")
+            return None, None
+        return index, info
+
+    def _read_vector_range(self, parts, start: int, stop: int, tombstones: Set[int]):
+        """Live vectors with IDs in [start, stop): (vector_ids, vectors)"""
+        deleted = np.fromiter(tombstones, dtype=np.int64)
+        found_ids, found_vectors = [], []
+        for part in parts:
+            if part.vectors is None:
+                continue
+            # IDs are sorted, so parts outside the range are skipped unread
+            first, last = np.searchsorted(part.vector_ids, [start, stop])
+            if first == last:
+                continue
+            vector_ids = np.asarray(part.vector_ids[first:last])
+            keep = ~np.isin(vector_ids, deleted)
+            found_ids.append(vector_ids[keep])
+            found_vectors.append(np.ascontiguousarray(part.vectors[first:last][keep]))
+        if not found_ids:
+            return np.zeros(0, dtype=np.int64), None
+        return np.concatenate(found_ids), np.concatenate(found_vectors)
+
+    def _empty_flat(self, dim: int):
+        return ann_index.build_index("flat", dim, np.zeros((0, dim), dtype=np.float32), np.zeros(0, dtype=np.int64))
+
+    def _read_tombstones(self, manifest: dict) -> Set[int]:
+        """Deleted chunk IDs listed by the manifest's tombstone file"""
+        name = manifest.get("tombstones")
+        if not name:
+            return set()
+        return set(np.fromfile(os.path.join(self.root_dir, name), dtype=np.int64).tolist())
+
+    def _published_parts(self, manifest: dict) -> List[str]:
+        """Folder names the manifest says make up the index, oldest first"""
+        return ([manifest["base"]] if manifest["base"] else []) + list(manifest["segments"])
+
+    def _remove_unpublished(self, manifest: dict):
+        """
+        Delete folders and index files the manifest doesn't mention
+
+        These are leftovers from a crash (a half-written segment, an index
+        saved but never published) or from a merge whose old parts weren't
+        cleaned up yet. Only call this while no process can be writing.
+        """
+        published = set(self._published_parts(manifest))
+        for name in os.listdir(self.root_dir):
+            path = os.path.join(self.root_dir, name)
+            if os.path.isdir(path) and name not in published:
+                shutil.rmtree(path, ignore_errors=True)
+            elif name.endswith(".tmp"):
+                # Half-written manifest or tombstone files
+                os.remove(path)
+            elif name.startswith("index-") and name != manifest.get("index"):
+                os.remove(path)
+            elif name.startswith("tomb-") and name != manifest.get("tombstones"):
+                # Tombstone list replaced by a newer one
+                os.remove(path)
+
+    def _open_parts(self, manifest: dict) -> Dict[str, PartReader]:
+        """Map every part a manifest publishes (reusing those already open)"""
+        dim = manifest["dim"]
+        parts = {}
+        for name in self._published_parts(manifest):
+            part = self._parts.get(name)
+            if part is None or (part.vectors is None and len(part.vector_ids) and dim):
+                part = PartReader(os.path.join(self.root_dir, name), dim)
+            parts[name] = part
+        return parts
+
+    def _set_parts(self, parts: Dict[str, PartReader]):
+        """Switch to newly opened parts and refresh self.records"""
+        # Searches still holding a dropped reader keep working: a map stays
+        # valid even after a merge deletes its file
+        self._parts = parts
+        self.records = RecordsView(list(parts.values()), self.tombstones)
+
+    def _add_docs(self, docs: Dict[str, List[List[int]]], pages: DocPages):
+        """Remember which chunk IDs (and page runs) belong to which document (skipping deleted ones)"""
+        _add_doc_spans(self.doc_chunks, self.doc_pages, self.tombstones, docs, pages)
+
+    def _fetch_vectors(self, ids):
+        """
+        Full float32 vectors for some IDs, read from the mapped part files
+
+        Returns: (ids found, their vectors)
+        """
+        ids = np.asarray(ids, dtype=np.int64)
+        out = np.empty((len(ids), self.manifest["dim"] or 0), dtype=np.float32)
+        found = np.zeros(len(ids), dtype=bool)
+        for part in list(self._parts.values()):
+            part.vectors_for(ids, out, found)
+        return ids[found], out[found]
+
+    def _read_live_vectors(self, parts: List[PartReader], dim: int, deleted):
+        """All vectors in these parts except deleted ones: (vector_ids, vectors)"""
+        loaded = [(part.vector_ids, part.vectors) for part in parts if part.vectors is not None]
+        if not loaded:
+            return np.zeros(0, dtype=np.int64), np.zeros((0, dim), dtype=np.float32)
+        vector_ids = np.concatenate([ids for ids, _ in loaded])
+        vectors = np.concatenate([v for _, v in loaded])
+        if len(deleted):
+            keep = ~np.isin(vector_ids, deleted)
+            vector_ids, vectors = vector_ids[keep], vectors[keep]
+        return vector_ids, vectors
+
+    # ---------- writing ----------
+
+    def _next_name(self, prefix: str) -> str:
+        """Reserve a new folder or file name (published with the next manifest)"""
+        name = f"{prefix}-{self.manifest['next_segment']:06d}"
+        self.manifest["next_segment"] += 1
+        return name
+
+    def _write_part(self, name: str, records: List[dict], vector_ids, vectors, dim: Optional[int]):
+        """Write a folder under a temp name, then rename it into place"""
+        final_path = os.path.join(self.root_dir, name)
+        tmp_path = final_path + ".tmp"
+        shutil.rmtree(tmp_path, ignore_errors=True)
+        os.makedirs(tmp_path)
+
+        for filename, data in chunk_files(records).items():
+            _write_file(os.path.join(tmp_path, filename), data)
+        _write_file(os.path.join(tmp_path, "vector_ids.i64"), np.asarray(vector_ids, dtype=np.int64).tobytes())
+        _write_file(os.path.join(tmp_path, "vectors.f32"), np.asarray(vectors, dtype=np.float32).tobytes())
+        _write_file(os.path.join(tmp_path, "segment.json"), json.dumps({
+            "count": len(records),
+            "vectors": len(vector_ids),
+            "dim": dim,
+            "created_at": time.time()
+        }).encode("utf-8"))
+
+        os.rename(tmp_path, final_path)
+        _fsync_dir(self.root_dir)
+
+    def _publish(self, manifest: dict):
+        """
+        Atomically replace MANIFEST.json - this is the commit point (call
+        with the write lock held, after _sync)
+
+        Every manifest gets a new generation number, which is how other
+        processes notice they are behind.
+        """
+        manifest["generation"] = self.manifest.get("generation", 0) + 1
+        manifest_path = os.path.join(self.root_dir, MANIFEST_NAME)
+        tmp_path = f"{manifest_path}.tmp"
+        _write_file(tmp_path, json.dumps(manifest, indent=2).encode("utf-8"))
+        os.replace(tmp_path, manifest_path)
+        _fsync_dir(self.root_dir)
+        self._manifest_stamp = self._manifest_stamp_now()
+        self.manifest = manifest
+        self._set_parts(self._open_parts(manifest))
+
+    def _publish_reserved(self):
+        """
+        Publish names just reserved with _next_name for files written
+        outside the write lock, so other processes don't reserve them too
+        """
+        self._publish(dict(self.manifest))
+
+    def add(self, records: List[dict], vectors=None) -> List[int]:
+        """
+        Append chunks (and optionally their vectors) as a new segment
+
+        Args:
+            records: [{"text": ..., "metadata": {...}}, ...]
+            vectors: Array of shape (len(records), dim), or None to store
+                the chunks without embeddings (not vector-searchable)
+
+        Returns:
+            The chunk IDs assigned to the records
+        """
+        if not records:
+            return []
+
+        if vectors is not None:
+            vectors = np.ascontiguousarray(vectors, dtype=np.float32)
+            if vectors.ndim != 2 or vectors.shape[0] != len(records):
+                raise ValueError("Need exactly one vector per record")
+
+        with self._write_lock:
+            self._sync()
+            dim = self.manifest["dim"]
+            if vectors is not None:
+                if dim is not None and vectors.shape[1] != dim:
+                    raise ValueError(f"Vector size {vectors.shape[1]} does not match index size {dim}")
+                dim = vectors.shape[1]
+
+            first_id = self.manifest["next_id"]
+            ids = list(range(first_id, first_id + len(records)))
+            records = [dict(record, id=chunk_id) for chunk_id, record in zip(ids, records)]
+            vector_ids = np.asarray(ids if vectors is not None else [], dtype=np.int64)
+            if vectors is None:
+                vectors = np.zeros((0, dim or 0), dtype=np.float32)
+
+            name = self._next_name("seg")
+            self._write_part(name, records, vector_ids, vectors, dim)
+
+            manifest = dict(self.manifest)
+            manifest["dim"] = dim
+            manifest["next_id"] = first_id + len(records)
+            manifest["segments"] = self.manifest["segments"] + [name]
+
+            with self._lock:
+                self._publish(manifest)
+                self._add_docs(self._parts[name].docs, self._parts[name].pages)
+                if len(vector_ids):
+                    with self._delta_lock:
+                        if self.delta is None:
+                            self.delta = self._empty_flat(dim)
+                        self.delta.add_with_ids(vectors, vector_ids)
+
+        self._maybe_merge()
+        self._maybe_rebuild()
+        return ids
+
+    # ---------- background merging ----------
+
+    def _maybe_merge(self):
+        """Start a background merge if enough segments have piled up"""
+        if len(self.manifest["segments"]) < self.merge_segments:
+            return
+        if self._merge_thread is not None and self._merge_thread.is_alive():
+            return
+        self._merge_thread = threading.Thread(target=self.merge, name="vector-store-merge", daemon=True)
+        self._merge_thread.start()
+
+    def merge(self):
+        """
+        Merge the base and all current segments into a new base
+
+        The slow part (copying files) runs without holding the write lock,
+        so ingestion carries on; segments added meanwhile stay in the
+        manifest after the new base. Nothing in the indexes changes - the
+        same chunks just live in fewer files.
+        """
+        with self._maintenance_lock:
+            self._merge()
+
+    def _merge(self):
+        with self._write_lock:
+            self._sync()
+            parts = self._published_parts(self.manifest)
+            if len(parts) < 2:
+                return
+            readers = [self._parts[part] for part in parts]
+            name = self._next_name("base")
+            dim = self.manifest["dim"]
+            self._publish_reserved()
+
+        try:
+            final_path = os.path.join(self.root_dir, name)
+            tmp_path = final_path + ".tmp"
+            shutil.rmtree(tmp_path, ignore_errors=True)
+            os.makedirs(tmp_path)
+
+            # Data files are plain concatenations; only the lookup files need shifting
+            for filename in ("chunks.jsonl", "vector_ids.i64", "vectors.f32"):
+                with open(os.path.join(tmp_path, filename), "wb") as out:
+                    for part in parts:
+                        with open(os.path.join(self.root_dir, part, filename), "rb") as src:
+                            shutil.copyfileobj(src, out)
+                    out.flush()
+                    os.fsync(out.fileno())
+            for filename, data in merged_lookup_files(readers).items():
+                _write_file(os.path.join(tmp_path, filename), data)
+
+            count = sum(len(reader.chunk_ids) for reader in readers)
+            _write_file(os.path.join(tmp_path, "segment.json"), json.dumps({
+                "count": count,
+                "vectors": sum(len(reader.vector_ids) for reader in readers),
+                "dim": dim,
+                "created_at": time.time()
+            }).encode("utf-8"))
+
+            os.rename(tmp_path, final_path)
+            _fsync_dir(self.root_dir)
+
+            with self._write_lock:
+                self._sync()
+                with self._lock:
+                    manifest = dict(self.manifest)
+                    manifest["base"] = name
+                    manifest["segments"] = [s for s in self.manifest["segments"] if s not in parts]
+                    self._publish(manifest)
+
+            for part in parts:
+                shutil.rmtree(os.path.join(self.root_dir, part), ignore_errors=True)
+            logger.info(f"✅ Merged {len(parts)} index parts into {name} ({count} chunks)")
+
+        except Exception as e:
+            # The old parts are untouched and still published, so nothing is lost
+            logger.error(f"❌ Vector store merge failed: {str(e)}")
+            shutil.rmtree(os.path.join(self.root_dir, name + ".tmp"), ignore_errors=True)
+
+    # ---------- deleting and compacting ----------
+
+    def _update_live_selector(self):
+        """Rebuild the selector that hides tombstoned IDs (call with the lock held or at load)"""
+        if not self.tombstones:
+            self._live_selector = None
+            return
+        deleted = np.fromiter(sorted(self.tombstones), dtype=np.int64)
+        batch = faiss.IDSelectorBatch(deleted)
+        selector = faiss.IDSelectorNot(batch)
+        selector.batch = batch  # IDSelectorNot doesn't own it - keep it alive
+        self._live_selector = selector
+
+    def _publish_tombstones(self, tombstones: Set[int]):
+        """Write a new tombstone file and publish it (call with the write lock held)"""
+        old_name = self.manifest.get("tombstones")
+        manifest = dict(self.manifest)
+        manifest["tombstones"] = None
+        if tombstones:
+            name = self._next_name("tomb")
+            path = os.path.join(self.root_dir, name)
+            _write_file(path + ".tmp", np.asarray(sorted(tombstones), dtype=np.int64).tobytes())
+            os.replace(path + ".tmp", path)
+            manifest["tombstones"] = name
+            manifest["next_segment"] = self.manifest["next_segment"]
+        self._publish(manifest)
+        if old_name:
+            try:
+                os.remove(os.path.join(self.root_dir, old_name))
+            except OSError:
+                pass
+
+    def delete_document(self, doc_id: str) -> int:
+        """
+        Remove a document's chunks from search right away
+
+        The vectors stay on disk and in the index (as tombstones) until the
+        next compaction.
+
+        Returns: Number of chunks deleted
+        """
+        with self._write_lock:
+            self._sync()
+            with self._lock:
+                chunk_ids = list(self.doc_chunks.get(doc_id, []))
+            if not chunk_ids:
+                return 0
+
+            # Durable first: once the manifest lists them, they stay deleted after a crash
+            self._publish_tombstones(self.tombstones | set(chunk_ids))
+
+            with self._lock:
+                self.tombstones.update(chunk_ids)
+                self.doc_chunks.pop(doc_id, None)
+                self.doc_pages.pop(doc_id, None)
+                self._update_live_selector()
+
+        logger.info(f"🗑️  Deleted {len(chunk_ids)} chunks of document {doc_id} from the vector store")
+        self._maybe_compact()
+        return len(chunk_ids)
+
+    def _maybe_compact(self):
+        """Start a background compaction once enough of the index is deleted"""
+        if not self.tombstones or self.vector_count == 0:
+            return
+        if len(self.tombstones) < self.compact_ratio * self.vector_count:
+            return
+        if self._compact_thread is not None and self._compact_thread.is_alive():
+            return
+        self._compact_thread = threading.Thread(target=self.compact, name="vector-store-compact", daemon=True)
+        self._compact_thread.start()
+
+    def compact(self):
+        """
+        Physically drop deleted chunks: new base on disk, new saved index
+
+        Runs without blocking searches or ingestion: the new base and index
+        are built from a snapshot, chunks added meanwhile stay in the delta
+        index, and only the final swap takes the locks.
+        """
+        with self._maintenance_lock:
+            try:
+                self._compact()
+            except Exception as e:
+                logger.error(f"❌ Vector store compaction failed: {str(e)}")
+
+    def _compact(self):
+        with self._write_lock, self._lock:
+            self._sync()
+            parts = self._published_parts(self.manifest)
+            readers = [self._parts[part] for part in parts]
+            dropped = set(self.tombstones)
+            dim = self.manifest["dim"]
+            covered_id = self.manifest["next_id"]
+            kind = self.index_kind
+            quantization = self.index_quantization
+            if not parts or not dropped or dim is None:
+                return
+            name = self._next_name("base")
+            index_name = self._next_name("index") + ".faiss"
+            self._publish_reserved()
+
+        started = time.perf_counter()
+        deleted = np.fromiter(sorted(dropped), dtype=np.int64)
+
+        # New base on disk: every part's live chunks and vectors
+        records = []
+        for part in parts:
+            with open(os.path.join(self.root_dir, part, "chunks.jsonl"), "r", encoding="utf-8") as f:
+                for line in f:
+                    if line.strip():
+                        record = json.loads(line)
+                        if record["id"] not in dropped:
+                            records.append(record)
+        vector_ids, vectors = self._read_live_vectors(readers, dim, deleted)
+        self._write_part(name, records, vector_ids, vectors, dim)
+        del records
+        if len(vector_ids) < self.promote_at:
+            # Shrunk below the promotion size - back to exact search
+            kind, quantization = "flat", "none"
+
+        # New index of the same type, built off to the side and saved
+        index = ann_index.build_index(
+            kind, dim, vectors, vector_ids,
+            m=self.hnsw_m, ef_construction=self.ef_construction,
+            quantization=quantization, pq_m=self.pq_m
+        )
+        ann_index.set_search_params(index, nprobe=self.nprobe, ef_search=self.ef_search)
+        del vectors
+        info = dict(
+            self.last_rebuild or {},
+            type=kind, quantization=quantization, count=int(len(vector_ids)),
+            vectors=int(index.ntotal), covered_id=covered_id, compacted_at=time.time()
+        )
+        mapped = self._save_main(index_name, index)
+        del index
+
+        with self._write_lock:
+            self._sync()
+            with self._lock:
+                old_index = self.manifest.get("index")
+                manifest = dict(self.manifest)
+                manifest["base"] = name
+                manifest["segments"] = [s for s in self.manifest["segments"] if s not in parts]
+                manifest["index"] = index_name
+                manifest["index_info"] = info
+                self._publish(manifest)
+                self._swap_main(mapped, info)
+                # Chunks deleted while we worked are still in the delta or the new index
+                self.tombstones -= dropped
+                self._update_live_selector()
+            self._publish_tombstones(set(self.tombstones))
+
+        for part in parts:
+            shutil.rmtree(os.path.join(self.root_dir, part), ignore_errors=True)
+        self._remove_index_file(old_index)
+        logger.info(
+            f"✅ Compacted vector store: dropped {len(dropped)} deleted chunks "
+            f"in {time.perf_counter() - started:.1f}s"
+        )
+        self._maybe_rebuild()
+
+    # ---------- checkpoints and ANN promotion ----------
+
+    @property
+    def index_kind(self) -> str:
+        """Type of the saved index searches currently use"""
+        return ann_index.index_kind(self.main) if self.main is not None else "flat"
+
+    @property
+    def index_quantization(self) -> str:
+        """How the saved index stores its vectors"""
+        return ann_index.index_quantization(self.main) if self.main is not None else "none"
+
+    @property
+    def _mapped_count(self) -> int:
+        return self.main.ntotal if self.main is not None else 0
+
+    @property
+    def _delta_count(self) -> int:
+        return self.delta.ntotal if self.delta is not None else 0
+
+    @property
+    def vector_count(self) -> int:
+        """Vectors in the saved and delta indexes (including tombstoned ones)"""
+        return self._mapped_count + self._delta_count
+
+    def _is_plain(self, index) -> bool:
+        """True for an exact float32 flat index (nothing to promote or re-rank)"""
+        return ann_index.index_kind(index) == "flat" and ann_index.index_quantization(index) == "none"
+
+    def _maybe_rebuild(self):
+        """
+        Start a background rebuild or checkpoint when the policy says so
+
+        - build the configured index type once there are promote_at
+          vectors, and again whenever the corpus has doubled since the
+          last build (IVF clusters and HNSW graphs are sized for the data
+          they saw)
+        - otherwise checkpoint (save the delta into the saved index) once
+          the delta holds delta_max vectors
+        """
+        if self.delta is None:
+            return
+        if self._rebuild_thread is not None and self._rebuild_thread.is_alive():
+            return
+        live = self.vector_count - len(self.tombstones)
+        target = (self.index_type, self.quantization)
+        promoted = target != ("flat", "none") and live >= max(self.promote_at, 1)
+        current = (self.index_kind, self.index_quantization) if self.main is not None else None
+
+        if promoted and (current != target or live >= 2 * max(self.ann_built_count, 1)):
+            full = True
+        elif self._delta_count >= max(self.delta_max, 1):
+            full = False
+        else:
+            return
+        self._rebuild_thread = threading.Thread(
+            target=self.rebuild_index, args=(full,), name="vector-store-rebuild", daemon=True
+        )
+        self._rebuild_thread.start()
+
+    def rebuild_index(self, full: bool = True):
+        """
+        Save a new index file and switch searches over to it
+
+        Args:
+            full: Build the configured index type from every vector on disk
+                (measuring its recall); otherwise checkpoint - add the
+                delta's vectors to a copy of the current saved index
+
+        Searches keep using the current indexes while this runs. Vectors
+        added meanwhile stay in the delta, so nothing goes missing.
+        """
+        with self._maintenance_lock:
+            try:
+                self._rebuild(full)
+            except Exception as e:
+                logger.error(f"❌ Vector index rebuild failed: {str(e)}")
+
+    def _save_main(self, name: str, index):
+        """
+        Write an index under a new, reserved name and map it
+
+        Nothing uses the file until a manifest names it (together with its
+        info), so the file and the chunks it covers always change in one
+        atomic step.
+        """
+        path = os.path.join(self.root_dir, name)
+        faiss.write_index(index, path)
+        with open(path, "rb") as f:
+            os.fsync(f.fileno())
+        mapped = ann_index.read_index_mapped(path)
+        ann_index.set_search_params(mapped, nprobe=self.nprobe, ef_search=self.ef_search)
+        return mapped
+
+    def _publish_main(self, name: str, mapped, info: dict):
+        """Publish a saved index and switch searches to it (call with the write lock held)"""
+        old_name = self.manifest.get("index")
+        manifest = dict(self.manifest)
+        manifest["index"] = name
+        manifest["index_info"] = info
+        with self._lock:
+            self._publish(manifest)
+            self._swap_main(mapped, info)
+        self._remove_index_file(old_name)
+
+    def _remove_index_file(self, name: Optional[str]):
+        """Delete a saved index no manifest names any more (searches still mapping it keep working)"""
+        if not name:
+            return
+        try:
+            os.remove(os.path.join(self.root_dir, name))
+        except OSError:
+            pass
+
+    def _swap_main(self, mapped, info: dict):
+        """Search a newly saved index and drop what it covers from the delta (call with the lock held)"""
+        self.main = mapped
+        self.covered_id = info["covered_id"]
+        if self.delta is not None and self.covered_id:
+            with self._delta_lock:
+                self.delta.remove_ids(faiss.IDSelectorRange(0, self.covered_id))
+        self.ann_built_count = 0 if self._is_plain(mapped) else info["count"]
+        self.last_rebuild = info
+
+    def _rebuild(self, full: bool):
+        with self._write_lock, self._lock:
+            self._sync()
+            readers = list(self._parts.values())
+            covered_id = self.manifest["next_id"]
+            dim = self.manifest["dim"]
+            deleted = np.fromiter(self.tombstones, dtype=np.int64)
+            if dim is None:
+                return
+            saved_name = self.manifest.get("index") if self.main is not None else None
+            index_name = self._next_name("index") + ".faiss"
+            self._publish_reserved()
+            if full:
+                promoted = self.vector_count - len(self.tombstones) >= max(self.promote_at, 1)
+                kind = self.index_type if promoted else "flat"
+                quantization = self.quantization if promoted else "none"
+            else:
+                # Everything below covered_id that the saved index lacks is in the delta
+                delta_ids = faiss.vector_to_array(self.delta.id_map).astype(np.int64)
+                delta_vectors = self.delta.index.reconstruct_n(0, self.delta.ntotal)
+
+        started = time.perf_counter()
+        if full:
+            vector_ids, vectors = self._read_live_vectors(readers, dim, deleted)
+            index = ann_index.build_index(
+                kind, dim, vectors, vector_ids,
+                m=self.hnsw_m, ef_construction=self.ef_construction,
+                quantization=quantization, pq_m=self.pq_m
+            )
+            ann_index.set_search_params(index, nprobe=self.nprobe, ef_search=self.ef_search)
+            build_seconds = time.perf_counter() - started
+            recall = ann_index.measure_recall(index, vectors, vector_ids)
+            quantization_report = ann_index.measure_quantization(
+                index, vectors, vector_ids, k=3, rerank_factor=self.rerank_factor,
+                m=self.hnsw_m, ef_construction=self.ef_construction, pq_m=self.pq_m
+            )
+            del vectors
+            info = {
+                "type": kind,
+                "quantization": quantization,
+                "count": int(len(vector_ids)),
+                "vectors": int(len(vector_ids)),
+                "covered_id": covered_id,
+                "built_at": time.time(),
+                "build_seconds": round(build_seconds, 3),
+                "nprobe": self.nprobe if kind == "ivf" else None,
+                "ef_search": self.ef_search if kind == "hnsw" else None,
+                "recall_at_10": recall,
+                "memory": quantization_report
+            }
+        else:
+            # A private, writable copy of the saved index (the mapped one is read-only)
+            if saved_name:
+                index = faiss.read_index(os.path.join(self.root_dir, saved_name))
+                ann_index.set_search_params(index, nprobe=self.nprobe, ef_search=self.ef_search)
+            else:
+                index = self._empty_flat(dim)
+            keep = ~np.isin(delta_ids, deleted)
+            index.add_with_ids(np.ascontiguousarray(delta_vectors[keep]), delta_ids[keep])
+            del delta_vectors
+            info = dict(
+                self.last_rebuild or {"type": "flat", "quantization": "none", "count": 0},
+                vectors=int(index.ntotal), covered_id=covered_id, checkpointed_at=time.time()
+            )
+
+        # Save before the swap: the file holds exactly the live vectors below covered_id
+        mapped = self._save_main(index_name, index)
+        del index
+
+        with self._write_lock:
+            self._sync()
+            self._publish_main(index_name, mapped, info)
+
+        if full:
+            logger.info(
+                f"✅ Switched vector search to a {kind} index ({quantization} vectors, "
+                f"{quantization_report['mb_per_100k_chunks']} MB per 100k chunks) over {info['count']} vectors "
+                f"(built in {build_seconds:.1f}s)"
+            )
+            if quantization != "none" and quantization_report["memory_ratio"] < ann_index.MEMORY_TARGET_RATIO:
+                logger.warning(
+                    f"⚠️  {quantization} only saves {quantization_report['memory_ratio']}x memory over float32 "
+                    f"in a {kind} index ({quantization_report['mb_per_100k_chunks']} vs "
+                    f"{quantization_report['float32_mb_per_100k_chunks']} MB per 100k chunks), short of the "
+                    f"{ann_index.MEMORY_TARGET_RATIO:g}x target - links and IDs don't shrink; "
+                    f"try pq or a smaller VECTOR_HNSW_M"
+                )
+        else:
+            logger.info(
+                f"✅ Checkpointed vector index: {info['vectors']} vectors saved "
+                f"in {time.perf_counter() - started:.1f}s"
+            )
+
+    def wait_idle(self):
+        """Block until background merges, rebuilds and compactions have finished"""
+        while True:
+            threads = [
+                thread for thread in (self._merge_thread, self._rebuild_thread, self._compact_thread)
+                if thread is not None and thread.is_alive()
+            ]
+            if not threads:
+                return
+            for thread in threads:
+                thread.join()
+
+    # ---------- searching ----------
+
+    def live_vectors(self):
+        """
+        Every searchable vector, read from disk: (vector_ids, vectors)
+
+        For exact-search baselines (recall measurements, benchmarks) - this
+        copies the whole corpus into memory.
+        """
+        with self._lock:
+            parts = list(self._parts.values())
+            deleted = np.fromiter(self.tombstones, dtype=np.int64)
+            dim = self.manifest["dim"] or 0
+        return self._read_live_vectors(parts, dim, deleted)
+
+    @property
+    def count(self) -> int:
+        """Number of chunks stored"""
+        return len(self.records)
+
+    def stats(self) -> dict:
+        """Index type, size and the last rebuild's recall report"""
+        return {
+            "chunks": len(self.records),
+            "vectors": self.vector_count,
+            "mapped_vectors": self._mapped_count,
+            "delta_vectors": self._delta_count,
+            "index_type": self.index_kind,
+            "target_index_type": self.index_type,
+            "quantization": self.index_quantization,
+            "target_quantization": self.quantization,
+            "promote_at": self.promote_at,
+            "rebuilding": self._rebuild_thread is not None and self._rebuild_thread.is_alive(),
+            "tombstones": len(self.tombstones),
+            "compacting": self._compact_thread is not None and self._compact_thread.is_alive(),
+            "last_rebuild": self.last_rebuild
+        }
+
+    def find_chunk_id(self, doc_id: str, chunk_index: int) -> Optional[int]:
+        """
+        ID of a document's chunk by its position (None if it isn't stored here)
+
+        A document's chunks are added in order with one add(), so its
+        chunk_index-th ID is the chunk.
+        """
+        with self._lock:
+            chunk_ids = self.doc_chunks.get(doc_id)
+        if chunk_ids is None or not 0 <= chunk_index < len(chunk_ids):
+            return None
+        return int(chunk_ids[chunk_index])
+
+    def get_document_chunk(self, doc_id: str, chunk_index: int) -> Optional[dict]:
+        """A document's chunk by its position, read from the mapped files (None if it isn't stored here)"""
+        chunk_id = self.find_chunk_id(doc_id, chunk_index)
+        if chunk_id is None:
+            return None
+        record = self.records.get(chunk_id)
+        if record is None or record["metadata"].get("chunk_index") != chunk_index:
+            return None
+        return record
+
+    def get_vectors(self, ids):
+        """
+        The stored float32 vectors of some chunks, read from the mapped files
+
+        Returns: (ids found, their vectors) - chunks stored without a vector are left out
+        """
+        return self._fetch_vectors(ids)
+
+    def search(
+        self,
+        query_vector,
+        k: int = 3,
+        search_filter: Optional[SearchFilter] = None
+    ) -> List[Tuple[dict, float]]:
+        """
+        Find the k chunks closest to a query embedding
+
+        The saved index and the delta are both searched and their results
+        merged. With a filter, only allowed chunks are considered: small
+        scopes (one manual, a few pages) are compared exactly, larger ones
+        are searched inside FAISS with an ID selector. A quantized index is
+        asked for rerank_factor·k candidates, re-ranked exactly.
+
+        Returns:
+            List of (record, distance), closest first
+        """
+        query = np.asarray(query_vector, dtype=np.float32).reshape(1, -1)
+        return self.search_many(query, k=k, search_filter=search_filter)[0]
+
+    def search_many(
+        self,
+        query_vectors,
+        k: int = 3,
+        search_filter: Optional[SearchFilter] = None
+    ) -> List[List[Tuple[dict, float]]]:
+        """
+        search() for many queries at once
+
+        All queries go to FAISS as one matrix (one call per index, spread
+        over FAISS's threads), and a filter's allowed chunks are worked out
+        and read from disk once for the whole batch.
+
+        Args:
+            query_vectors: float32 array (n, dim)
+
+        Returns:
+            One list of (record, distance) per query, closest first
+        """
+        queries = np.ascontiguousarray(query_vectors, dtype=np.float32)
+        self._refresh()
+        with self._lock:
+            # Only take references here: the searching itself runs without
+            # the lock, so adds, deletes and swaps aren't held up by it
+            if self.vector_count == 0 or len(queries) == 0:
+                return [[] for _ in range(len(queries))]
+            main, delta, records = self.main, self.delta, self.records
+            selector = self._live_selector
+            allowed_count = self.vector_count - len(self.tombstones)
+            allowed = None
+            if search_filter is not None:
+                # doc_chunks / doc_pages change in place, so the allowed IDs are worked out here
+                allowed = np.asarray(search_filter.allowed_ids(self.doc_chunks, self.doc_pages), dtype=np.int64)
+
+        if allowed is not None:
+            if len(allowed) == 0:
+                return [[] for _ in range(len(queries))]
+            if len(allowed) <= EXACT_SCAN_MAX:
+                # Exact float32 vectors straight from disk - nothing to re-rank
+                allowed, vectors = self._fetch_vectors(allowed)
+                return [
+                    self._to_results(distances[0], ids[0], k, records)
+                    for distances, ids in (
+                        self._exact_search(query, k, allowed, vectors) for query in queries
+                    )
+                ]
+            selector = faiss.IDSelectorBatch(allowed)
+            allowed_count = len(allowed)
+
+        quantized = main is not None and ann_index.index_quantization(main) != "none"
+        candidates = k * self.rerank_factor if quantized else k
+        found_distances = []
+        found_ids = []
+        if main is not None and main.ntotal > 0:
+            distances, ids = self._search_index(main, queries, candidates, selector, allowed_count)
+            found_distances.append(distances)
+            found_ids.append(ids)
+        if delta is not None:
+            with self._delta_lock:
+                if delta.ntotal > 0:
+                    distances, ids = self._search_index(delta, queries, candidates, selector, allowed_count)
+                    found_distances.append(distances)
+                    found_ids.append(ids)
+        if not found_ids:
+            return [[] for _ in range(len(queries))]
+        all_distances = np.concatenate(found_distances, axis=1)
+        all_ids = np.concatenate(found_ids, axis=1)
+
+        results = []
+        for query, distances, ids in zip(queries, all_distances, all_ids):
+            valid = ids != -1
+            distances, ids = distances[valid], ids[valid]
+            if quantized:
+                # Quantized distances are approximate - re-rank on the exact vectors
+                distances, ids = self._exact_search(query, k, np.unique(ids))
+                distances, ids = distances[0], ids[0]
+            else:
+                order = np.argsort(distances, kind="stable")
+                distances, ids = distances[order], ids[order]
+            results.append(self._to_results(distances, ids, k, records))
+        return results
+
+    def _search_index(self, index, query, k: int, selector, allowed_count: int):
+        """Search the saved or the delta index, optionally restricted by a selector"""
+        k = min(k, index.ntotal)
+        if selector is None:
+            return index.search(query, k)
+        return ann_index.search_with_selector(index, query, k, selector, allowed_count)
+
+    def _to_results(self, distances, ids, k: int, records: RecordsView) -> List[Tuple[dict, float]]:
+        """Records for the closest k IDs (skipping deleted chunks)"""
+        results = []
+        for distance, chunk_id in zip(distances, ids):
+            record = records.get(int(chunk_id))
+            if record is not None:
+                results.append((record, float(distance)))
+                if len(results) == k:
+                    break
+        return results
+
+    def _exact_search(self, query, k: int, allowed_ids, vectors=None):
+        """
+        Brute-force L2 search over a few chunks' float32 vectors
+
+        The vectors are read from disk unless the caller already has them.
+        """
+        if vectors is None:
+            allowed_ids, vectors = self._fetch_vectors(allowed_ids)
+        if len(allowed_ids) == 0:
+            return np.zeros((1, 0), dtype=np.float32), np.zeros((1, 0), dtype=np.int64)
+        return ann_index.rerank(query, allowed_ids, vectors, min(k, len(allowed_ids)))
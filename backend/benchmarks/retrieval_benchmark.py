@@ -0,0 +1,502 @@
+"""
+Retrieval Benchmark - Ingestion and search performance
+======================================================
+Builds synthetic, manual-like corpora (service procedures, torque specs,
+part codes...) at one or more sizes, ingests them through the real
+DocumentService, then runs a query workload against every retrieval mode.
+
+For each corpus size it reports:
+- ingestion throughput (chunks per second, and time until the ANN index
+  was built in the background)
+- query latency p50 / p95 / p99 per mode, and batch throughput
+- memory (resident set size after ingestion and after the queries, peak)
+- recall@k of the vector index against exact brute-force search
+- source hit rate: how often the chunk a query was taken from comes back
+
+Embeddings are the local hashing stand-in (EMBEDDING_MODEL=local-hash),
+so no API key is needed and runs are repeatable. Everything happens in a
+temporary folder; your uploads and vector_store are never touched.
+
+Results are saved as JSON. Compare two runs to spot regressions:
+
+    cd backend
+    python benchmarks/retrieval_benchmark.py --scales 1000,10000
+    python benchmarks/retrieval_benchmark.py --scales 100000 --index-type hnsw --quantization int8
+    python benchmarks/retrieval_benchmark.py --compare old.json new.json
+"""
+
+import os
+import sys
+import json
+import time
+import random
+import shutil
+import argparse
+import platform
+import tempfile
+from datetime import datetime
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+BACKEND_DIR = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(BACKEND_DIR))
+
+import numpy as np
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+MODES = ("vector", "lexical", "hybrid")
+
+# ---------- synthetic manuals ----------
+
+SYSTEMS = [
+    "brake", "engine", "transmission", "steering", "suspension", "cooling", "fuel", "exhaust",
+    "electrical", "airbag", "clutch", "battery", "wiper", "headlamp", "tyre", "door lock",
+    "air conditioning", "power window", "starter motor", "alternator", "infotainment", "parking sensor"
+]
+PARTS = [
+    "pad", "caliper", "rotor", "hose", "sensor", "valve", "pump", "filter", "belt", "gasket",
+    "bearing", "relay", "fuse", "bracket", "bolt", "seal", "reservoir", "connector", "module", "switch"
+]
+ACTIONS = [
+    "inspect", "replace", "tighten", "clean", "check", "adjust", "lubricate", "remove",
+    "install", "test", "drain", "refill", "calibrate", "reset"
+]
+CONDITIONS = [
+    "every 10,000 km", "before long trips", "when the warning lamp comes on", "after washing the vehicle",
+    "if you hear a grinding noise", "at every scheduled service", "when the engine is cold",
+    "with the ignition switched off", "if the vehicle pulls to one side", "in freezing weather"
+]
+UNITS = [("Nm", 5, 250), ("mm", 1, 80), ("litres", 1, 9), ("bar", 1, 6), ("V", 11, 15), ("km", 5000, 100000)]
+WARNINGS = [
+    "Never work under a vehicle supported only by a jack.",
+    "Use only the fluid grade specified in this manual.",
+    "Dispose of used oil and coolant at an approved collection point.",
+    "Disconnect the negative battery terminal before working on electrical parts.",
+    "Hot components can cause severe burns - let the engine cool down first."
+]
+
+
+def _sentence(rng: random.Random, system: str) -> str:
+    """One procedure step or specification line"""
+    part = rng.choice(PARTS)
+    code = f"{system[:3].upper()}-{rng.randint(1000, 9999)}"
+    unit, low, high = rng.choice(UNITS)
+    kind = rng.random()
+    if kind < 0.45:
+        return (
+            f"{rng.choice(ACTIONS).capitalize()} the {system} {part} (part {code}) "
+            f"{rng.choice(CONDITIONS)}, then {rng.choice(ACTIONS)} the {rng.choice(PARTS)}."
+        )
+    if kind < 0.85:
+        return f"Specified value for the {system} {part} {code}: {rng.randint(low, high)} {unit}."
+    return f"WARNING: {rng.choice(WARNINGS)}"
+
+
+def make_manual(rng: random.Random, doc_number: int, target_chars: int) -> str:
+    """Text of one synthetic manual, about target_chars long"""
+    lines = [f"Service Manual {doc_number}: Model {rng.choice('ABCDEFGH')}{rng.randint(10, 99)}"]
+    length = len(lines[0])
+    section = 0
+    while length < target_chars:
+        section += 1
+        system = rng.choice(SYSTEMS)
+        heading = f"\nSection {section}: {system.title()} system"
+        lines.append(heading)
+        length += len(heading)
+        for _ in range(rng.randint(4, 9)):
+            sentence = _sentence(rng, system)
+            lines.append(sentence)
+            length += len(sentence) + 1
+    return "\n".join(lines)
+
+
+def _chunk_ends(text: str, chunks: List[str]) -> List[int]:
+    """Where each chunk ends in the text (chunks come out of the splitter in order)"""
+    ends = []
+    cursor = 0
+    for chunk in chunks:
+        position = text.find(chunk, cursor)
+        if position == -1:
+            position = cursor
+        cursor = position + 1
+        ends.append(position + len(chunk))
+    return ends
+
+
+def make_sized_manual(rng: random.Random, doc_number: int, doc_chunks: int, chunk_size: int, overlap: int) -> str:
+    """
+    Text of one synthetic manual that splits into about doc_chunks chunks
+
+    Sentences and headings rarely fill a chunk exactly, so a character
+    estimate overshoots; instead we write too much, split it the way
+    ingestion does and cut the text after the last chunk we want.
+    """
+    from app.services.text_splitter import split_text
+
+    target_chars = chunk_size + (doc_chunks - 1) * (chunk_size - overlap)
+    while True:
+        text = make_manual(rng, doc_number, int(target_chars * 1.2) + chunk_size)
+        chunks = split_text(text, chunk_size, overlap)
+        if len(chunks) >= doc_chunks:
+            return text[:_chunk_ends(text, chunks)[doc_chunks - 1]]
+        target_chars *= 2
+
+
+def write_corpus(
+    folder: Path,
+    chunks: int,
+    chunks_per_doc: int,
+    chunk_size: int,
+    overlap: int,
+    seed: int
+) -> List[Tuple[Path, int]]:
+    """
+    Write manuals adding up to about `chunks` chunks
+
+    Returns: (path, number of chunks it splits into) for every manual
+    """
+    from app.services.text_splitter import split_text
+
+    rng = random.Random(seed)
+    folder.mkdir(parents=True, exist_ok=True)
+    manuals = []
+    remaining = chunks
+    doc_number = 0
+    while remaining > 0:
+        doc_number += 1
+        text = make_sized_manual(rng, doc_number, min(chunks_per_doc, remaining), chunk_size, overlap)
+        path = folder / f"manual_{doc_number:05d}.txt"
+        path.write_text(text, encoding="utf-8")
+        # Measured, not assumed: cutting can move the last chunk boundary
+        doc_chunks = len(split_text(text, chunk_size, overlap))
+        manuals.append((path, doc_chunks))
+        remaining -= doc_chunks
+    return manuals
+
+
+# ---------- measuring ----------
+
+def rss_mb() -> Optional[float]:
+    """Current resident memory of this process (Linux only)"""
+    try:
+        with open("/proc/self/statm") as f:
+            pages = int(f.read().split()[1])
+        return round(pages * os.sysconf("SC_PAGE_SIZE") / 2**20, 1)
+    except (OSError, ValueError, AttributeError):
+        return None
+
+
+def peak_rss_mb() -> Optional[float]:
+    """Highest resident memory so far (kilobytes on Linux, bytes on macOS)"""
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return round(peak / (2**20 if sys.platform == "darwin" else 2**10), 1)
+
+
+def latency_summary(seconds: List[float]) -> dict:
+    """p50/p95/p99/mean in milliseconds"""
+    ms = np.asarray(seconds) * 1000
+    return {
+        "p50_ms": round(float(np.percentile(ms, 50)), 3),
+        "p95_ms": round(float(np.percentile(ms, 95)), 3),
+        "p99_ms": round(float(np.percentile(ms, 99)), 3),
+        "mean_ms": round(float(ms.mean()), 3)
+    }
+
+
+def sample_queries(
+    manuals: List[Tuple[Path, int]],
+    doc_ids: Dict[str, str],
+    count: int,
+    seed: int,
+    chunk_size: int,
+    overlap: int
+) -> List[dict]:
+    """
+    Queries made of a few consecutive words of random chunks (the chunk is the 'right' answer)
+
+    Chunks are read back from the corpus files and split the way ingestion
+    splits them, so the benchmark doesn't depend on how the indexes store text.
+
+    Args:
+        manuals: (path, chunk count) pairs from write_corpus
+        doc_ids: file name → document ID it was ingested as
+    """
+    from app.services.text_splitter import split_text
+
+    rng = random.Random(seed)
+    total = sum(doc_chunks for _, doc_chunks in manuals)
+    picks = sorted(rng.sample(range(total), min(count, total)))
+    queries = []
+    first = 0
+    for path, doc_chunks in manuals:
+        wanted = [pick - first for pick in picks if first <= pick < first + doc_chunks]
+        first += doc_chunks
+        if not wanted:
+            continue
+        chunks = split_text(path.read_text(encoding="utf-8"), chunk_size, overlap)
+        for chunk_index in wanted:
+            words = chunks[chunk_index].split()
+            length = rng.randint(5, 10)
+            start = rng.randint(0, max(len(words) - length, 0))
+            queries.append({
+                "query": " ".join(words[start:start + length]),
+                "source": {
+                    "text": chunks[chunk_index],
+                    "metadata": {"doc_id": doc_ids[path.name], "chunk_index": chunk_index}
+                }
+            })
+    rng.shuffle(queries)
+    return queries
+
+
+def vector_recall(document_service, queries: List[str], k: int) -> Optional[float]:
+    """Recall@k of the vector index's answers against exact brute-force search"""
+    import faiss
+
+    store = document_service.vector_store
+    if store is None or store.count == 0:
+        return None
+    query_vectors = np.ascontiguousarray(document_service.embeddings.embed_queries(queries), dtype=np.float32)
+    found = store.search_many(query_vectors, k=k)
+    ids, vectors = store.live_vectors()
+    _, rows = faiss.knn(query_vectors, np.ascontiguousarray(vectors), min(k, len(ids)))
+    hits = 0
+    for results, truth_rows in zip(found, rows):
+        truth = {int(ids[row]) for row in truth_rows if row >= 0}
+        hits += len(truth & {record["id"] for record, _ in results})
+    return round(hits / (len(queries) * min(k, len(ids))), 4)
+
+
+# ---------- one corpus size ----------
+
+def run_scale(chunks: int, args, workspace: Path) -> dict:
+    """Ingest a corpus of about `chunks` chunks and run the query workload"""
+    from app.services import document_service as document_module
+    from app.services.rank_fusion import chunk_key
+
+    scale_dir = workspace / f"scale-{chunks}"
+    scale_dir.mkdir(parents=True)
+    os.chdir(scale_dir)  # DocumentService keeps uploads/ and vector_store/ in the working folder
+
+    print(f"\n📚 {chunks:,} chunks: writing synthetic manuals...")
+    manuals = write_corpus(
+        scale_dir / "corpus", chunks, args.chunks_per_doc,
+        document_module.CHUNK_SIZE, document_module.CHUNK_OVERLAP, args.seed
+    )
+    service = document_module.DocumentService()
+    memory_before = rss_mb()
+
+    print(f"   Ingesting {len(manuals)} documents...")
+    started = time.perf_counter()
+    ingested = 0
+    doc_ids = {}
+    for path, _ in manuals:
+        result = service.process_document(str(path), path.name)
+        ingested += result["chunks"]
+        doc_ids[path.name] = result["doc_id"]
+    ingest_seconds = time.perf_counter() - started
+    if service.vector_store is not None:
+        service.vector_store.wait_idle()
+    ready_seconds = time.perf_counter() - started
+    memory_after_ingest = rss_mb()
+    print(f"   ✅ {ingested:,} chunks in {ingest_seconds:.1f}s ({ingested / ingest_seconds:,.0f} chunks/s)")
+
+    workload = sample_queries(
+        manuals, doc_ids, args.queries, args.seed,
+        document_module.CHUNK_SIZE, document_module.CHUNK_OVERLAP
+    )
+    queries = [item["query"] for item in workload]
+
+    modes = {}
+    for mode in args.modes:
+        for item in workload[:args.warmup]:
+            service.retrieve(item["query"], top_k=args.top_k, mode=mode, diversify=args.diversify)
+        latencies = []
+        hits = 0
+        for item in workload:
+            started = time.perf_counter()
+            results = service.retrieve(item["query"], top_k=args.top_k, mode=mode, diversify=args.diversify)
+            latencies.append(time.perf_counter() - started)
+            hits += chunk_key(item["source"]) in {chunk_key(record) for record in results}
+
+        started = time.perf_counter()
+        service.retrieve_many(queries, top_k=args.top_k, mode=mode, diversify=args.diversify)
+        batch_seconds = time.perf_counter() - started
+
+        modes[mode] = dict(
+            latency_summary(latencies),
+            source_hit_rate=round(hits / len(workload), 4),
+            batch_queries_per_sec=round(len(queries) / batch_seconds, 1) if batch_seconds > 0 else None
+        )
+        print(
+            f"   🔎 {mode:8s} p50 {modes[mode]['p50_ms']:8.2f} ms   p95 {modes[mode]['p95_ms']:8.2f} ms   "
+            f"p99 {modes[mode]['p99_ms']:8.2f} ms   hit@{args.top_k} {modes[mode]['source_hit_rate']:.2f}"
+        )
+
+    recall = vector_recall(service, queries, args.top_k)
+    if recall is not None:
+        print(f"   🎯 vector recall@{args.top_k} vs exact search: {recall:.4f}")
+
+    store_stats = service.vector_store.stats() if service.vector_store is not None else None
+    return {
+        "requested_chunks": chunks,
+        "chunks": ingested,
+        "documents": len(manuals),
+        "ingest": {
+            "seconds": round(ingest_seconds, 3),
+            "chunks_per_sec": round(ingested / ingest_seconds, 1) if ingest_seconds > 0 else None,
+            "index_ready_seconds": round(ready_seconds, 3)
+        },
+        "memory_mb": {
+            "rss_before_ingest": memory_before,
+            "rss_after_ingest": memory_after_ingest,
+            "rss_after_queries": rss_mb(),
+            "peak_rss": peak_rss_mb()
+        },
+        "vector_index": {
+            "type": store_stats["index_type"],
+            "quantization": store_stats["quantization"],
+            "memory": (store_stats["last_rebuild"] or {}).get("memory")
+        } if store_stats is not None else None,
+        "recall_at_k": recall,
+        "modes": modes
+    }
+
+
+# ---------- comparing runs ----------
+
+def compare(old_path: str, new_path: str, tolerance: float) -> int:
+    """
+    Print how a run changed against an older one
+
+    Returns: Number of regressions beyond `tolerance` (a share, 0.1 = 10%)
+    """
+    # Runs are matched by the size asked for; the chunks actually ingested
+    # can differ slightly
+    with open(old_path) as f:
+        old = {run["requested_chunks"]: run for run in json.load(f)["runs"]}
+    with open(new_path) as f:
+        new = {run["requested_chunks"]: run for run in json.load(f)["runs"]}
+
+    regressions = 0
+
+    def report(label: str, before, after, higher_is_better: bool):
+        nonlocal regressions
+        if before is None or after is None:
+            return
+        change = (after - before) / before if before else 0.0
+        worse = -change if higher_is_better else change
+        flag = "❌" if worse > tolerance else "✅"
+        regressions += worse > tolerance
+        print(f"   {flag} {label:28s} {before:12.3f} → {after:12.3f}  ({change:+.1%})")
+
+    for chunks in sorted(set(old) & set(new)):
+        print(f"\n📊 {chunks:,} chunks (ingested {old[chunks]['chunks']:,} → {new[chunks]['chunks']:,})")
+        report("ingest chunks/s", old[chunks]["ingest"]["chunks_per_sec"], new[chunks]["ingest"]["chunks_per_sec"], True)
+        report("recall@k", old[chunks]["recall_at_k"], new[chunks]["recall_at_k"], True)
+        report("peak RSS MB", old[chunks]["memory_mb"]["peak_rss"], new[chunks]["memory_mb"]["peak_rss"], False)
+        for mode in sorted(set(old[chunks]["modes"]) & set(new[chunks]["modes"])):
+            before, after = old[chunks]["modes"][mode], new[chunks]["modes"][mode]
+            for metric in ("p50_ms", "p95_ms", "p99_ms"):
+                report(f"{mode} {metric}", before[metric], after[metric], False)
+            report(f"{mode} hit rate", before["source_hit_rate"], after["source_hit_rate"], True)
+    print(f"\n{regressions} regression(s) beyond {tolerance:.0%}")
+    return regressions
+
+
+# ---------- command line ----------
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark ingestion and retrieval on synthetic manuals")
+    parser.add_argument("--scales", default="1000,10000", help="Corpus sizes in chunks, comma-separated (e.g. 1000,100000,1000000)")
+    parser.add_argument("--modes", default=",".join(MODES), help="Retrieval modes to query")
+    parser.add_argument("--queries", type=int, default=200, help="Queries per mode")
+    parser.add_argument("--warmup", type=int, default=10, help="Untimed queries per mode first")
+    parser.add_argument("--top-k", type=int, default=5)
+    parser.add_argument("--chunks-per-doc", type=int, default=500)
+    parser.add_argument("--diversify", action="store_true", help="Apply MMR to the results")
+    parser.add_argument("--index-type", help="VECTOR_INDEX_TYPE: flat, ivf or hnsw")
+    parser.add_argument("--promote-at", type=int, help="VECTOR_INDEX_PROMOTE_AT")
+    parser.add_argument("--quantization", help="VECTOR_QUANTIZATION: none, fp16, int8 or pq")
+    parser.add_argument("--local-dim", type=int, help="LOCAL_EMBEDDING_DIM")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--output", help="Where to save the JSON results (default: benchmarks/results/retrieval-<time>.json)")
+    parser.add_argument("--keep", action="store_true", help="Keep the temporary corpora and indexes")
+    parser.add_argument("--compare", nargs=2, metavar=("OLD", "NEW"), help="Compare two saved result files instead of running")
+    parser.add_argument("--tolerance", type=float, default=0.1, help="Allowed slowdown / loss when comparing (0.1 = 10%%)")
+    return parser.parse_args(argv)
+
+
+def main(argv=None) -> int:
+    args = parse_args(argv)
+    if args.compare:
+        return 1 if compare(args.compare[0], args.compare[1], args.tolerance) else 0
+
+    args.modes = [mode.strip() for mode in args.modes.split(",") if mode.strip()]
+    scales = [int(scale) for scale in args.scales.split(",")]
+    output = Path(args.output) if args.output else (
+        BACKEND_DIR / "benchmarks" / "results" / f"retrieval-{datetime.now():%Y%m%d-%H%M%S}.json"
+    )
+    output = output.resolve()
+
+    workspace = Path(tempfile.mkdtemp(prefix="retrieval-benchmark-"))
+    original_dir = os.getcwd()
+    os.chdir(workspace)
+
+    # Settings are read once at import, so override them before importing the app
+    os.environ["EMBEDDING_MODEL"] = "local-hash"
+    os.environ["OPENAI_API_KEY"] = ""
+    overrides = {
+        "VECTOR_INDEX_TYPE": args.index_type,
+        "VECTOR_INDEX_PROMOTE_AT": args.promote_at,
+        "VECTOR_QUANTIZATION": args.quantization,
+        "LOCAL_EMBEDDING_DIM": args.local_dim
+    }
+    for name, value in overrides.items():
+        if value is not None:
+            os.environ[name] = str(value)
+    from app.core.config import settings
+
+    results = {
+        "benchmark": "retrieval",
+        "created_at": datetime.now().isoformat(timespec="seconds"),
+        "machine": {"python": platform.python_version(), "platform": platform.platform(), "cpus": os.cpu_count()},
+        "config": {
+            "top_k": args.top_k,
+            "queries": args.queries,
+            "chunks_per_doc": args.chunks_per_doc,
+            "diversify": args.diversify,
+            "seed": args.seed,
+            "embedding_model": settings.EMBEDDING_MODEL,
+            "embedding_dim": settings.LOCAL_EMBEDDING_DIM,
+            "index_type": settings.VECTOR_INDEX_TYPE,
+            "promote_at": settings.VECTOR_INDEX_PROMOTE_AT,
+            "quantization": settings.VECTOR_QUANTIZATION
+        },
+        "runs": []
+    }
+    try:
+        for chunks in scales:
+            results["runs"].append(run_scale(chunks, args, workspace))
+            # Save after every size, so a long run that dies still leaves results
+            output.parent.mkdir(parents=True, exist_ok=True)
+            output.write_text(json.dumps(results, indent=2))
+    finally:
+        os.chdir(original_dir)
+        if args.keep:
+            print(f"\n📁 Kept corpora and indexes in {workspace}")
+        else:
+            shutil.rmtree(workspace, ignore_errors=True)
+
+    print(f"\n✅ Results saved to {output}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
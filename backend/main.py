@@ -13,9 +13,14 @@ from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.staticfiles import StaticFiles
 import os
+import threading
 
 # Import our API routes
-from app.api import chat, documents
+from app.api import chat, documents, stats
+from app.services.document_service import document_service
+from app.services.ingestion_service import ingestion_service
+from app.services.openai_client import close_clients
+from app.services.session_store import session_store
 
 # Create the FastAPI application
 app = FastAPI(
@@ -41,12 +46,13 @@ app.add_middleware(
 # These handle the actual endpoints for chat and documents
 app.include_router(chat.router, prefix="/api", tags=["chat"])
 app.include_router(documents.router, prefix="/api", tags=["documents"])
+app.include_router(stats.router, prefix="/api", tags=["stats"])
 
 # Serve uploaded files as static files
 # This allows the frontend to access uploaded documents if needed
 upload_dir = "uploads"
-if os.path.exists(upload_dir):
-    app.mount("/uploads", StaticFiles(directory=upload_dir), name="uploads")
+os.makedirs(upload_dir, exist_ok=True)
+app.mount("/uploads", StaticFiles(directory=upload_dir), name="uploads")
 
 # Root endpoint - health check
 @app.get("/", tags=["default"])
@@ -63,7 +69,8 @@ async def root():
             "docs": "/docs",
             "upload": "/documents/upload",
             "list": "/documents/list",
-            "chat": "/chat"
+            "chat": "/chat",
+            "stats": "/stats"
         }
     }
 
@@ -77,6 +84,29 @@ async def health_check():
         "message": "All systems operational"
     }
 
+@app.on_event("startup")
+async def startup_event():
+    """
+    Open the document indexes before the first request (not on import,
+    so extraction worker processes never open them), then clean up
+    ingests a crash cut off - in the background, as that waits for the
+    keyword index to load
+    """
+    document_service.get()
+    threading.Thread(
+        target=document_service.recover_interrupted_ingests, name="ingest-recovery", daemon=True
+    ).start()
+
+@app.on_event("shutdown")
+async def shutdown_event():
+    """
+    Stop the background ingestion workers and close the OpenAI
+    connection pool and the session database when the server shuts down
+    """
+    ingestion_service.shutdown()
+    await close_clients()
+    session_store.close()
+
 # This runs when you execute: python main.py
 if __name__ == "__main__":
     import uvicorn
@@ -0,0 +1,94 @@
+"""
+Lexical Index Tests
+===================
+Run from the backend folder:
+
+    python -m pytest -q
+
+Each test works in its own temporary folder.
+"""
+
+import os
+
+from app.services.lexical_index import LexicalIndex
+
+TEXTS = {
+    "pump": ["the fuel pump pressure is 3 bar", "replace the pump filter every year"],
+    "brakes": ["brake pads wear out", "check the brake fluid level"],
+}
+
+
+def make_records(doc_id: str):
+    return [
+        {"text": text, "metadata": {"doc_id": doc_id, "chunk_index": i, "page": i + 1}}
+        for i, text in enumerate(TEXTS[doc_id])
+    ]
+
+
+def read_chunks(places):
+    """Stands in for DocumentService._read_chunks: the chunks' records by (doc_id, chunk_index)"""
+    return [
+        {"text": TEXTS[doc_id][chunk_index], "metadata": {"doc_id": doc_id, "chunk_index": chunk_index}}
+        if doc_id in TEXTS else None
+        for doc_id, chunk_index in places
+    ]
+
+
+def open_index(root, **options) -> LexicalIndex:
+    index = LexicalIndex(str(root), read_chunks, **options)
+    index.load()
+    return index
+
+
+def top_text(index: LexicalIndex, query: str):
+    results = index.search(query, k=1)
+    return results[0][0]["text"] if results else None
+
+
+def test_log_replay_restores_adds_and_deletes(tmp_path):
+    index = open_index(tmp_path, compact_ratio=1.0)
+    assert index.add(make_records("pump")) == [0, 1]
+    assert index.add(make_records("brakes")) == [2, 3]
+    assert index.delete_document("pump") == 2
+
+    reopened = open_index(tmp_path)
+    assert reopened.count == 2
+    assert not reopened.has_document("pump")
+    assert reopened.doc_chunks == {"brakes": [2, 3]}
+    assert top_text(reopened, "pump filter") is None
+    assert top_text(reopened, "brake fluid") == "check the brake fluid level"
+    # Deleted chunks' IDs are never handed out again
+    assert reopened.add(make_records("pump")) == [4, 5]
+
+
+def test_half_written_log_line_is_dropped(tmp_path):
+    index = open_index(tmp_path)
+    index.add(make_records("pump"))
+    size = os.path.getsize(index.log_path)
+    with open(index.log_path, "a", encoding="utf-8") as f:
+        f.write('{"id": 2, "doc_id": "bra')
+
+    reopened = open_index(tmp_path)
+    assert reopened.count == 2
+    assert os.path.getsize(reopened.log_path) == size
+    assert top_text(reopened, "fuel pressure") == "the fuel pump pressure is 3 bar"
+
+
+def test_compact_writes_snapshot_and_empties_log(tmp_path):
+    index = open_index(tmp_path, compact_ratio=1.0)
+    index.add(make_records("pump"))
+    index.add(make_records("brakes"))
+    index.delete_document("brakes")
+
+    index.compact()
+    assert os.path.exists(index.snapshot_path)
+    assert os.path.getsize(index.log_path) == 0
+    assert index.deleted_in_log == 0
+    assert all(chunk_id in index.chunks for postings in index.postings.values() for chunk_id in postings)
+
+    # Snapshot plus entries logged after it
+    index.add(make_records("brakes"))
+    reopened = open_index(tmp_path)
+    assert reopened.count == 4
+    assert reopened.doc_chunks == {"pump": [0, 1], "brakes": [4, 5]}
+    assert top_text(reopened, "brake pads") == "brake pads wear out"
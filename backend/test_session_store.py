@@ -0,0 +1,63 @@
+"""
+Session Store Tests
+===================
+Run from the backend folder:
+
+    python -m pytest -q
+
+No OpenAI calls are made: the stores here never compact.
+"""
+
+from app.services.session_store import SessionStore
+
+
+def make_store(**options) -> SessionStore:
+    options.setdefault("compact_tokens", 0)
+    return SessionStore(**options)
+
+
+def test_idle_sessions_are_dropped():
+    store = make_store(idle_seconds=60)
+    store.append("old", "hi", "hello")
+    store.append("new", "hi", "hello")
+    store._sessions["old"]["touched_at"] -= 120
+
+    assert store.get_history("old") == []
+    assert len(store.get_history("new")) == 2
+    assert store.stats()["idle_evictions"] == 1
+
+
+def test_least_recently_used_session_goes_first_when_over_memory():
+    store = make_store(idle_seconds=0)
+    store.append("a", "question a", "answer a")
+    store.append("b", "question b", "answer b")
+    one_session = store.stats()["bytes"] // 2
+    store.max_bytes = one_session * 2
+
+    # Using "a" makes "b" the least recently used
+    store.get_history("a")
+    store.append("c", "question c", "answer c")
+
+    assert store.get_history("b") == []
+    assert store.get_history("a")[0]["content"] == "question a"
+    assert store.get_history("c")[1]["content"] == "answer c"
+    assert store.stats()["memory_evictions"] == 1
+    assert store.stats()["bytes"] <= store.max_bytes
+
+
+def test_persisted_session_comes_back_after_eviction(tmp_path):
+    db_path = str(tmp_path / "sessions.db")
+    store = make_store(idle_seconds=60, db_path=db_path)
+    store.append("s", "what is the tire pressure?", "2.2 bar")
+    store._sessions["s"]["touched_at"] -= 120
+    store._evict()
+    assert store.stats()["sessions"] == 0
+
+    assert [turn["content"] for turn in store.get_history("s")] == ["what is the tire pressure?", "2.2 bar"]
+    store.close()
+
+    reopened = make_store(db_path=db_path)
+    assert reopened.get_session("s")["history"][1]["content"] == "2.2 bar"
+    assert reopened.clear("s")
+    assert reopened.get_history("s") == []
+    reopened.close()
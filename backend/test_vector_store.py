@@ -0,0 +1,218 @@
+"""
+Vector Store Tests
+==================
+Run from the backend folder:
+
+    python -m pytest -q
+
+Each test works in its own temporary folder, so your vector_store/ is
+never touched. They need FAISS and numpy (skipped without them).
+"""
+
+import os
+
+import pytest
+
+np = pytest.importorskip("numpy")
+pytest.importorskip("faiss")
+
+from app.services.vector_store import VectorStore, MANIFEST_NAME
+
+DIM = 8
+
+
+def make_document(doc_id: str, count: int, seed: int):
+    """Records and (normalized) vectors for one fake document"""
+    rng = np.random.default_rng(seed)
+    vectors = rng.normal(size=(count, DIM)).astype(np.float32)
+    vectors /= np.linalg.norm(vectors, axis=1, keepdims=True)
+    records = [
+        {
+            "text": f"{doc_id} chunk {i}",
+            "metadata": {"doc_id": doc_id, "chunk_index": i, "page": i // 2 + 1, "source": f"{doc_id}.pdf"}
+        }
+        for i in range(count)
+    ]
+    return records, vectors
+
+
+def open_store(root, **options) -> VectorStore:
+    # No background merges or rebuilds unless a test asks for them
+    options.setdefault("merge_segments", 1000)
+    options.setdefault("delta_max", 1000000)
+    store = VectorStore(str(root), **options)
+    store.load()
+    return store
+
+
+def top_text(store: VectorStore, vector) -> str:
+    results = store.search(vector, k=1)
+    return results[0][0]["text"] if results else None
+
+
+def test_add_search_and_reload(tmp_path):
+    store = open_store(tmp_path)
+    records_a, vectors_a = make_document("a", 5, seed=1)
+    records_b, vectors_b = make_document("b", 3, seed=2)
+    assert store.add(records_a, vectors_a) == [0, 1, 2, 3, 4]
+    assert store.add(records_b, vectors_b) == [5, 6, 7]
+
+    assert store.count == 8
+    assert top_text(store, vectors_b[1]) == "b chunk 1"
+    assert store.get_document_chunk("a", 3)["text"] == "a chunk 3"
+
+    reopened = open_store(tmp_path)
+    assert reopened.count == 8
+    assert reopened.doc_chunks == store.doc_chunks
+    assert top_text(reopened, vectors_a[4]) == "a chunk 4"
+
+
+def test_chunks_without_vectors(tmp_path):
+    store = open_store(tmp_path)
+    records, vectors = make_document("a", 2, seed=1)
+    store.add(records, vectors)
+    store.add(make_document("b", 2, seed=2)[0])
+
+    reopened = open_store(tmp_path)
+    assert reopened.count == 4
+    assert reopened.vector_count == 2
+    assert reopened.get_document_chunk("b", 1)["text"] == "b chunk 1"
+
+
+def test_delete_hides_chunks_and_survives_reload(tmp_path):
+    store = open_store(tmp_path, compact_ratio=1.0)
+    records_a, vectors_a = make_document("a", 4, seed=1)
+    records_b, vectors_b = make_document("b", 4, seed=2)
+    store.add(records_a, vectors_a)
+    store.add(records_b, vectors_b)
+
+    assert store.delete_document("a") == 4
+    assert store.delete_document("a") == 0
+    assert store.count == 4
+    assert "a" not in store.doc_chunks
+    results = store.search(vectors_a[0], k=8)
+    assert {record["metadata"]["doc_id"] for record, _ in results} == {"b"}
+
+    reopened = open_store(tmp_path)
+    assert reopened.count == 4
+    assert reopened.tombstones == {0, 1, 2, 3}
+    assert top_text(reopened, vectors_b[2]) == "b chunk 2"
+
+
+def test_compact_drops_deleted_chunks(tmp_path):
+    store = open_store(tmp_path, compact_ratio=1.0)
+    records_a, vectors_a = make_document("a", 4, seed=1)
+    records_b, vectors_b = make_document("b", 4, seed=2)
+    store.add(records_a, vectors_a)
+    store.add(records_b, vectors_b)
+    store.delete_document("a")
+
+    store.compact()
+    assert store.tombstones == set()
+    assert store.vector_count == 4
+    assert store.manifest["segments"] == []
+    assert top_text(store, vectors_b[3]) == "b chunk 3"
+
+    # IDs keep counting up after a compaction
+    records_c, vectors_c = make_document("c", 2, seed=3)
+    assert store.add(records_c, vectors_c) == [8, 9]
+
+    reopened = open_store(tmp_path)
+    assert reopened.count == 6
+    assert reopened.tombstones == set()
+    assert top_text(reopened, vectors_c[1]) == "c chunk 1"
+    # The compacted parts and the old index file are gone
+    names = set(os.listdir(tmp_path))
+    assert {name for name in names if name.startswith(("seg-", "base-"))} == {
+        reopened.manifest["base"], *reopened.manifest["segments"]
+    }
+    assert [name for name in names if name.startswith("index-")] == [reopened.manifest["index"]]
+
+
+def test_merge_keeps_every_chunk(tmp_path):
+    store = open_store(tmp_path)
+    documents = [make_document(f"d{i}", 3, seed=i) for i in range(4)]
+    for records, vectors in documents:
+        store.add(records, vectors)
+
+    store.merge()
+    assert store.manifest["base"] is not None
+    assert store.manifest["segments"] == []
+
+    reopened = open_store(tmp_path)
+    assert reopened.count == 12
+    for i, (records, vectors) in enumerate(documents):
+        assert top_text(reopened, vectors[2]) == f"d{i} chunk 2"
+
+
+def test_checkpoint_moves_delta_into_saved_index(tmp_path):
+    store = open_store(tmp_path)
+    records, vectors = make_document("a", 6, seed=1)
+    store.add(records, vectors)
+
+    store.rebuild_index(full=False)
+    assert store.manifest["index"] is not None
+    assert store.manifest["index_info"]["covered_id"] == 6
+
+    reopened = open_store(tmp_path)
+    assert reopened.vector_count == 6
+    assert reopened.covered_id == 6
+    assert top_text(reopened, vectors[5]) == "a chunk 5"
+
+
+def test_crash_leftovers_are_removed_at_load(tmp_path):
+    store = open_store(tmp_path)
+    records, vectors = make_document("a", 3, seed=1)
+    store.add(records, vectors)
+
+    # What a crash can leave behind: half-written folders and files, a
+    # segment written but never published, an index saved but never published
+    os.makedirs(tmp_path / "seg-000098.tmp")
+    os.makedirs(tmp_path / "seg-000099")
+    (tmp_path / "index-000097.faiss").write_bytes(b"not an index")
+    (tmp_path / f"{MANIFEST_NAME}.tmp").write_text("{")
+    (tmp_path / "tomb-000096.i64").write_bytes(b"")
+
+    reopened = open_store(tmp_path)
+    names = set(os.listdir(tmp_path))
+    for leftover in ("seg-000098.tmp", "seg-000099", "index-000097.faiss", f"{MANIFEST_NAME}.tmp", "tomb-000096.i64"):
+        assert leftover not in names
+    assert reopened.count == 3
+    assert top_text(reopened, vectors[1]) == "a chunk 1"
+
+
+def test_segment_written_but_not_published_is_ignored(tmp_path):
+    store = open_store(tmp_path)
+    records_a, vectors_a = make_document("a", 3, seed=1)
+    store.add(records_a, vectors_a)
+
+    # Crash between writing a segment and publishing the manifest
+    records_b, vectors_b = make_document("b", 2, seed=2)
+    name = store._next_name("seg")
+    records_b = [dict(record, id=3 + i) for i, record in enumerate(records_b)]
+    store._write_part(name, records_b, np.arange(3, 5), vectors_b, DIM)
+
+    reopened = open_store(tmp_path)
+    assert reopened.count == 3
+    assert "b" not in reopened.doc_chunks
+    assert name not in os.listdir(tmp_path)
+
+    # The next add reuses the IDs the lost segment had
+    assert reopened.add(records_b, vectors_b) == [3, 4]
+
+
+def test_second_store_on_the_same_folder_catches_up(tmp_path):
+    writer = open_store(tmp_path)
+    reader = open_store(tmp_path)
+
+    records_a, vectors_a = make_document("a", 3, seed=1)
+    writer.add(records_a, vectors_a)
+    assert top_text(reader, vectors_a[2]) == "a chunk 2"
+
+    # Writes from both sides get distinct IDs
+    records_b, vectors_b = make_document("b", 2, seed=2)
+    assert reader.add(records_b, vectors_b) == [3, 4]
+    writer.delete_document("a")
+    assert top_text(reader, vectors_a[2]).startswith("b chunk")
+    assert reader.count == 2
+    assert top_text(writer, vectors_b[1]) == "b chunk 1"
@@ -82,6 +82,17 @@ function App() {
     }
   };
 
+  const waitForIngestion = async (statusUrl: string) => {
+    while (true) {
+      const response = await fetch(`https://drivequery-backend.onrender.com${statusUrl}`);
+      const job = await response.json();
+      if (!response.ok || job.status === 'completed' || job.status === 'failed') {
+        return job;
+      }
+      await new Promise(resolve => setTimeout(resolve, 1000));
+    }
+  };
+
   const handleFileUpload = async (event: React.ChangeEvent<HTMLInputElement>) => {
     const file = event.target.files?.[0];
     if (!file) return;
@@ -114,10 +125,19 @@ function App() {
       }
       
       if (response.ok && data) {
-        setMessages([...messages, {
-          type: 'system',
-          content: `✓ Upload successful — ${data.filename} added (${data.total_chars} characters, ${data.chunks || 0} chunks)`
-        }]);
+        // The backend processes the manual in the background - poll until it's done
+        const job = await waitForIngestion(data.status_url);
+        if (job.status === 'completed') {
+          setMessages([...messages, {
+            type: 'system',
+            content: `✓ Upload successful — ${job.filename} added (${job.result.total_chars} characters, ${job.result.chunks || 0} chunks)`
+          }]);
+        } else {
+          setMessages([...messages, {
+            type: 'error',
+            content: job.error || 'Unable to parse this file. Try uploading a PDF or DOCX of the manual.'
+          }]);
+        }
         fetchDocuments();
       } else {
         setMessages([...messages, {